@@ -1,8 +1,14 @@
-import requests
 import json
+import os
+import recorder
+import ratelimit
+from httpclient import client
+from deadline import HANDSHAKE
 
-def creatClientId(signId, courseId):
-    ws_url = "https://www.teachermate.com.cn/faye"
+FAYE_URL = "https://www.teachermate.com.cn/faye"
+
+def creatClientId(signId, courseId, deadline=None):
+    ws_url = os.getenv("FAYE_URL", FAYE_URL)
 
     post_data = [
     {
@@ -18,7 +24,8 @@ def creatClientId(signId, courseId):
         "id": "1"
     }
     ]
-    response = requests.post(ws_url, json=post_data,verify=True)
+    response = client.post(ws_url, json=post_data,verify=True,rate_class=ratelimit.HANDSHAKE,
+                           deadline=deadline,stage=HANDSHAKE)
     clientId = json.loads(response.text)[0]["clientId"]
     signId = signId
     f = [
@@ -38,7 +45,10 @@ def creatClientId(signId, courseId):
     "id": "3"
     }
     ]
-    requests.post(ws_url, json=f,verify=True)
+    client.post(ws_url, json=f,verify=True,rate_class=ratelimit.HANDSHAKE,
+                deadline=deadline,stage=HANDSHAKE)
+    if recorder.active:
+        recorder.active.write(recorder.HANDSHAKE, {"signId": signId, "courseId": courseId, "clientId": clientId}, signId)
     return clientId
 if __name__ == '__main__':
     signId = 3815546
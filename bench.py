@@ -0,0 +1,374 @@
+import argparse
+import asyncio
+import gc
+import json
+import math
+import os
+import platform
+import sys
+import time
+import logging
+from statistics import median
+from typing import Callable, Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json")
+SAMPLES = 25
+SAMPLE_TIME = 0.02  # 每个样本大约运行多久（秒），据此校准每个样本的调用次数
+ALPHA = 0.01  # 单侧显著性水平
+TOLERANCE = 0.20  # 中位数变慢不超过这个比例时不算回归（即使显著）
+
+QR_URL = "https://www.teachermate.com.cn/api/v1/sign/qr?signId=4711&courseId=9001&t=1700000000123&sig=0f3c9a1e"
+
+
+class Case:
+    """一个基准用例：setup返回被测函数，被测函数执行一次操作
+
+    被测函数可带per_call属性（每次调用包含的操作数）和teardown属性（测完后释放资源）。
+    """
+
+    def __init__(self, name: str, setup: Callable[[], Callable[[int], None]],
+                 tolerance: float = TOLERANCE):
+        self.name = name
+        self.setup = setup
+        self.tolerance = tolerance
+
+
+def _client():
+    from getSocket import TeacherMateWebSocketClient
+    client = TeacherMateWebSocketClient(4711, qr_callback=lambda url: None,
+                                        status_callback=lambda status: None)
+    client.client_id = "bench0123456789abcdef"
+    return client
+
+
+def _qr_frame(i: int) -> str:
+    return json.dumps([{"channel": "/sign/4711", "data": {"type": 1, "qrUrl": f"{QR_URL}&n={i}"},
+                        "id": str(i)}])
+
+
+class _FakeWebSocket:
+    """按顺序产出预先准备好的帧"""
+
+    def __init__(self, frames: List[str]):
+        self.frames = frames
+
+    async def __aiter__(self):
+        for frame in self.frames:
+            yield frame
+
+
+def _setup_receive_handler() -> Callable[[int], None]:
+    """receive_handler: 解码并分发一批帧（二维码数据和心跳回复各半）"""
+    loop = asyncio.new_event_loop()
+    client = _client()
+    frames = []
+    for i in range(64):
+        frames.append(_qr_frame(i))
+        frames.append(json.dumps([{"channel": "/meta/connect", "successful": True, "id": str(i),
+                                   "advice": {"reconnect": "retry", "interval": 0, "timeout": 0}}]))
+
+    def run(n: int) -> None:
+        for _ in range(n):
+            client.websocket = _FakeWebSocket(frames)
+            loop.run_until_complete(client.receive_handler())
+
+    run.per_call = len(frames)
+    run.teardown = loop.close
+    return run
+
+
+def _setup_handle_qr_message() -> Callable[[int], None]:
+    """_handle_qr_message: 单个二维码帧的JSON解码和回调分发"""
+    loop = asyncio.new_event_loop()
+    client = _client()
+    frames = [_qr_frame(i) for i in range(64)]
+
+    async def batch(n: int) -> None:
+        for i in range(n):
+            await client._handle_qr_message(frames[i & 63])
+
+    def run(n: int) -> None:
+        loop.run_until_complete(batch(n))
+
+    run.teardown = loop.close
+    return run
+
+
+def _setup_heartbeat() -> Callable[[int], None]:
+    """心跳消息构造（含RTT记录）"""
+    client = _client()
+
+    def run(n: int) -> None:
+        for i in range(n):
+            message_id = str(i)
+            client._heartbeat_message(message_id)
+            client.link.on_sent(message_id)
+            client.link.pending.pop(message_id)
+
+    return run
+
+
+def _active_signs_payload() -> List[Dict[str, Any]]:
+    payload = []
+    for i in range(12):
+        payload.append({"courseId": 9000 + i, "signId": 4700 + i, "isQR": i % 3 != 0, "isGPS": i % 4 == 0,
+                        "name": f"课程{i}", "startYear": 2024, "term": "第一学期", "cover": "https://x.invalid/c.png",
+                        "signTime": 1700000000 + i, "studentCount": 80 + i})
+    payload.append({"courseId": 1, "signId": 2})  # 字段不完整的项被过滤掉
+    return payload
+
+
+def _setup_filter_signs() -> Callable[[int], None]:
+    """active_signs返回值过滤（wait_data/watch_signs每次轮询都会执行）"""
+    from engine import filter_signs
+    payload = _active_signs_payload()
+
+    def run(n: int) -> None:
+        for _ in range(n):
+            data = filter_signs(payload)
+            {item["signId"]: item for item in data if item.get("isQR")}
+
+    return run
+
+
+def _setup_get_status() -> Callable[[int], None]:
+    """Pipeline.get_status 加JSON序列化（每个/qr_code请求和每次推送）"""
+    import web
+    pipeline = web.Pipeline("bench-openid")
+    freshness = pipeline.engine.freshness
+    freshness.observe(4711, QR_URL, arrived_at=time.time() - 20)
+    freshness.observe(4711, QR_URL + "&n=1", arrived_at=time.time() - 10)
+    freshness.observe(4711, QR_URL + "&n=2")
+    pipeline.success = 1
+    pipeline.message = "成功获取二维码"
+    pipeline.result = "https://www.teachermate.com.cn/wechat-pro-ssr/student/sign?signId=4711&courseId=9001"
+    pipeline.result_sign_id = 4711
+    pipeline.result_source = QR_URL + "&n=2"
+
+    def run(n: int) -> None:
+        for _ in range(n):
+            json.dumps(pipeline.get_status())
+
+    return run
+
+
+def _setup_qr_matrix() -> Callable[[int], None]:
+    """二维码矩阵生成（与gui.generate_qr_bitmap相同的参数）"""
+    import qrcode
+    import qrimage
+
+    def run(n: int) -> None:
+        for i in range(n):
+            qr = qrcode.QRCode(version=qrimage.VERSION, error_correction=qrcode.constants.ERROR_CORRECT_M,
+                               box_size=qrimage.BOX_SIZE, border=qrimage.BORDER)
+            qr.add_data(f"{QR_URL}&n={i}")
+            qr.make(fit=True)
+
+    return run
+
+
+def _setup_qr_png() -> Callable[[int], None]:
+    """二维码位图渲染：矩阵加PNG编码（generate_qr_bitmap中转成wx.Bitmap之前的部分）"""
+    import qrimage
+
+    def run(n: int) -> None:
+        for i in range(n):
+            qrimage.render(f"{QR_URL}&n={i}", qrimage.DEFAULT_SIZE, "png", encoder="qrcode")
+
+    return run
+
+
+def _setup_qr_matrix_numpy() -> Callable[[int], None]:
+    """同样的矩阵用qrencode生成（8种掩码向量化打分）"""
+    import qrencode
+    import qrimage
+
+    def run(n: int) -> None:
+        for i in range(n):
+            qrencode.encode(f"{QR_URL}&n={i}", qrimage.VERSION)
+
+    return run
+
+
+def _setup_qr_png_numpy() -> Callable[[int], None]:
+    """qrencode矩阵加自带的PNG编码（不经过PIL）"""
+    import qrimage
+
+    def run(n: int) -> None:
+        for i in range(n):
+            qrimage.render(f"{QR_URL}&n={i}", qrimage.DEFAULT_SIZE, "png", encoder="numpy")
+
+    return run
+
+
+CASES = {case.name: case for case in (
+    Case("frame.receive_handler", _setup_receive_handler),
+    Case("frame.handle_qr_message", _setup_handle_qr_message),
+    Case("heartbeat.message", _setup_heartbeat),
+    Case("poll.filter_signs", _setup_filter_signs),
+    Case("status.get_status", _setup_get_status),
+    Case("qr.matrix", _setup_qr_matrix, tolerance=0.30),
+    Case("qr.render_png", _setup_qr_png, tolerance=0.30),
+    Case("qr.matrix_numpy", _setup_qr_matrix_numpy, tolerance=0.30),
+    Case("qr.render_png_numpy", _setup_qr_png_numpy, tolerance=0.30),
+)}
+
+
+def _time(func: Callable[[int], None], n: int) -> float:
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        func(n)
+        return time.perf_counter() - start
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def calibrate(case: Case, sample_time: float = SAMPLE_TIME) -> Tuple[Callable[[int], None], int, int]:
+    """准备用例并确定每个样本的调用次数，使一个样本大约运行sample_time"""
+    func = case.setup()
+    per_call = getattr(func, "per_call", 1)
+    n = 1
+    while True:
+        elapsed = _time(func, n)
+        if elapsed >= sample_time / 4 or n >= 1 << 20:
+            break
+        n *= 2
+    n = max(1, int(n * sample_time / max(elapsed, 1e-9)))
+    _time(func, n)  # 预热
+    return func, n, per_call
+
+
+def measure(cases: List[Case], samples: int = SAMPLES) -> Dict[str, List[float]]:
+    """返回每个用例各样本的单次操作耗时（秒）
+
+    各用例轮流取样而不是一个跑完再跑下一个，CPU频率和后台负载的漂移平摊到所有用例上。
+    """
+    prepared = {case.name: calibrate(case) for case in cases}
+    results: Dict[str, List[float]] = {case.name: [] for case in cases}
+    try:
+        for _ in range(samples):
+            for name, (func, n, per_call) in prepared.items():
+                results[name].append(_time(func, n) / (n * per_call))
+    finally:
+        for func, _, _ in prepared.values():
+            teardown = getattr(func, "teardown", None)
+            if teardown is not None:
+                teardown()
+    return results
+
+
+def mann_whitney_greater(current: List[float], baseline: List[float]) -> float:
+    """Mann-Whitney U检验（正态近似，含并列修正），返回"当前比基线慢"的单侧p值"""
+    n1, n2 = len(current), len(baseline)
+    combined = sorted([(value, 0) for value in current] + [(value, 1) for value in baseline])
+    ranks = [0.0] * len(combined)
+    ties = 0.0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        for k in range(i, j + 1):
+            ranks[k] = (i + j) / 2 + 1
+        count = j - i + 1
+        ties += count ** 3 - count
+        i = j + 1
+    r1 = sum(rank for rank, (_, group) in zip(ranks, combined) if group == 0)
+    u1 = r1 - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    sigma = math.sqrt(n1 * n2 / 12 * ((n + 1) - ties / (n * (n - 1))))
+    if sigma == 0:
+        return 1.0
+    z = (u1 - n1 * n2 / 2 - 0.5) / sigma  # 连续性修正
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+
+def compare(current: List[float], baseline: List[float], tolerance: float) -> Tuple[float, float, bool]:
+    """返回(中位数比值, p值, 是否回归)：显著变慢且超过容忍比例才算回归"""
+    ratio = median(current) / median(baseline)
+    p = mann_whitney_greater(current, baseline)
+    return ratio, p, p < ALPHA and ratio > 1 + tolerance
+
+
+def machine() -> Dict[str, str]:
+    return {"python": platform.python_version(), "implementation": platform.python_implementation(),
+            "machine": platform.machine(), "system": platform.system()}
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path: str, results: Dict[str, List[float]]) -> None:
+    data = {"machine": machine(), "created_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "cases": {name: {"median_us": round(median(samples) * 1e6, 4),
+                             "samples": [round(value, 12) for value in samples]}
+                      for name, samples in results.items()}}
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, path)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="热路径微基准，与保存的基线比较，显著变慢时退出码为1")
+    parser.add_argument("cases", nargs="*", help=f"默认运行全部用例: {', '.join(CASES)}")
+    parser.add_argument("--save", action="store_true", help="把本次结果保存为新基线（只更新运行的用例）")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.cases if name not in CASES]
+    if unknown:
+        parser.error(f"未知用例: {', '.join(unknown)}")
+
+    # 只测量代码本身，不测日志输出
+    logging.disable(logging.CRITICAL)
+    import ratelimit
+    ratelimit.limiter.enabled = False
+
+    baseline = load_baseline(args.baseline)
+    if baseline and baseline.get("machine") != machine():
+        print(f"注意: 基线来自不同的环境 {baseline.get('machine')}，比较结果仅供参考")
+
+    results = measure([CASES[name] for name in args.cases or list(CASES)], args.samples)
+    regressions = []
+    for name, samples in results.items():
+        case = CASES[name]
+        line = f"{name:26s} {median(samples) * 1e6:10.3f}us"
+        base = (baseline or {}).get("cases", {}).get(name)
+        if base and not args.save:
+            ratio, p, regressed = compare(samples, base["samples"], case.tolerance)
+            line += f"  基线 {base['median_us']:10.3f}us  x{ratio:.3f}  p={p:.4f}"
+            if regressed:
+                line += "  回归"
+                regressions.append(name)
+        elif not args.save:
+            line += "  (无基线)"
+        print(line)
+
+    if args.save or baseline is None:
+        if baseline is not None:
+            merged = {name: case["samples"] for name, case in baseline["cases"].items()}
+            merged.update(results)
+            results = merged
+        save_baseline(args.baseline, results)
+        print(f"基线已保存到 {args.baseline}")
+        return 0
+
+    if regressions:
+        print(f"显著变慢（p<{ALPHA} 且超过容忍比例）: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import asyncio
+import json
+import os
+import sys
+import time
+import logging
+from typing import Dict, Any, List
+from engine import SignEngine, LogSink
+import settings
+import loops
+import logsetup
+# 配置日志
+logsetup.setup_logging()
+logger = logging.getLogger(__name__)
+
+
+def main() -> None:
+    """命令行入口 - 无界面运行引擎，把二维码URL打印到终端
+
+    config.ini中配置了[accounts]时所有账号在同一个进程中运行，每行输出标明账号。
+    """
+    accounts = settings.get_accounts()
+    openid = next(iter(accounts.values()), None)
+    if not openid:
+        logger.error("未找到openid，请检查config.ini")
+        sys.exit(1)
+
+    engine = SignEngine(openid, watch="--watch" in sys.argv[1:], accounts=accounts)
+    engine.add_sink(LogSink(engine))
+    try:
+        loops.run(engine.run())
+    except KeyboardInterrupt:
+        logger.info("应用被用户中断")
+
+
+def _bench_child(accounts: int) -> None:
+    """测量用的子进程：在本地Faye替身上以监视模式运行accounts个账号"""
+    engine = SignEngine("bench0", watch=True,
+                        accounts={f"acc{i}": f"bench{i}" for i in range(accounts)})
+    engine.add_sink(LogSink(engine, stream=open(os.devnull, "w")))
+    loops.run(engine.run())
+
+
+def _proc_usage(pid: int) -> Dict[str, Any]:
+    """从/proc读取进程的常驻内存、线程数和socket数（仅Linux）"""
+    usage = {"rss_kb": 0, "threads": 0, "sockets": 0}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                usage["rss_kb"] = int(line.split()[1])
+            elif line.startswith("Threads:"):
+                usage["threads"] = int(line.split()[1])
+    for fd in os.listdir(f"/proc/{pid}/fd"):
+        try:
+            if os.readlink(f"/proc/{pid}/fd/{fd}").startswith("socket:"):
+                usage["sockets"] += 1
+        except OSError:
+            pass
+    return usage
+
+
+async def _measure_accounts(accounts: int, settle: float) -> None:
+    """同一门课的accounts个账号：一个进程运行全部账号 vs 每个账号一个进程"""
+    from fayestub import FayeStub
+
+    stub = FayeStub(poll_timeout=5.0)
+    await stub.start()
+    stub.get_routes["/active_signs"] = lambda: json.dumps(
+        [{"signId": 7001, "courseId": 9001, "isQR": 1, "isGPS": 0}])
+    env = dict(os.environ, ACTIVE_SIGNS_URL=f"http://{stub.host}:{stub.http_port}/active_signs",
+               FAYE_URL=stub.http_url, FAYE_WS_URL=stub.ws_url)
+
+    for mode, layout in (("一个进程", [accounts]), ("每账号一个进程", [1] * accounts)):
+        procs = [await asyncio.create_subprocess_exec(
+            sys.executable, os.path.abspath(__file__), "--bench-child", str(n), env=env,
+            stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.DEVNULL) for n in layout]
+        # 持续推送二维码，测量的是稳定运行时的占用
+        end = time.monotonic() + settle
+        n = 0
+        while time.monotonic() < end:
+            await stub.publish(7001, {"type": 1, "qrUrl": f"https://stub.invalid/qr?n={n}"})
+            n += 1
+            await asyncio.sleep(0.2)
+        usages: List[Dict[str, Any]] = [_proc_usage(proc.pid) for proc in procs]
+        for proc in procs:
+            proc.terminate()
+            await proc.wait()
+        print(f"{accounts}个账号 {mode:>8}: 进程 {len(procs)}, "
+              f"内存 {sum(u['rss_kb'] for u in usages) / 1024:.1f}MB, "
+              f"socket {sum(u['sockets'] for u in usages)}, "
+              f"线程 {sum(u['threads'] for u in usages)}")
+
+    await stub.stop()
+
+
+def _benchmark(accounts: int = 4, settle: float = 4.0) -> None:
+    """比较多账号共用一个进程和每个账号一个进程的内存与socket占用（不含wx，wx运行时每个进程另有开销）"""
+    logging.getLogger().setLevel(logging.WARNING)
+    asyncio.run(_measure_accounts(accounts, settle))
+
+
+if __name__ == "__main__":
+    if "--bench-child" in sys.argv[1:]:
+        logging.getLogger().setLevel(logging.WARNING)
+        _bench_child(int(sys.argv[sys.argv.index("--bench-child") + 1]))
+    elif "--bench-accounts" in sys.argv[1:]:
+        _benchmark(int(sys.argv[sys.argv.index("--bench-accounts") + 1]))
+    else:
+        main()
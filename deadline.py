@@ -0,0 +1,98 @@
+import threading
+import time
+from typing import Optional, Dict, Any
+
+# 各阶段的预算（秒）
+POLL_BUDGET = 10.0      # 一次active_signs轮询
+SETUP_BUDGET = 20.0     # 单个签到从握手到订阅完成（含握手重试）
+CONNECT_BUDGET = 10.0   # 断线重连时建立连接并订阅
+MIN_TIMEOUT = 0.05      # 剩余预算小于这个值时直接视为耗尽，不再发起请求
+
+# 阶段名称
+POLL = "poll"
+HANDSHAKE = "handshake"
+CONNECT = "connect"
+SUBSCRIBE = "subscribe"
+HEARTBEAT = "heartbeat"
+REDIRECT = "redirect"
+DELIVERY = "delivery"
+
+
+class DeadlineExceeded(TimeoutError):
+    """某个阶段开始或进行时预算已经用完（TimeoutError的子类，原有的超时处理照常生效）"""
+
+    def __init__(self, stage: str, name: str = ""):
+        super().__init__(f"{name + ' ' if name else ''}{stage}阶段超出截止时间")
+        self.stage = stage
+        self.name = name
+
+
+class DeadlineStats:
+    """按阶段统计预算检查次数和耗尽次数"""
+
+    def __init__(self):
+        self.checked: Dict[str, int] = {}
+        self.exhausted: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, exhausted: bool) -> None:
+        with self._lock:
+            self.checked[stage] = self.checked.get(stage, 0) + 1
+            if exhausted:
+                self.exhausted[stage] = self.exhausted.get(stage, 0) + 1
+
+    def exhaust(self, stage: str) -> None:
+        """已经检查过的阶段在进行中耗尽预算"""
+        with self._lock:
+            self.exhausted[stage] = self.exhausted.get(stage, 0) + 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {stage: {"checked": count, "exhausted": self.exhausted.get(stage, 0)}
+                    for stage, count in self.checked.items()}
+
+
+# 进程内共享的统计
+stats = DeadlineStats()
+
+
+class Deadline:
+    """端到端截止时间 - 每个签到或二维码事件创建一个，沿着各阶段传递
+
+    各阶段用剩余预算作为超时，预算用完时放弃（结果反正已经过期），并按阶段计数。
+    """
+    __slots__ = ("expires_at", "name")
+
+    def __init__(self, budget: float, name: str = ""):
+        self.expires_at = time.monotonic() + budget
+        self.name = name
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+    def expired(self) -> bool:
+        return self.remaining() < MIN_TIMEOUT
+
+    def check(self, stage: str) -> None:
+        """阶段开始前检查预算，已耗尽时抛出DeadlineExceeded"""
+        exhausted = self.expired()
+        stats.record(stage, exhausted)
+        if exhausted:
+            raise DeadlineExceeded(stage, self.name)
+
+    def timeout(self, stage: str, cap: Optional[float] = None) -> float:
+        """本阶段可用的超时：剩余预算，不超过cap；预算已耗尽时抛出DeadlineExceeded"""
+        self.check(stage)
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    def exceeded(self, stage: str) -> DeadlineExceeded:
+        """阶段进行中超时（例如wait_for超时）时记为耗尽，返回要抛出的异常"""
+        stats.exhaust(stage)
+        return DeadlineExceeded(stage, self.name)
+
+    def child(self, budget: float, name: Optional[str] = None) -> "Deadline":
+        """子阶段的截止时间，不会晚于本截止时间"""
+        deadline = Deadline(budget, self.name if name is None else name)
+        deadline.expires_at = min(deadline.expires_at, self.expires_at)
+        return deadline
@@ -0,0 +1,591 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+import logging
+from typing import Optional, List, Dict, Any, Union, Set, Callable, Awaitable
+from getdata import getData
+from getSocket import TeacherMateWebSocketClient
+from shutdown import ShutdownCoordinator
+from history import EventHistory
+from freshness import QRFreshness
+from deadline import Deadline, DeadlineExceeded, POLL_BUDGET, SETUP_BUDGET, HANDSHAKE
+from events import (QREvent, CrowdedEvent, SignClosedEvent, ReconnectEvent, SignsFoundEvent,
+                    StatusEvent, ErrorEvent, EngineStoppedEvent, EngineEvent, Sink)
+from hub import BroadcastHub
+import ad
+
+logger = logging.getLogger(__name__)
+
+SIGN_KEYS = ("courseId", "signId", "isQR", "isGPS")
+DEFAULT_ACCOUNT = "default"
+
+
+def filter_signs(data: Any) -> List[Dict[str, Any]]:
+    """从active_signs返回值中提取字段完整的签到项"""
+    result = []
+    if not isinstance(data, list):
+        return result
+    for item in data:
+        if all(key in item for key in SIGN_KEYS):
+            result.append({key: item[key] for key in SIGN_KEYS})
+    return result
+
+
+class SignEngine:
+    """签到引擎 - 统一负责轮询、Faye会话和生命周期，并把事件发布给各输出端"""
+
+    def __init__(self, openid: str, poll_interval: float = 1.0,
+                 max_polls: Optional[int] = None, sign_timeout: Optional[float] = None,
+                 shutdown_timeout: float = 3.0, history_size: int = 1024, watch: bool = False,
+                 idle_timeout: Optional[float] = 120.0, accounts: Optional[Dict[str, str]] = None):
+        # 账号名 -> openid。多个账号共用一个引擎：各自轮询active_signs，
+        # 同一个签到（同一门课）只建立一个Faye连接，事件按sign_accounts分给各账号
+        self.accounts: Dict[str, str] = dict(accounts) if accounts else {DEFAULT_ACCOUNT: openid}
+        self.sign_accounts: Dict[int, Set[str]] = {}
+        self._account_signs: Dict[str, List[Dict[str, Any]]] = {}  # 各账号最近一次成功轮询的结果
+        self._account_errors: Dict[str, str] = {}
+        # 持续监视模式：一直轮询，只为新出现的签到建立订阅，消失的签到关闭订阅
+        self.watch = watch
+        self.poll_interval = poll_interval
+        self.max_polls = max_polls
+        self.sign_timeout = sign_timeout
+        self.shutdown_timeout = shutdown_timeout
+        # 签到超过这个时间没有任何数据消息（二维码/拥挤/关闭）就关闭它的连接
+        self.idle_timeout = idle_timeout
+        self.handshake_attempts = 3
+        self.handshake_retry_delay = 1.0
+        self.sinks: List[Sink] = []
+        # 广播中心：一个上游订阅扇出给多个消费者（浏览器标签页等）
+        self.hub = BroadcastHub()
+        self.sinks.append(self.hub)
+        # 最近事件的环形缓冲区，用于排查问题
+        self.history = EventHistory(history_size)
+        self.sinks.append(self.history)
+        # 二维码到达时间和轮换间隔
+        self.freshness = QRFreshness()
+        self.clients: Dict[int, TeacherMateWebSocketClient] = {}
+        self.tasks: Dict[int, asyncio.Task] = {}
+        # 已收到关闭消息（type==2）但仍在active_signs中的签到，不重复订阅
+        self.closed_signs: Set[int] = set()
+        # 因长时间没有消息被回收、但仍在active_signs中的签到，监视模式下同样不重复订阅
+        self.idle_signs: Set[int] = set()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.is_running = False
+        self.is_shutting_down = False
+        self.last_error: Optional[ErrorEvent] = None
+        self.shutdown_report: Dict[str, Dict[str, Any]] = {}
+        self._stop_event: Optional[asyncio.Event] = None
+
+    def add_sink(self, sink: Sink) -> None:
+        """注册输出端"""
+        if sink not in self.sinks:
+            self.sinks.append(sink)
+
+    def remove_sink(self, sink: Sink) -> None:
+        """移除输出端"""
+        if sink in self.sinks:
+            self.sinks.remove(sink)
+
+    def publish(self, event: EngineEvent) -> None:
+        """把事件分发给所有输出端，单个输出端出错不影响其他输出端"""
+        if isinstance(event, ErrorEvent):
+            self.last_error = event
+        elif isinstance(event, QREvent):
+            if not self.freshness.observe(event.sign_id, event.url, event.timestamp):
+                # 重复推送的同一个码，不再分发
+                return
+            # 解析、推送等后续阶段都以这个码的剩余有效期为预算
+            event.deadline = Deadline(self.freshness.budget(event.sign_id), f"qr:{event.sign_id}")
+        for sink in list(self.sinks):
+            try:
+                sink.handle(event)
+            except Exception as e:
+                logger.error(f"输出端处理事件失败 {type(sink).__name__}: {e}")
+
+    @property
+    def openid(self) -> str:
+        """第一个账号的openid（单账号时即唯一的openid）"""
+        return next(iter(self.accounts.values()))
+
+    def _call_in_loop(self, func: Callable[..., None], *args: Any) -> None:
+        """在引擎的事件循环线程中执行func - 配置热加载回调在ConfigWatcher线程中调用
+
+        轮询和连接任务在循环线程中读写账号和签到索引，从其他线程直接修改会与之交错。
+        引擎还没运行或已经停止时没有并发，直接执行。
+        """
+        loop = self.loop
+        if loop is None or loop.is_closed() or not loop.is_running():
+            func(*args)
+            return
+        try:
+            if asyncio.get_running_loop() is loop:
+                func(*args)
+                return
+        except RuntimeError:
+            pass
+        try:
+            loop.call_soon_threadsafe(func, *args)
+        except RuntimeError:
+            # 事件循环恰好已经关闭
+            func(*args)
+
+    def set_openid(self, openid: str) -> None:
+        """热更新openid - 下一次轮询即生效，已建立的连接不受影响；可以从任意线程调用"""
+        self._call_in_loop(self._apply_openid, openid)
+
+    def _apply_openid(self, openid: str) -> None:
+        if openid and openid != self.openid:
+            accounts = dict(self.accounts)
+            accounts[next(iter(accounts))] = openid
+            self.accounts = accounts
+            logger.info("openid已更新，下一次轮询生效")
+
+    def set_accounts(self, accounts: Dict[str, str]) -> None:
+        """热更新账号列表 - 下一次轮询即生效；移除的账号不再分到事件；可以从任意线程调用"""
+        self._call_in_loop(self._apply_accounts, dict(accounts))
+
+    def _apply_accounts(self, accounts: Dict[str, str]) -> None:
+        if not accounts or accounts == self.accounts:
+            return
+        self.accounts = accounts
+        for name in list(self._account_signs):
+            if name not in self.accounts:
+                del self._account_signs[name]
+        self._account_errors = {name: error for name, error in self._account_errors.items()
+                                if name in self.accounts}
+        self._index_accounts()
+        logger.info(f"账号列表已更新: {', '.join(self.accounts)}，下一次轮询生效")
+
+    def accounts_for(self, sign_id: int) -> List[str]:
+        """哪些账号的active_signs中有这个签到"""
+        if len(self.accounts) == 1:
+            return list(self.accounts)
+        return sorted(self.sign_accounts.get(sign_id, ()))
+
+    def _index_accounts(self) -> None:
+        sign_accounts: Dict[int, Set[str]] = {}
+        for name, items in self._account_signs.items():
+            for item in items:
+                sign_accounts.setdefault(item["signId"], set()).add(name)
+        # 已从列表中消失但连接还没关闭的签到，保留原来的账号，关闭事件仍能分到账号
+        for sign_id in self.tasks:
+            if sign_id not in sign_accounts and sign_id in self.sign_accounts:
+                sign_accounts[sign_id] = self.sign_accounts[sign_id]
+        self.sign_accounts = sign_accounts
+
+    def request_shutdown(self) -> None:
+        """请求停止引擎 - 可以从任意线程调用"""
+        if self.loop is None or self.loop.is_closed() or self._stop_event is None:
+            self.is_shutting_down = True
+            return
+        try:
+            self.loop.call_soon_threadsafe(self._stop_event.set)
+        except RuntimeError:
+            # 事件循环已经关闭
+            self.is_shutting_down = True
+
+    @property
+    def stop_requested(self) -> bool:
+        return self.is_shutting_down or (self._stop_event is not None and self._stop_event.is_set())
+
+    async def _poll_once(self) -> Union[List[Dict[str, Any]], str, None]:
+        """轮询一次active_signs，返回签到列表、错误信息或None（请求失败/停止）
+
+        多个账号时并发轮询，返回所有账号签到的并集；单个账号出错只提示该账号，
+        并沿用它上一次的签到列表，其他账号不受影响。
+        """
+        if len(self.accounts) == 1:
+            name, openid = next(iter(self.accounts.items()))
+            data = await self._poll_account(openid)
+            if isinstance(data, list):
+                self._account_signs = {name: data}
+                self._index_accounts()
+            return data
+
+        names = list(self.accounts)
+        results = await asyncio.gather(*(self._poll_account(self.accounts[name]) for name in names))
+        polled = False
+        for name, data in zip(names, results):
+            if isinstance(data, str):
+                if self._account_errors.get(name) != data:
+                    logger.error(f"账号 {name} 获取数据时发生错误: {data}")
+                    self.publish(ErrorEvent(f"账号 {name} 获取数据失败", data))
+                    self._account_errors[name] = data
+            elif data is not None:
+                self._account_errors.pop(name, None)
+                self._account_signs[name] = data
+                polled = True
+        if not polled:
+            return None
+        self._index_accounts()
+        merged: Dict[int, Dict[str, Any]] = {}
+        for items in self._account_signs.values():
+            for item in items:
+                merged.setdefault(item["signId"], item)
+        return list(merged.values())
+
+    async def _poll_account(self, openid: str) -> Union[List[Dict[str, Any]], str, None]:
+        """用一个openid轮询一次active_signs"""
+        loop = asyncio.get_running_loop()
+        deadline = Deadline(POLL_BUDGET, "poll")
+        try:
+            # getData是同步请求，放到线程池中避免阻塞事件循环；
+            # 同时等待停止信号，active_signs响应很慢时也能立即退出
+            fetch = loop.run_in_executor(None, getData, openid, deadline)
+            stop = asyncio.ensure_future(self._stop_event.wait())
+            try:
+                await asyncio.wait([fetch, stop], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                stop.cancel()
+            if not fetch.done():
+                return None
+            data = fetch.result()
+            logger.debug("获取到数据: %s", data)
+
+            if isinstance(data, dict):
+                return data.get("message", "未知错误")
+            return filter_signs(data)
+
+        except DeadlineExceeded as e:
+            logger.warning(f"获取数据超时: {e}")
+            return None
+        except Exception as e:
+            logger.error(f"获取数据失败: {e}")
+            return None
+
+    async def _sleep_or_stop(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._stop_event.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+
+    async def wait_data(self) -> Union[List[Dict[str, Any]], str, None]:
+        """轮询active_signs，返回签到列表、错误信息或None（超时/停止）"""
+        poll_count = 0
+
+        while not self.stop_requested and (self.max_polls is None or poll_count < self.max_polls):
+            data = await self._poll_once()
+            if isinstance(data, str) or data:
+                return data
+
+            poll_count += 1
+            await self._sleep_or_stop(self.poll_interval)
+
+        return None
+
+    async def watch_signs(self) -> None:
+        """持续监视：每次轮询与已知签到比较，新的二维码签到建立订阅，消失的关闭订阅"""
+        last_error: Optional[str] = None
+        waiting_notified = False
+
+        while not self.stop_requested:
+            data = await self._poll_once()
+
+            if isinstance(data, str):
+                # openid失效等错误：同一条只提示一次，继续轮询（修改config.ini后自动恢复）
+                if data != last_error:
+                    logger.error(f"获取数据时发生错误: {data}")
+                    self.publish(ErrorEvent("获取数据失败", data))
+                    last_error = data
+            elif data is not None:
+                last_error = None
+                current = {item["signId"]: item for item in data if item.get("isQR")}
+                # 已关闭或被回收的签到从列表中消失后才允许再次订阅
+                self.closed_signs &= current.keys()
+                self.idle_signs &= current.keys()
+
+                new_ids = [sign_id for sign_id in current
+                           if sign_id not in self.tasks and sign_id not in self.closed_signs
+                           and sign_id not in self.idle_signs]
+                if new_ids:
+                    self.publish(SignsFoundEvent([current[sign_id] for sign_id in new_ids]))
+                    for sign_id in new_ids:
+                        self.start_sign(sign_id, current[sign_id]["courseId"])
+                    waiting_notified = False
+
+                for sign_id in [sign_id for sign_id in self.tasks if sign_id not in current]:
+                    logger.info(f"签到已从active_signs中消失，关闭订阅: {sign_id}")
+                    await self.stop_sign(sign_id)
+
+                if not self.tasks and not waiting_notified:
+                    self.publish(StatusEvent("没有进行中的二维码签到，继续等待"))
+                    waiting_notified = True
+
+            await self._sleep_or_stop(self.poll_interval)
+
+    async def stop_sign(self, sign_id: int) -> None:
+        """关闭单个签到的订阅（限时优雅关闭，超时则强制中止）；任务结束时发布SignClosedEvent"""
+        # 不用wait_for：关闭完成与调用方被取消同时发生时，wait_for会吞掉取消
+        close = asyncio.ensure_future(self._close_sign(sign_id))
+        done, _ = await asyncio.wait([close], timeout=self.shutdown_timeout)
+        if not done:
+            close.cancel()
+            self._abort_sign(sign_id)
+
+    async def run(self, shutdown: Optional[Callable[[], Awaitable[Any]]] = None) -> None:
+        """运行一次完整的签到流程：轮询 -> 订阅 -> 等待结束 -> 关闭
+
+        shutdown为结束时代替self.shutdown()调用的关闭协程工厂：外层还有其他组件要关闭时
+        传入外层的关闭流程，引擎和这些组件在同一个截止时间内并行关闭。
+        """
+        self.loop = asyncio.get_running_loop()
+        self._stop_event = asyncio.Event()
+        if self.is_shutting_down:
+            self._stop_event.set()
+        self.is_running = True
+        reason = "finished"
+        reaper = asyncio.create_task(self._reap_idle()) if self.idle_timeout else None
+
+        try:
+            if self.watch:
+                await self.watch_signs()
+                reason = "stopped"
+                return
+
+            data = await self.wait_data()
+
+            if isinstance(data, str):
+                logger.error(f"获取数据时发生错误: {data}")
+                self.publish(ErrorEvent("获取数据失败", data))
+                reason = "error"
+                return
+
+            if not data:
+                logger.info("未找到有效数据或应用正在关闭")
+                self.publish(StatusEvent("未找到有效数据"))
+                reason = "no_data"
+                return
+
+            self.publish(SignsFoundEvent(data))
+            for item in data:
+                if item.get("isQR"):  # 只处理二维码签到
+                    self.start_sign(item["signId"], item["courseId"])
+
+            if not self.tasks:
+                logger.info("没有需要处理的二维码签到任务")
+                self.publish(StatusEvent("没有需要处理的二维码签到任务"))
+                reason = "no_qr"
+                return
+
+            stop_task = asyncio.create_task(self._stop_event.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    [stop_task] + list(self.tasks.values()),
+                    return_when=asyncio.FIRST_COMPLETED,
+                    timeout=self.sign_timeout
+                )
+            finally:
+                stop_task.cancel()
+
+            if not done:
+                logger.warning("处理签到任务超时")
+                self.publish(StatusEvent("处理超时，请重试"))
+                reason = "timeout"
+            elif stop_task in done:
+                reason = "stopped"
+
+        except Exception as e:
+            logger.error(f"引擎运行失败: {e}")
+            self.publish(ErrorEvent("运行错误", f"应用运行出错: {str(e)}"))
+            reason = "error"
+        finally:
+            if reaper is not None:
+                reaper.cancel()
+                await asyncio.gather(reaper, return_exceptions=True)
+            await (shutdown or self.shutdown)()
+            self.is_running = False
+            self.publish(EngineStoppedEvent(reason))
+
+    def start_sign(self, sign_id: int, course_id: int) -> Optional[asyncio.Task]:
+        """为单个签到创建Faye会话任务"""
+        if sign_id in self.tasks or self.stop_requested:
+            return None
+        try:
+            task = asyncio.create_task(self._run_sign(sign_id, course_id))
+            self.tasks[sign_id] = task
+            task.add_done_callback(lambda t: self._forget_sign(sign_id, t))
+            logger.info(f"创建签到任务: sign_id={sign_id}")
+            return task
+        except Exception as e:
+            logger.error(f"创建签到任务失败 {sign_id}: {e}")
+            return None
+
+    async def _run_sign(self, sign_id: int, course_id: int) -> None:
+        """运行单个签到的握手和WebSocket客户端；握手、连接和订阅共用一个截止时间"""
+        deadline = Deadline(SETUP_BUDGET, f"sign:{sign_id}")
+        try:
+            client_id = await self._handshake(sign_id, course_id, deadline)
+            if self.stop_requested:
+                return
+
+            client = TeacherMateWebSocketClient(
+                sign_id=sign_id,
+                qr_callback=lambda url: self.publish(QREvent(sign_id, url)),
+                status_callback=lambda qr_type: self._on_status(sign_id, qr_type),
+                reconnect_callback=lambda transport, attempt: self.publish(
+                    ReconnectEvent(sign_id, transport, attempt))
+            )
+            client.client_id = client_id
+            client.setup_deadline = deadline
+            self.clients[sign_id] = client
+
+            logger.info(f"启动WebSocket客户端 for sign_id: {sign_id}")
+            await client.start()
+
+        except asyncio.CancelledError:
+            logger.info(f"WebSocket客户端任务被取消: {sign_id}")
+        except DeadlineExceeded as e:
+            logger.error(f"签到建立超时，放弃 {sign_id}: {e}")
+        except Exception as e:
+            logger.error(f"WebSocket客户端运行失败 {sign_id}: {e}")
+
+    async def _handshake(self, sign_id: int, course_id: int, deadline: Deadline) -> str:
+        """creatClientId握手，失败时在截止时间内重试，最多handshake_attempts次"""
+        loop = asyncio.get_running_loop()
+        for attempt in range(1, self.handshake_attempts + 1):
+            try:
+                return await loop.run_in_executor(None, ad.creatClientId, sign_id, course_id, deadline)
+            except DeadlineExceeded:
+                raise
+            except Exception as e:
+                if attempt == self.handshake_attempts or self.stop_requested:
+                    raise
+                if deadline.remaining() < self.handshake_retry_delay:
+                    # 等待重试时预算就会用完，不再重试
+                    raise deadline.exceeded(HANDSHAKE) from e
+                logger.warning(f"握手失败，{self.handshake_retry_delay}秒后重试 "
+                               f"({attempt}/{self.handshake_attempts}): {e}")
+                self.publish(ReconnectEvent(sign_id, "handshake", attempt))
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=self.handshake_retry_delay)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _reap_idle(self) -> None:
+        """定期关闭长时间没有数据消息的签到，释放其连接、任务和缓存"""
+        interval = min(5.0, self.idle_timeout / 4)
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            for sign_id, client in list(self.clients.items()):
+                if now - client.last_activity > self.idle_timeout and not client.is_shutting_down:
+                    logger.info(f"签到 {sign_id} 超过{self.idle_timeout:.0f}秒没有消息，关闭连接")
+                    self.idle_signs.add(sign_id)
+                    await self.stop_sign(sign_id)
+
+    def resources(self) -> Dict[str, Any]:
+        """当前占用的资源数量，用于发现长期运行时泄漏的连接和任务"""
+        websockets_open = sum(1 for client in list(self.clients.values()) if client.websocket is not None)
+        try:
+            loop_tasks = len(asyncio.all_tasks(self.loop)) if self.loop and not self.loop.is_closed() else 0
+        except RuntimeError:
+            loop_tasks = None
+        try:
+            open_fds = len(os.listdir("/proc/self/fd"))
+        except OSError:
+            open_fds = None
+        return {
+            "accounts": len(self.accounts),
+            "signs": len(self.tasks),
+            "clients": len(self.clients),
+            "websockets": websockets_open,
+            "loop_tasks": loop_tasks,
+            "threads": threading.active_count(),
+            "open_fds": open_fds,
+            "freshness_entries": len(self.freshness.states),
+            "hub_latest": len(self.hub.latest),
+        }
+
+    def _forget_sign(self, sign_id: int, task: asyncio.Task) -> None:
+        """任务结束后释放对客户端、任务和缓存的引用，并通知输出端该签到已结束"""
+        if self.tasks.get(sign_id) is task:
+            del self.tasks[sign_id]
+        self.clients.pop(sign_id, None)
+        self.freshness.forget(sign_id)
+        # type==2已经发布过关闭事件；整体关闭时由EngineStoppedEvent统一通知
+        if sign_id not in self.closed_signs and not self.is_shutting_down:
+            self.publish(SignClosedEvent(sign_id))
+        if not any(item["signId"] == sign_id for items in self._account_signs.values() for item in items):
+            self.sign_accounts.pop(sign_id, None)
+
+    def link_stats(self) -> Dict[int, Dict[str, Any]]:
+        """各签到连接的传输方式和心跳RTT统计"""
+        return {sign_id: dict(client.link.status(), transport=client.transport)
+                for sign_id, client in list(self.clients.items())}
+
+    def _on_status(self, sign_id: int, qr_type: int) -> None:
+        """把客户端的非二维码消息转换成事件"""
+        if qr_type == 3:
+            self.publish(CrowdedEvent(sign_id))
+        elif qr_type == 2:
+            self.closed_signs.add(sign_id)
+            self.publish(SignClosedEvent(sign_id))
+
+    async def shutdown(self, deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """在一个总截止时间内并行关闭所有签到的连接和任务，返回各组件耗时"""
+        if self.is_shutting_down:
+            return self.shutdown_report
+        self.is_shutting_down = True
+        if self._stop_event is not None:
+            self._stop_event.set()
+        logger.info("开始关闭引擎...")
+
+        coordinator = ShutdownCoordinator(self.shutdown_timeout if deadline is None else deadline)
+        for sign_id in list(self.tasks):
+            coordinator.add(f"sign:{sign_id}",
+                            functools.partial(self._close_sign, sign_id),
+                            functools.partial(self._abort_sign, sign_id))
+        if coordinator.components:
+            logger.info(f"正在关闭 {len(coordinator.components)} 个签到连接...")
+        self.shutdown_report = await coordinator.run()
+        logger.info("引擎关闭完成")
+        return self.shutdown_report
+
+    async def _close_sign(self, sign_id: int) -> None:
+        """优雅关闭单个签到：先关闭WebSocket，再结束其任务"""
+        client = self.clients.get(sign_id)
+        if client and not client.is_shutting_down:
+            await client.graceful_shutdown()
+        task = self.tasks.get(sign_id)
+        if task and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _abort_sign(self, sign_id: int) -> None:
+        """超过截止时间后强制中止单个签到"""
+        client = self.clients.get(sign_id)
+        if client:
+            client.abort()
+        task = self.tasks.get(sign_id)
+        if task and not task.done():
+            task.cancel()
+
+
+class LogSink(Sink):
+    """命令行输出端 - 把事件打印到标准输出；多账号时每行标明是哪些账号的签到"""
+
+    def __init__(self, engine: Optional[SignEngine] = None, stream=None):
+        self.engine = engine
+        self.stream = stream
+
+    def _prefix(self, sign_id: int) -> str:
+        if self.engine is None or len(self.engine.accounts) == 1:
+            return f"[{sign_id}]"
+        return f"[{','.join(self.engine.accounts_for(sign_id)) or '?'}][{sign_id}]"
+
+    def _print(self, text: str) -> None:
+        print(text, file=self.stream, flush=True)
+
+    def handle(self, event: EngineEvent) -> None:
+        if isinstance(event, QREvent):
+            self._print(f"{self._prefix(event.sign_id)} 二维码: {event.url}")
+        elif isinstance(event, CrowdedEvent):
+            self._print(f"{self._prefix(event.sign_id)} qr_url为空，前方拥挤")
+        elif isinstance(event, SignClosedEvent):
+            self._print(f"{self._prefix(event.sign_id)} 签到已关闭")
+        elif isinstance(event, ErrorEvent):
+            self._print(f"{event.title}: {event.message}")
+        elif isinstance(event, StatusEvent):
+            self._print(event.message)
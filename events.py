@@ -0,0 +1,84 @@
+import time
+from dataclasses import dataclass, field
+from typing import Optional, List, Dict, Any, Union
+from deadline import Deadline
+
+
+@dataclass
+class QREvent:
+    """获取到新的二维码URL；deadline为该码的剩余有效期，由引擎在分发前设置"""
+    sign_id: int
+    url: str
+    timestamp: float = field(default_factory=time.time)
+    deadline: Optional[Deadline] = field(default=None, repr=False, compare=False)
+
+
+@dataclass
+class ResolvedEvent:
+    """二维码URL已解析为最终的签到跳转地址"""
+    sign_id: int
+    url: str
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class CrowdedEvent:
+    """服务端返回空二维码（type==3，前方拥挤）"""
+    sign_id: int
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class SignClosedEvent:
+    """签到关闭（type==2）或客户端已结束"""
+    sign_id: int
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class ReconnectEvent:
+    """Faye连接重连或切换传输方式"""
+    sign_id: int
+    transport: str
+    attempt: int
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class SignsFoundEvent:
+    """轮询到有效的签到列表"""
+    signs: List[Dict[str, Any]]
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class StatusEvent:
+    """普通状态提示"""
+    message: str
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class ErrorEvent:
+    """错误信息（如openid失效）"""
+    title: str
+    message: str
+    timestamp: float = field(default_factory=time.time)
+
+
+@dataclass
+class EngineStoppedEvent:
+    """引擎已完全停止"""
+    reason: str
+    timestamp: float = field(default_factory=time.time)
+
+
+EngineEvent = Union[QREvent, ResolvedEvent, CrowdedEvent, SignClosedEvent, ReconnectEvent,
+                    SignsFoundEvent, StatusEvent, ErrorEvent, EngineStoppedEvent]
+
+
+class Sink:
+    """输出端基类 - handle在引擎事件循环线程中调用，不得阻塞"""
+
+    def handle(self, event: EngineEvent) -> None:
+        raise NotImplementedError
@@ -0,0 +1,609 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import logging
+from http import HTTPStatus
+from typing import Optional, Dict, Any, List, Callable, Awaitable
+import websockets
+from fayestub import FayeStub
+
+logger = logging.getLogger(__name__)
+
+SIGN_ID = 7001
+COURSE_ID = 9001
+PUBLISH_INTERVAL = 0.1  # 故障场景中二维码推送间隔
+
+
+class ProxyLink:
+    """代理中的一条连接及其当前故障"""
+
+    def __init__(self, downstream):
+        self.downstream = downstream
+        self.latency = 0.0      # 下行帧额外延迟（秒）
+        self.drop_meta = False  # 丢弃下行的/meta/connect回复（心跳无回复，数据照常）
+        self.blackhole = False  # 半开连接：双向都不再转发，也不读取关闭帧
+        self.dropped = 0
+
+    def half_open(self) -> None:
+        self.blackhole = True
+        transport = getattr(self.downstream, "transport", None)
+        if transport is not None:
+            transport.pause_reading()
+
+
+class FaultProxy:
+    """客户端与Faye替身之间的websocket代理，按需对已有连接注入故障；新连接默认是健康的"""
+
+    def __init__(self, upstream_url: str, host: str = "127.0.0.1"):
+        self.upstream_url = upstream_url
+        self.host = host
+        self.port = 0
+        self.links: List[ProxyLink] = []
+        self.refuse = 0  # 接下来拒绝多少个握手（HTTP 503）
+        self.refused = 0
+        self.server = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/faye"
+
+    async def start(self) -> None:
+        self.server = await websockets.serve(self._handle, self.host, 0,
+                                             process_request=self._process_request)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self.server.close()
+        for link in self.links:
+            transport = getattr(link.downstream, "transport", None)
+            if transport is not None:
+                transport.abort()
+        await self.server.wait_closed()
+
+    def _process_request(self, connection, request):
+        if self.refuse > 0:
+            self.refuse -= 1
+            self.refused += 1
+            return connection.respond(HTTPStatus.SERVICE_UNAVAILABLE, "injected failure\n")
+        return None
+
+    def inject(self, **fault) -> List[ProxyLink]:
+        """对当前所有连接注入故障，例如 inject(latency=0.3) / inject(half_open=True)"""
+        links = [link for link in self.links if link.downstream.state.name == "OPEN"]
+        make_half_open = fault.pop("half_open", False)
+        for link in links:
+            if make_half_open:
+                link.half_open()
+            for key, value in fault.items():
+                setattr(link, key, value)
+        return links
+
+    async def _handle(self, downstream) -> None:
+        link = ProxyLink(downstream)
+        self.links.append(link)
+        try:
+            async with websockets.connect(self.upstream_url) as upstream:
+                tasks = [asyncio.create_task(self._pump(downstream, upstream, link, down=False)),
+                         asyncio.create_task(self._pump(upstream, downstream, link, down=True))]
+                await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except (OSError, websockets.exceptions.WebSocketException):
+            pass
+
+    async def _pump(self, source, target, link: ProxyLink, down: bool) -> None:
+        """按顺序转发帧；有延迟时经由队列，保证延迟恒定而不是逐帧累加"""
+        queue: "asyncio.Queue" = asyncio.Queue()
+
+        async def sender():
+            while True:
+                due, frame = await queue.get()
+                delay = due - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not link.blackhole:
+                    await target.send(frame)
+
+        sender_task = asyncio.create_task(sender())
+        try:
+            async for frame in source:
+                if link.blackhole:
+                    link.dropped += 1
+                    continue
+                if down and link.drop_meta and '"/meta/connect"' in frame:
+                    link.dropped += 1
+                    continue
+                queue.put_nowait((time.monotonic() + (link.latency if down else 0.0), frame))
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            sender_task.cancel()
+            await asyncio.gather(sender_task, return_exceptions=True)
+
+
+class QRStream:
+    """以固定间隔向替身推送带序号的二维码，并记录客户端收到的序号"""
+
+    def __init__(self, stub: FayeStub, sign_id: int = SIGN_ID):
+        self.stub = stub
+        self.sign_id = sign_id
+        self.published: List[float] = []  # 序号 -> 推送时间
+        self.received: Dict[int, float] = {}
+        self.task: Optional[asyncio.Task] = None
+
+    def on_qr(self, url: str) -> None:
+        self.received.setdefault(int(url.rsplit("=", 1)[1]), time.monotonic())
+
+    async def _run(self) -> None:
+        while True:
+            seq = len(self.published)
+            self.published.append(time.monotonic())
+            await self.stub.publish(self.sign_id, {"type": 1, "qrUrl": f"https://stub.invalid/qr?n={seq}"})
+            await asyncio.sleep(PUBLISH_INTERVAL)
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.task.cancel()
+        await asyncio.gather(self.task, return_exceptions=True)
+        await asyncio.sleep(0.2)  # 等待在途的帧
+
+    def lost_after(self, since: float) -> List[int]:
+        """since之后推送但没收到的序号"""
+        return [seq for seq, at in enumerate(self.published) if at >= since and seq not in self.received]
+
+    def first_after(self, since: float) -> Optional[float]:
+        """since之后第一个到达的二维码的到达时间"""
+        arrivals = [at for at in self.received.values() if at >= since]
+        return min(arrivals) if arrivals else None
+
+    def first_published_after(self, since: float) -> Optional[float]:
+        """since之后推送的二维码中第一个到达的到达时间"""
+        arrivals = [self.received[seq] for seq, at in enumerate(self.published)
+                    if at >= since and seq in self.received]
+        return min(arrivals) if arrivals else None
+
+
+def _make_client(url: str, http_url: str, stream: QRStream, rtt_threshold: float = 1.0):
+    """心跳和超时都调小的客户端，记录开始切换和切换完成的时间"""
+    from getSocket import TeacherMateWebSocketClient
+
+    class ProbedClient(TeacherMateWebSocketClient):
+        swap_started: List[float] = []
+        swapped: List[float] = []
+
+        async def _swap_websocket(self, reason: str) -> None:
+            self.swap_started.append(time.monotonic())
+            await super()._swap_websocket(reason)
+            self.swapped.append(time.monotonic())
+
+    client = ProbedClient(SIGN_ID, qr_callback=stream.on_qr, ws_url=url, http_url=http_url)
+    client.swap_started, client.swapped = [], []
+    client.client_id = "fault"
+    client.wait_time = 0.1
+    client.reconnect_delay = 0.2
+    client.min_swap_interval = 0.5
+    client.close_timeout = 0.5
+    client.link.heartbeat_timeout = 0.5
+    client.link.rtt_threshold = rtt_threshold
+    return client
+
+
+class Scenario:
+    """一个故障场景：运行后返回指标，check对照上限给出失败项"""
+
+    def __init__(self, name: str, run: Callable[[FayeStub, FaultProxy], Awaitable[Dict[str, Any]]],
+                 bounds: Dict[str, float], exact: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.run = run
+        self.bounds = bounds
+        self.exact = exact or {}
+
+    def check(self, metrics: Dict[str, Any]) -> List[str]:
+        failures = []
+        for key, limit in self.bounds.items():
+            value = metrics.get(key)
+            if value is None or value > limit:
+                failures.append(f"{key}={value} 超过上限 {limit}")
+        for key, expected in self.exact.items():
+            if metrics.get(key) != expected:
+                failures.append(f"{key}={metrics.get(key)} 应为 {expected}")
+        return failures
+
+
+async def _link_fault(stub: FayeStub, proxy: FaultProxy, rtt_threshold: float = 1.0,
+                      **fault) -> Dict[str, Any]:
+    """连接建立并稳定后注入故障，测量检测和恢复时间
+
+    恢复时间：注入故障到第一个在开始切换之后推送的二维码到达。
+    """
+    stream = QRStream(stub)
+    client = _make_client(proxy.url, stub.http_url, stream, rtt_threshold)
+    task = asyncio.create_task(client.start())
+    await asyncio.sleep(0.5)
+    stream.start()
+    await asyncio.sleep(0.5)
+
+    injected_at = time.monotonic()
+    proxy.inject(**fault)
+    deadline = injected_at + 5.0
+    while not client.swapped and time.monotonic() < deadline:
+        await asyncio.sleep(0.02)
+    await asyncio.sleep(1.0)
+    await stream.stop()
+
+    shutdown_start = time.monotonic()
+    await client.graceful_shutdown()
+    await asyncio.gather(task, return_exceptions=True)
+
+    recovered = stream.first_published_after(client.swap_started[0]) if client.swap_started else None
+    return {
+        "detect_s": round(client.swap_started[0] - injected_at, 3) if client.swap_started else None,
+        "recover_s": round(recovered - injected_at, 3) if recovered else None,
+        "lost_total": len(stream.lost_after(0)),
+        "lost_after_recovery": len(stream.lost_after(recovered)) if recovered else None,
+        "swaps": len(client.swapped),
+        "shutdown_s": round(time.monotonic() - shutdown_start, 3),
+    }
+
+
+async def latency_spike(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    # 0.3秒的下行延迟，RTT阈值0.2秒：移动平均越过阈值后切换
+    return await _link_fault(stub, proxy, rtt_threshold=0.2, latency=0.3)
+
+
+async def dropped_heartbeats(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    return await _link_fault(stub, proxy, drop_meta=True)
+
+
+async def half_open(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    return await _link_fault(stub, proxy, half_open=True)
+
+
+async def handshake_refused(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """前两次websocket握手被拒，第三次成功：计数器应重置并保持websocket传输"""
+    stream = QRStream(stub)
+    client = _make_client(proxy.url, stub.http_url, stream)
+    proxy.refuse = 2
+    start = time.monotonic()
+    task = asyncio.create_task(client.start())
+    while not proxy.links and time.monotonic() - start < 5:
+        await asyncio.sleep(0.01)
+    connected = time.monotonic() - start
+    await asyncio.sleep(0.3)
+    stream.start()
+    await asyncio.sleep(0.5)
+    await stream.stop()
+    await client.graceful_shutdown()
+    await asyncio.gather(task, return_exceptions=True)
+    return {
+        "connect_s": round(connected, 3),
+        "refused": proxy.refused,
+        "transport": client.transport,
+        "reconnect_attempts": client.reconnect_attempts,
+        "lost_total": len(stream.lost_after(0)),
+    }
+
+
+async def fallback_long_polling(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """websocket一直被拒：应在有限时间内切到long-polling并继续收到二维码"""
+    stream = QRStream(stub)
+    client = _make_client(proxy.url, stub.http_url, stream)
+    client.upgrade_interval = 0
+    proxy.refuse = 100
+    start = time.monotonic()
+    task = asyncio.create_task(client.start())
+    while client.transport != "long-polling" and time.monotonic() - start < 5:
+        await asyncio.sleep(0.01)
+    switched = time.monotonic() - start
+    await asyncio.sleep(0.5)
+    stream.start()
+    await asyncio.sleep(1.0)
+    await stream.stop()
+    first = stream.first_after(0)
+    await client.graceful_shutdown()
+    await asyncio.gather(task, return_exceptions=True)
+    return {
+        "fallback_s": round(switched, 3),
+        "first_qr_s": round(first - start, 3) if first else None,
+        "transport": client.transport,
+        "lost_total": len(stream.lost_after(0)),
+    }
+
+
+async def _engine_env(stub: FayeStub, active_signs: Callable[[], str]) -> None:
+    stub.get_routes["/active_signs"] = active_signs
+    os.environ.update({
+        "ACTIVE_SIGNS_URL": f"http://{stub.host}:{stub.http_port}/active_signs",
+        "FAYE_URL": stub.http_url,
+        "FAYE_WS_URL": stub.ws_url,
+    })
+
+
+def _signs_body() -> str:
+    return json.dumps([{"signId": SIGN_ID, "courseId": COURSE_ID, "isQR": 1, "isGPS": 0}])
+
+
+async def slow_active_signs(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """active_signs响应需要3秒：停止请求应立即生效，不必等慢请求返回"""
+    from engine import SignEngine
+
+    def slow() -> str:
+        time.sleep(3.0)
+        return "[]"
+
+    await _engine_env(stub, slow)
+    engine = SignEngine("fault", poll_interval=0.1)
+    run_task = asyncio.create_task(engine.run())
+    await asyncio.sleep(0.5)
+    requested = time.monotonic()
+    engine.request_shutdown()
+    await run_task
+    return {"stop_s": round(time.monotonic() - requested, 3)}
+
+
+async def handshake_failure(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """前两次握手失败：引擎应重试并最终收到二维码"""
+    from engine import SignEngine, Sink, QREvent
+
+    failures = {"left": 2}
+    original = stub._handshake
+
+    def flaky(message):
+        if failures["left"] > 0:
+            failures["left"] -= 1
+            return {"channel": "/meta/handshake", "successful": False, "error": "injected", "id": message.get("id")}
+        return original(message)
+
+    stub._handshake = flaky
+    await _engine_env(stub, _signs_body)
+    stream = QRStream(stub)
+    arrived: List[float] = []
+
+    class FirstQR(Sink):
+        def handle(self, event):
+            if isinstance(event, QREvent):
+                arrived.append(time.monotonic())
+
+    engine = SignEngine("fault", poll_interval=0.1)
+    engine.handshake_retry_delay = 0.2
+    engine.add_sink(FirstQR())
+    start = time.monotonic()
+    run_task = asyncio.create_task(engine.run())
+    stream.start()
+    while not arrived and time.monotonic() - start < 5:
+        await asyncio.sleep(0.02)
+    await stream.stop()
+    engine.request_shutdown()
+    await run_task
+    stub._handshake = original
+    return {
+        "first_qr_s": round(arrived[0] - start, 3) if arrived else None,
+        "handshake_failures": 2 - failures["left"],
+    }
+
+
+async def poll_deadline(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """第一次active_signs卡住2秒：轮询应在预算用完时放弃并重试，不必等慢请求返回"""
+    import engine
+    import deadline
+    from engine import SignEngine, Sink, QREvent
+
+    calls = {"n": 0}
+
+    def stalled_once() -> str:
+        calls["n"] += 1
+        if calls["n"] == 1:
+            time.sleep(2.0)
+        return _signs_body()
+
+    await _engine_env(stub, stalled_once)
+    stream = QRStream(stub)
+    arrived: List[float] = []
+
+    class FirstQR(Sink):
+        def handle(self, event):
+            if isinstance(event, QREvent):
+                arrived.append(time.monotonic())
+
+    before = deadline.stats.status().get(deadline.POLL, {}).get("exhausted", 0)
+    budget, engine.POLL_BUDGET = engine.POLL_BUDGET, 0.4
+    eng = SignEngine("fault", poll_interval=0.1)
+    eng.add_sink(FirstQR())
+    start = time.monotonic()
+    run_task = asyncio.create_task(eng.run())
+    stream.start()
+    try:
+        while not arrived and time.monotonic() - start < 5:
+            await asyncio.sleep(0.02)
+    finally:
+        engine.POLL_BUDGET = budget
+        await stream.stop()
+        eng.request_shutdown()
+        await run_task
+    return {
+        "first_qr_s": round(arrived[0] - start, 3) if arrived else None,
+        "poll_exhausted": deadline.stats.status().get(deadline.POLL, {}).get("exhausted", 0) - before,
+    }
+
+
+async def idle_reap_watch(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """监视模式下因空闲被回收的签到：仍在active_signs中时不再订阅，消失后再出现才重新订阅"""
+    from engine import SignEngine, Sink, SignsFoundEvent
+
+    listed = {"sign": True}
+    await _engine_env(stub, lambda: _signs_body() if listed["sign"] else "[]")
+    found: List[float] = []
+
+    class Found(Sink):
+        def handle(self, event):
+            if isinstance(event, SignsFoundEvent):
+                found.append(time.monotonic())
+
+    # 不推送二维码：约idle_timeout后被回收，之后还有十几次轮询都应跳过它
+    eng = SignEngine("fault", poll_interval=0.1, watch=True, idle_timeout=0.4)
+    eng.add_sink(Found())
+    run_task = asyncio.create_task(eng.run())
+    try:
+        await asyncio.sleep(2.0)
+        subscribed_while_listed = len(found)
+        active_after_reap = len(eng.tasks)
+        listed["sign"] = False
+        await asyncio.sleep(0.4)
+        listed["sign"] = True
+        await asyncio.sleep(0.4)
+    finally:
+        eng.request_shutdown()
+        await run_task
+    return {
+        "subscribed_while_listed": subscribed_while_listed,
+        "active_after_reap": active_after_reap,
+        "resubscribed": len(found) - subscribed_while_listed,
+    }
+
+
+async def config_reload_sse(stub: FayeStub, proxy: FaultProxy) -> Dict[str, Any]:
+    """上一轮管道结束后修改openid：已打开的/events连接应转到新管道并收到新管道的二维码
+
+    读取线程模拟浏览器的EventSource：流结束后自动重连。
+    """
+    import threading
+    level = logging.getLogger().level
+    import web
+    logging.getLogger().setLevel(level)  # web导入时配置了全局日志，保持本工具的日志级别
+
+    listed = {"sign": False}
+    await _engine_env(stub, lambda: _signs_body() if listed["sign"] else "[]")
+    qr_url = f"http://{stub.host}:{stub.http_port}/qr"
+    stub.get_routes["/qr"] = lambda: "{}"
+    openid = {"value": "fault-old"}
+    get_openid, web.settings.get_openid = web.settings.get_openid, lambda: openid["value"]
+    previous = web.pipeline
+    received: List[Dict[str, Any]] = []
+    connections = {"n": 0}
+    stop = threading.Event()
+
+    def browser():
+        client = web.app.test_client()
+        while not stop.is_set():
+            connections["n"] += 1
+            response = client.get("/events")
+            for chunk in response.response:
+                for line in chunk.decode("utf-8").splitlines():
+                    if line.startswith("data: "):
+                        received.append(json.loads(line[6:]))
+                if stop.is_set():
+                    break
+            response.close()
+
+    try:
+        web.create_pipeline()
+        old = web.pipeline
+        reader = threading.Thread(target=browser, daemon=True)
+        reader.start()
+        while not received:
+            await asyncio.sleep(0.02)
+        old.shutdown()
+        while old.is_running:
+            await asyncio.sleep(0.02)
+
+        # 新openid下签到出现：热加载应启动新管道，已打开的页面收到新管道解析出的码
+        listed["sign"] = True
+        openid["value"] = "fault-new"
+        reloaded = time.monotonic()
+        web.on_config_change(None, {"user.openid"})
+        arrived = None
+        seq = 0
+        while arrived is None and time.monotonic() - reloaded < 5:
+            await stub.publish(SIGN_ID, {"type": 1, "qrUrl": f"{qr_url}?n={seq}"})
+            seq += 1
+            await asyncio.sleep(PUBLISH_INTERVAL)
+            if any(status.get("qr_url") for status in received):
+                arrived = time.monotonic()
+        replaced = web.pipeline is not old
+    finally:
+        stop.set()
+        web.settings.get_openid = get_openid
+        if web.pipeline is not None and web.pipeline is not previous:
+            web.pipeline.shutdown()
+            while web.pipeline.is_running:
+                await asyncio.sleep(0.02)
+            web.pipeline.engine.hub.close_all()
+        web.pipeline = previous
+    return {
+        "replaced": replaced,
+        "reconnects": connections["n"] - 1,
+        "old_subscribers": old.engine.hub.stats()["subscribers"],
+        "qr_s": round(arrived - reloaded, 3) if arrived else None,
+    }
+
+
+# 上限按测试参数推算：心跳0.1秒、心跳超时0.5秒、连续3个丢失、close_timeout 0.5秒，另留余量
+# 所有链路故障都不允许丢码：延迟和心跳丢失时旧连接仍在投递，先订阅新连接、等旧连接排空后再切换；
+# 半开连接上被丢弃的帧由替身在同一clientId重新订阅时补发（旧连接最后有上行之后的推送）
+SCENARIOS = {s.name: s for s in (
+    Scenario("latency_spike", latency_spike,
+             {"detect_s": 2.0, "recover_s": 2.5, "lost_total": 0, "shutdown_s": 1.0}),
+    Scenario("dropped_heartbeats", dropped_heartbeats,
+             {"detect_s": 1.5, "recover_s": 2.0, "lost_total": 0, "shutdown_s": 1.0}),
+    Scenario("half_open", half_open,
+             {"detect_s": 1.5, "recover_s": 2.0, "lost_total": 0, "lost_after_recovery": 0, "shutdown_s": 1.0}),
+    Scenario("handshake_refused", handshake_refused,
+             {"connect_s": 1.0, "lost_total": 0}, {"transport": "websocket", "reconnect_attempts": 0}),
+    Scenario("fallback_long_polling", fallback_long_polling,
+             {"fallback_s": 1.0, "first_qr_s": 2.5, "lost_total": 0}, {"transport": "long-polling"}),
+    Scenario("slow_active_signs", slow_active_signs, {"stop_s": 0.5}),
+    Scenario("handshake_failure", handshake_failure, {"first_qr_s": 2.0}, {"handshake_failures": 2}),
+    Scenario("poll_deadline", poll_deadline, {"first_qr_s": 1.5}, {"poll_exhausted": 1}),
+    Scenario("idle_reap_watch", idle_reap_watch, {},
+             {"subscribed_while_listed": 1, "active_after_reap": 0, "resubscribed": 1}),
+    Scenario("config_reload_sse", config_reload_sse, {"qr_s": 3.0},
+             {"replaced": True, "reconnects": 1, "old_subscribers": 0}),
+)}
+
+
+async def run_scenario(scenario: Scenario) -> List[str]:
+    """每个场景使用全新的替身和代理"""
+    import ratelimit
+    ratelimit.limiter.enabled = False
+    stub = FayeStub(poll_timeout=1.0)
+    await stub.start()
+    proxy = FaultProxy(stub.ws_url)
+    await proxy.start()
+    try:
+        metrics = await scenario.run(stub, proxy)
+    finally:
+        await proxy.stop()
+        await stub.stop()
+    failures = scenario.check(metrics)
+    status = "PASS" if not failures else "FAIL"
+    print(f"{status} {scenario.name}: {json.dumps(metrics, ensure_ascii=False)}")
+    for failure in failures:
+        print(f"     - {failure}")
+    return failures
+
+
+async def _main(names: List[str]) -> int:
+    failed = 0
+    for name in names:
+        if await run_scenario(SCENARIOS[name]):
+            failed += 1
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="注入故障并检查检测/恢复时间上限")
+    parser.add_argument("scenarios", nargs="*", help=f"默认运行全部场景: {', '.join(SCENARIOS)}")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.CRITICAL,
+                        format='%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s')
+    sys.exit(1 if asyncio.run(_main(args.scenarios or list(SCENARIOS))) else 0)
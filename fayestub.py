@@ -0,0 +1,278 @@
+import asyncio
+import json
+import queue
+import socket
+import sys
+import threading
+import time
+import logging
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Optional, Dict, Set, List, Any, Callable, Deque, Tuple
+import websockets
+
+logger = logging.getLogger(__name__)
+
+RECENT_MESSAGES = 256  # 每个通道保留的最近推送数，用于同一客户端重新订阅时补发
+
+
+class FayeStub:
+    """本地Faye替身 - 同时提供websocket和long-polling，用于基准测试和离线调试"""
+
+    def __init__(self, host: str = "127.0.0.1", ws_port: int = 0, http_port: int = 0,
+                 poll_timeout: float = 10.0):
+        self.host = host
+        self.ws_port = ws_port
+        self.http_port = http_port
+        self.poll_timeout = poll_timeout
+        self.ws_server = None
+        self.http_server: Optional[ThreadingHTTPServer] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        # channel -> websocket连接
+        self.ws_subscribers: Dict[str, Set[Any]] = {}
+        # channel -> long-polling客户端的待发送队列
+        self.poll_subscribers: Dict[str, Set[str]] = {}
+        self.poll_queues: Dict[str, "queue.Queue[Dict[str, Any]]"] = {}
+        # 每个websocket连接的clientId和最后一次收到帧的时间；每个通道最近的(推送时间, 帧)
+        self.ws_clients: Dict[Any, str] = {}
+        self.ws_last_seen: Dict[Any, float] = {}
+        self.recent: Dict[str, Deque[Tuple[float, str]]] = {}
+        self._lock = threading.Lock()
+        self._client_counter = 0
+        # 额外的GET接口: path -> 返回响应正文的函数（在HTTP服务线程中调用）
+        self.get_routes: Dict[str, Callable[[], str]] = {}
+        # 订阅回调: channel -> None（在事件循环线程中调用）
+        self.on_subscribe: Optional[Callable[[str], None]] = None
+
+    @property
+    def ws_url(self) -> str:
+        return f"ws://{self.host}:{self.ws_port}/faye"
+
+    @property
+    def http_url(self) -> str:
+        return f"http://{self.host}:{self.http_port}/faye"
+
+    async def start(self) -> None:
+        self.loop = asyncio.get_running_loop()
+        self.ws_server = await websockets.serve(self._ws_handler, self.host, self.ws_port)
+        self.ws_port = self.ws_server.sockets[0].getsockname()[1]
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # 支持keep-alive
+
+            def setup(self):
+                super().setup()
+                # 头和正文分两次写出，关闭Nagle避免40ms的延迟确认
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                messages = json.loads(self.rfile.read(length) or b"[]")
+                body = json.dumps(stub._handle_http(messages)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                route = stub.get_routes.get(self.path.split("?", 1)[0])
+                body = route().encode("utf-8") if route else b'{"message":"not found"}'
+                self.send_response(200 if route else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            def handle_error(self, request, client_address):
+                # 客户端在响应写出前断开（例如被取消的轮询）是预期的，不打印traceback
+                if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+                    return
+                super().handle_error(request, client_address)
+
+        self.http_server = Server((self.host, self.http_port), Handler)
+        self.http_server.daemon_threads = True
+        self.http_port = self.http_server.server_address[1]
+        threading.Thread(target=self.http_server.serve_forever, name="FayeStubHTTP", daemon=True).start()
+        logger.info(f"Faye替身已启动: {self.ws_url} / {self.http_url}")
+
+    async def stop(self) -> None:
+        if self.http_server:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+        if self.ws_server:
+            self.ws_server.close()
+            await self.ws_server.wait_closed()
+
+    def _reply(self, message: Dict[str, Any], **extra) -> Dict[str, Any]:
+        reply = {"channel": message.get("channel"), "successful": True, "id": message.get("id")}
+        if message.get("clientId"):
+            reply["clientId"] = message["clientId"]
+        reply.update(extra)
+        return reply
+
+    def _handshake(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._client_counter += 1
+            client_id = f"stub{self._client_counter}"
+        return self._reply(message, clientId=client_id, version="1.0",
+                           supportedConnectionTypes=["websocket", "long-polling"],
+                           advice={"reconnect": "retry", "interval": 0,
+                                   "timeout": int(self.poll_timeout * 1000)})
+
+    def _notify_subscribe(self, channel: str, threadsafe: bool = False) -> None:
+        if self.on_subscribe is None:
+            return
+        if threadsafe and self.loop is not None:
+            self.loop.call_soon_threadsafe(self.on_subscribe, channel)
+        else:
+            self.on_subscribe(channel)
+
+    def _handle_http(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """处理一次HTTP请求（在HTTP服务线程中执行）"""
+        replies = []
+        wait_client = None
+        for message in messages:
+            channel = message.get("channel")
+            if channel == "/meta/handshake":
+                replies.append(self._handshake(message))
+            elif channel == "/meta/subscribe":
+                client_id = message.get("clientId", "")
+                with self._lock:
+                    self.poll_subscribers.setdefault(message["subscription"], set()).add(client_id)
+                    self.poll_queues.setdefault(client_id, queue.Queue())
+                self._notify_subscribe(message["subscription"], threadsafe=True)
+                replies.append(self._reply(message, subscription=message["subscription"]))
+            elif channel == "/meta/connect":
+                replies.append(self._reply(message, advice={
+                    "reconnect": "retry", "interval": 0, "timeout": int(self.poll_timeout * 1000)}))
+                advice = message.get("advice") or {}
+                if message.get("connectionType") == "long-polling" and advice.get("timeout") != 0:
+                    wait_client = message.get("clientId", "")
+            else:
+                replies.append(self._reply(message))
+
+        if wait_client is not None:
+            with self._lock:
+                pending = self.poll_queues.setdefault(wait_client, queue.Queue())
+            try:
+                replies.append(pending.get(timeout=self.poll_timeout))
+                while True:
+                    replies.append(pending.get_nowait())
+            except queue.Empty:
+                pass
+        return replies
+
+    def _unconfirmed(self, channel: str, client_id: str, websocket) -> List[str]:
+        """同一clientId在新连接上重新订阅时，旧连接最后一次有上行帧之后推送的帧
+
+        旧连接可能已经半开：发出去的帧没有确认，在新连接上补发（重复的码由客户端去重）。
+        """
+        previous = [ws for ws in self.ws_subscribers.get(channel, ())
+                    if ws is not websocket and self.ws_clients.get(ws) == client_id]
+        if not client_id or not previous:
+            return []
+        since = min(self.ws_last_seen.get(ws, 0.0) for ws in previous)
+        return [frame for published_at, frame in self.recent.get(channel, ()) if published_at > since]
+
+    async def _ws_handler(self, websocket, path=None) -> None:
+        subscribed: List[str] = []
+        try:
+            async for frame in websocket:
+                self.ws_last_seen[websocket] = time.monotonic()
+                replies = []
+                replay: List[str] = []
+                for message in json.loads(frame):
+                    channel = message.get("channel")
+                    if message.get("clientId"):
+                        self.ws_clients[websocket] = message["clientId"]
+                    if channel == "/meta/handshake":
+                        replies.append(self._handshake(message))
+                    elif channel == "/meta/subscribe":
+                        replay += self._unconfirmed(message["subscription"], message.get("clientId", ""), websocket)
+                        self.ws_subscribers.setdefault(message["subscription"], set()).add(websocket)
+                        subscribed.append(message["subscription"])
+                        self._notify_subscribe(message["subscription"])
+                        replies.append(self._reply(message, subscription=message["subscription"]))
+                    else:
+                        replies.append(self._reply(message))
+                await websocket.send(json.dumps(replies))
+                for frame in replay:
+                    await websocket.send(frame)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            for channel in subscribed:
+                self.ws_subscribers.get(channel, set()).discard(websocket)
+            self.ws_clients.pop(websocket, None)
+            self.ws_last_seen.pop(websocket, None)
+
+    async def publish(self, sign_id: int, data: Dict[str, Any]) -> int:
+        """向订阅了/sign/{sign_id}的所有客户端推送数据，返回投递数"""
+        channel = f"/sign/{sign_id}"
+        message = {"channel": channel, "data": data, "id": str(time.monotonic_ns())}
+        frame = json.dumps([message])
+        self.recent.setdefault(channel, deque(maxlen=RECENT_MESSAGES)).append((time.monotonic(), frame))
+        count = 0
+        for websocket in list(self.ws_subscribers.get(channel, ())):
+            try:
+                await websocket.send(frame)
+                count += 1
+            except websockets.exceptions.ConnectionClosed:
+                self.ws_subscribers[channel].discard(websocket)
+        with self._lock:
+            for client_id in self.poll_subscribers.get(channel, ()):
+                self.poll_queues[client_id].put(message)
+                count += 1
+        return count
+
+
+async def _benchmark(rotations: int = 50, interval: float = 0.05) -> None:
+    """比较websocket和long-polling两种传输方式的二维码投递延迟"""
+    from getSocket import TeacherMateWebSocketClient
+
+    stub = FayeStub(poll_timeout=5.0)
+    await stub.start()
+
+    for transport in ("websocket", "long-polling"):
+        latencies: List[float] = []
+        sign_id = 1000 + len(transport)
+
+        def on_qr(url: str) -> None:
+            latencies.append(time.perf_counter() - float(url.rsplit("=", 1)[1]))
+
+        client = TeacherMateWebSocketClient(sign_id, qr_callback=on_qr, transport=transport,
+                                            ws_url=stub.ws_url, http_url=stub.http_url)
+        client.client_id = f"bench-{transport}"
+        client.upgrade_interval = 0  # 基准测试中不升级
+        task = asyncio.create_task(client.start())
+        await asyncio.sleep(0.5)  # 等待订阅完成
+
+        for _ in range(rotations):
+            await stub.publish(sign_id, {"type": 1, "qrUrl": f"https://stub.invalid/qr?t={time.perf_counter()}"})
+            await asyncio.sleep(interval)
+        await asyncio.sleep(0.5)
+
+        await client.graceful_shutdown()
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+        latencies.sort()
+        if latencies:
+            p50 = latencies[len(latencies) // 2] * 1000
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+            print(f"{transport:>12}: 收到 {len(latencies)}/{rotations}, p50={p50:.2f}ms p99={p99:.2f}ms")
+        else:
+            print(f"{transport:>12}: 未收到任何二维码")
+
+    await stub.stop()
+
+
+if __name__ == '__main__':
+    asyncio.run(_benchmark())
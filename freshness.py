@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Optional, Dict, Any, Tuple
+
+DEFAULT_ROTATION = 10.0  # 尚未测得轮换间隔时使用的估计值（秒）
+EWMA_ALPHA = 0.3
+STALE_GRACE = 0.5  # 超过预计有效期多少个轮换间隔后视为已失效（容忍推送抖动）
+
+
+class QRState:
+    """单个签到当前二维码的状态"""
+    __slots__ = ("url", "arrived_at", "interval", "rotations")
+
+    def __init__(self, url: str, arrived_at: float):
+        self.url = url
+        self.arrived_at = arrived_at
+        self.interval: Optional[float] = None  # 轮换间隔的指数移动平均
+        self.rotations = 0
+
+
+class QRFreshness:
+    """二维码新鲜度跟踪 - 记录每个码的到达时间并测量每个签到的轮换间隔"""
+
+    def __init__(self, default_rotation: float = DEFAULT_ROTATION):
+        self.default_rotation = default_rotation
+        self.states: Dict[int, QRState] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, sign_id: int, url: str, arrived_at: Optional[float] = None) -> bool:
+        """记录新到达的二维码，返回是否为新码（重复推送同一个码返回False）"""
+        if arrived_at is None:
+            arrived_at = time.time()
+        with self._lock:
+            state = self.states.get(sign_id)
+            if state is None:
+                self.states[sign_id] = QRState(url, arrived_at)
+                return True
+            if state.url == url or arrived_at < state.arrived_at:
+                return False
+            gap = arrived_at - state.arrived_at
+            state.interval = gap if state.interval is None else \
+                EWMA_ALPHA * gap + (1 - EWMA_ALPHA) * state.interval
+            state.url = url
+            state.arrived_at = arrived_at
+            state.rotations += 1
+            return True
+
+    def forget(self, sign_id: int) -> None:
+        with self._lock:
+            self.states.pop(sign_id, None)
+
+    def is_current(self, sign_id: int, url: str) -> bool:
+        """url是否仍是该签到最新的二维码"""
+        state = self.states.get(sign_id)
+        return state is not None and state.url == url
+
+    def rotation_interval(self, sign_id: int) -> float:
+        state = self.states.get(sign_id)
+        if state is None or state.interval is None:
+            return self.default_rotation
+        return state.interval
+
+    def remaining(self, sign_id: int, now: Optional[float] = None) -> float:
+        """当前码预计还能用多久（秒），可能为负"""
+        state = self.states.get(sign_id)
+        if state is None:
+            return 0.0
+        if now is None:
+            now = time.time()
+        return state.arrived_at + self.rotation_interval(sign_id) - now
+
+    def budget(self, sign_id: int, now: Optional[float] = None) -> float:
+        """当前码距离被判定为失效还有多久（秒），即后续处理阶段的总预算"""
+        return self.remaining(sign_id, now) + STALE_GRACE * self.rotation_interval(sign_id)
+
+    def is_stale(self, sign_id: int, url: str, now: Optional[float] = None) -> bool:
+        """已被新码取代，或超过预计有效期（含抖动容忍）"""
+        if not self.is_current(sign_id, url):
+            return True
+        return self.remaining(sign_id, now) <= -STALE_GRACE * self.rotation_interval(sign_id)
+
+    def latest(self, now: Optional[float] = None) -> Optional[Tuple[int, str]]:
+        """所有签到中最新到达且未过期的码，返回(sign_id, url)"""
+        with self._lock:
+            states = sorted(self.states.items(), key=lambda item: item[1].arrived_at, reverse=True)
+        for sign_id, state in states:
+            if not self.is_stale(sign_id, state.url, now):
+                return sign_id, state.url
+        return None
+
+    def status(self, sign_id: int, now: Optional[float] = None) -> Dict[str, Any]:
+        """用于状态接口的新鲜度字段"""
+        state = self.states.get(sign_id)
+        if state is None:
+            return {"age": None, "expected_expiry": None, "expires_in": None,
+                    "rotation_interval": None, "interval_measured": False}
+        if now is None:
+            now = time.time()
+        interval = self.rotation_interval(sign_id)
+        return {
+            "age": round(now - state.arrived_at, 3),
+            "expected_expiry": round(state.arrived_at + interval, 3),
+            "expires_in": round(state.arrived_at + interval - now, 3),
+            "rotation_interval": round(interval, 3),
+            "interval_measured": state.interval is not None,
+        }
@@ -2,15 +2,30 @@ import asyncio
 import websockets
 import json
 import logging
-from typing import Optional, Callable
+from typing import Optional, Callable, List, Dict, Any
 import time
+import os
+import recorder
+from httpclient import client as http_client
+from linkstats import LinkStats
+from deadline import Deadline, CONNECT_BUDGET, CONNECT, SUBSCRIBE, HEARTBEAT
+import ratelimit
 logger = logging.getLogger(__name__)
 
+FAYE_WS_URL = "wss://www.teachermate.com.cn/faye"
+FAYE_HTTP_URL = "https://www.teachermate.com.cn/faye"
+
 
 class TeacherMateWebSocketClient:
 
-    def __init__(self, sign_id: int, qr_callback: Optional[Callable] = None):
+    def __init__(self, sign_id: int, qr_callback: Optional[Callable] = None,
+                 status_callback: Optional[Callable[[int], None]] = None,
+                 reconnect_callback: Optional[Callable[[str, int], None]] = None,
+                 transport: str = "websocket", ws_url: Optional[str] = None,
+                 http_url: Optional[str] = None):
         self.qr_callback = qr_callback
+        self.status_callback = status_callback
+        self.reconnect_callback = reconnect_callback
         self.sign_id = sign_id
         self.client_id = ""
         self.counter = 3
@@ -22,115 +37,296 @@ class TeacherMateWebSocketClient:
         self.max_reconnect_attempts = 3
         self.reconnect_attempts = 0
         self.receive_task: Optional[asyncio.Task] = None
+        # 传输方式: websocket 或 long-polling
+        self.transport = transport
+        self.ws_url = ws_url or os.getenv("FAYE_WS_URL", FAYE_WS_URL)
+        self.http_url = http_url or os.getenv("FAYE_URL", FAYE_HTTP_URL)
+        self.long_polling_fallback = True
+        self.upgrade_interval = 30.0  # long-polling下每隔多久尝试升级回websocket
+        self.poll_timeout = 45.0  # 服务端建议的long-polling挂起时间（秒）
+        self.close_timeout = 2.0  # 关闭握手最长等待时间
+        # 心跳RTT统计；链路劣化时先建新连接再关旧连接
+        self.link = LinkStats()
+        self.proactive_reconnect = True
+        self.min_swap_interval = 10.0  # 两次主动重连的最小间隔（秒）
+        self._last_swap = 0.0
+        self._subscribed = asyncio.Event()
+        # 最近一次收到数据消息的时间，引擎据此回收空闲的签到
+        self.last_activity = time.monotonic()
+        # 引擎创建签到时的截止时间，首次连接和订阅沿用它；之后每次重连各有CONNECT_BUDGET
+        self.setup_deadline: Optional[Deadline] = None
 
-    async def receive_handler(self) -> None:
-        """接收消息处理函数"""
+    async def receive_handler(self, websocket=None) -> None:
+        """接收消息处理函数（主动重连时新旧连接各有一个）"""
+        websocket = websocket or self.websocket
         try:
-            async for message in self.websocket:
+            async for message in websocket:
                 if self.is_shutting_down:
                     break
 
                 msg_str = message.decode('utf-8') if isinstance(message, bytes) else message
-                logger.debug(f"收到消息: {msg_str}")
+                if recorder.active:
+                    recorder.active.write(recorder.WS_IN, msg_str, self.sign_id)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("收到消息: %s", msg_str, extra={"sign_id": self.sign_id, "stage": "frame"})
+
+                if '"/meta/' in msg_str:
+                    self._handle_meta_replies(msg_str, websocket)
 
-                if "qrUrl" in msg_str:
+                # 只处理数据消息（二维码/拥挤/关闭），关闭消息里不一定带qrUrl
+                if '"data"' in msg_str:
                     await self._handle_qr_message(msg_str)
 
         except websockets.exceptions.ConnectionClosed:
-            if not self.is_shutting_down:
-                logger.info("WebSocket连接已关闭")
-            self.done.set()
+            # 被替换掉的旧连接关闭是预期的，不结束客户端
+            if websocket is self.websocket:
+                if not self.is_shutting_down:
+                    logger.info("WebSocket连接已关闭")
+                self.done.set()
         except Exception as e:
-            if not self.is_shutting_down:
-                logger.error(f"接收消息错误: {e}")
-            self.done.set()
+            if websocket is self.websocket:
+                if not self.is_shutting_down:
+                    logger.error(f"接收消息错误: {e}")
+                self.done.set()
+
+    def _handle_meta_replies(self, message: str, websocket) -> None:
+        """按id匹配心跳回复并记录RTT；记录订阅确认"""
+        try:
+            replies = json.loads(message)
+        except json.JSONDecodeError:
+            return
+        if not isinstance(replies, list) or websocket is not self.websocket:
+            return
+        for reply in replies:
+            if not isinstance(reply, dict):
+                continue
+            channel = reply.get("channel")
+            if channel == "/meta/connect" and reply.get("id") is not None:
+                self.link.on_reply(str(reply["id"]))
+            elif channel == "/meta/subscribe":
+                self._subscribed.set()
 
     async def _handle_qr_message(self, message: str) -> None:
         """处理包含二维码URL的消息"""
         try:
             qr_data = json.loads(message)
             if isinstance(qr_data, list) and len(qr_data) > 0:
-                qr_code_data = qr_data[0]["data"]
-                if qr_code_data["type"]==1:
-                    qr_code_url = qr_code_data["qrUrl"]
-                    logger.info(f"获取到二维码URL: {qr_code_url[:50]}...")
-
-                    if self.qr_callback and not self.is_shutting_down:
-                        self.qr_callback(qr_code_url)
-                elif qr_code_data["type"]==3:
-                    logger.info("qr_url为空，前方拥挤")
-                elif qr_code_data["type"]==2:
-                    logger.info(f"检测到关闭信息")
-                    await self.graceful_shutdown()
+                await self._handle_qr_data(qr_data[0]["data"])
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析失败: {e}")
         except KeyError as e:
             logger.error(f"消息格式错误，缺少键: {e}")
 
+    async def _handle_qr_data(self, qr_code_data: Dict[str, Any]) -> None:
+        """处理二维码消息的data部分（两种传输方式共用）"""
+        self.last_activity = time.monotonic()
+        try:
+            if qr_code_data["type"]==1:
+                qr_code_url = qr_code_data["qrUrl"]
+                logger.info("获取到二维码URL: %.50s...", qr_code_url,
+                            extra={"sign_id": self.sign_id, "stage": "qr"})
+
+                if self.qr_callback and not self.is_shutting_down:
+                    self.qr_callback(qr_code_url)
+            elif qr_code_data["type"]==3:
+                logger.info("qr_url为空，前方拥挤", extra={"sign_id": self.sign_id, "stage": "crowded"})
+                if self.status_callback and not self.is_shutting_down:
+                    self.status_callback(3)
+            elif qr_code_data["type"]==2:
+                logger.info("检测到关闭信息", extra={"sign_id": self.sign_id, "stage": "closed"})
+                if self.status_callback and not self.is_shutting_down:
+                    self.status_callback(2)
+                await self.graceful_shutdown()
+        except KeyError as e:
+            logger.error(f"消息格式错误，缺少键: {e}")
+
     async def start(self) -> None:
-        """启动WebSocket客户端，支持重连"""
-        while (self.reconnect_attempts < self.max_reconnect_attempts and
-               not self.is_shutting_down):
+        """启动客户端，支持重连；websocket不可用时自动切换到long-polling"""
+        while not self.is_shutting_down and not self.done.is_set():
+            if self.transport == "long-polling":
+                if not await self._run_long_polling():
+                    break
+                # 尝试升级回websocket，只给一次机会，失败立即退回long-polling
+                self.reconnect_attempts = self.max_reconnect_attempts - 1
+                continue
 
             try:
                 await self._connect_and_run()
                 break
 
             except (websockets.exceptions.ConnectionClosed,
+                    websockets.exceptions.InvalidHandshake,
                     ConnectionRefusedError,
+                    OSError,
                     asyncio.TimeoutError) as e:
 
                 self.reconnect_attempts += 1
                 if self.reconnect_attempts < self.max_reconnect_attempts and not self.is_shutting_down:
                     logger.warning(f"连接失败，{self.reconnect_delay}秒后重试... ({e})")
+                    self._notify_reconnect()
                     await asyncio.sleep(self.reconnect_delay)
+                elif self.long_polling_fallback and not self.is_shutting_down:
+                    logger.warning(f"WebSocket不可用，切换到long-polling: {e}")
+                    self.transport = "long-polling"
+                    self._notify_reconnect()
                 else:
                     logger.error(f"达到最大重连次数，放弃连接: {e}")
+                    break
 
             except Exception as e:
                 if not self.is_shutting_down:
                     logger.error(f"WebSocket客户端意外错误: {e}")
                 break
 
-    async def _connect_and_run(self) -> None:
-        """连接并运行WebSocket客户端"""
-        socket_url = "wss://www.teachermate.com.cn/faye"
+    def _notify_reconnect(self) -> None:
+        if self.reconnect_callback and not self.is_shutting_down:
+            self.reconnect_callback(self.transport, self.reconnect_attempts)
+
+    def _post_faye(self, messages: List[Dict[str, Any]], timeout: float,
+                   deadline: Optional[Deadline] = None) -> List[Dict[str, Any]]:
+        """通过连接池发送Faye消息（同步，在线程池中调用）"""
+        if recorder.active:
+            recorder.active.write(recorder.LP_OUT, messages, self.sign_id)
+        # /meta/connect会挂起到服务器有消息或超时，走long-polling的单独并发上限
+        long_poll = any(message.get("channel") == "/meta/connect" for message in messages)
+        response = http_client.post(self.http_url, json=messages, timeout=(5.0, timeout),
+                                    rate_class=ratelimit.SUBSCRIBE, deadline=deadline, stage=SUBSCRIBE,
+                                    long_poll=long_poll)
+        response.raise_for_status()
+        if recorder.active:
+            recorder.active.write(recorder.LP_IN, response.text, self.sign_id)
+        return response.json()
+
+    async def _dispatch_replies(self, replies: List[Dict[str, Any]]) -> None:
+        """处理long-polling返回的消息列表"""
+        for reply in replies:
+            if reply.get("channel") == "/meta/connect":
+                advice = reply.get("advice") or {}
+                if "timeout" in advice:
+                    self.poll_timeout = max(advice["timeout"] / 1000.0, 1.0)
+            elif isinstance(reply.get("data"), dict) and "type" in reply["data"]:
+                await self._handle_qr_data(reply["data"])
+
+    async def _run_long_polling(self) -> bool:
+        """long-polling主循环；返回True表示应尝试升级回websocket"""
+        loop = asyncio.get_running_loop()
+        failures = 0
+        started = time.monotonic()
+        subscribe = [{"channel": "/meta/subscribe", "clientId": self.client_id,
+                      "subscription": f"/sign/{self.sign_id}", "id": "1"}]
+        subscribed = False
+        logger.info(f"使用long-polling传输 (sign_id: {self.sign_id})")
+
+        while not self.done.is_set() and not self.is_shutting_down:
+            try:
+                if not subscribed:
+                    deadline = self._connect_deadline()
+                    await self._dispatch_replies(
+                        await loop.run_in_executor(None, self._post_faye, subscribe, CONNECT_BUDGET, deadline))
+                    subscribed = True
+                    logger.info(f"已订阅签到通道: {self.sign_id}")
+
+                self.counter += 1
+                connect = [{"channel": "/meta/connect", "clientId": self.client_id,
+                            "connectionType": "long-polling", "id": str(self.counter)}]
+                replies = await loop.run_in_executor(
+                    None, self._post_faye, connect, self.poll_timeout + 10.0)
+                failures = 0
+                await self._dispatch_replies(replies)
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if self.is_shutting_down:
+                    break
+                failures += 1
+                if failures >= self.max_reconnect_attempts:
+                    logger.error(f"long-polling连续失败，放弃连接: {e}")
+                    return False
+                logger.warning(f"long-polling请求失败，{self.reconnect_delay}秒后重试... ({e})")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            if (self.upgrade_interval and not self.done.is_set()
+                    and time.monotonic() - started > self.upgrade_interval):
+                logger.info("尝试升级回websocket传输")
+                self.transport = "websocket"
+                self._notify_reconnect()
+                return True
+
+        return False
+
+    def _connect_deadline(self) -> Deadline:
+        """本次连接的截止时间：首次连接用引擎给的签到预算，之后每次重连重新计时"""
+        deadline, self.setup_deadline = self.setup_deadline, None
+        return deadline or Deadline(CONNECT_BUDGET, f"sign:{self.sign_id}")
 
-        # 连接超时设置
+    async def _open_websocket(self, deadline: Deadline):
+        """建立websocket连接，超时为截止时间的剩余预算"""
+        timeout = deadline.timeout(CONNECT)
         try:
-            self.websocket = await asyncio.wait_for(
-                websockets.connect(socket_url),
-                timeout=10.0
+            return await asyncio.wait_for(
+                websockets.connect(self.ws_url, close_timeout=self.close_timeout),
+                timeout=timeout
             )
-        except asyncio.TimeoutError:
+        except asyncio.TimeoutError as e:
             logger.error("WebSocket连接超时")
+            if deadline.expired():
+                raise deadline.exceeded(CONNECT) from e
             raise
 
+    def _subscribe_message(self) -> str:
+        return f'[{{"channel":"/meta/subscribe","clientId":"{self.client_id}","subscription":"/sign/{self.sign_id}","id":"1"}}]'
+
+    def _heartbeat_message(self, message_id: str) -> str:
+        """websocket心跳；advice.timeout=0 让服务端立即回复，回复时间即RTT"""
+        return f'[{{"channel":"/meta/connect","clientId":"{self.client_id}","connectionType":"websocket","advice":{{"timeout":0}},"id":"{message_id}"}}]'
+
+    async def _connect_and_run(self) -> None:
+        """连接并运行WebSocket客户端"""
+        deadline = self._connect_deadline()
+        self.websocket = await self._open_websocket(deadline)
+        self.link.new_connection()
+
         logger.info("WebSocket连接建立成功")
         self.reconnect_attempts = 0  # 重置重连计数
 
         # 启动接收任务
-        self.receive_task = asyncio.create_task(self.receive_handler())
+        self.receive_task = asyncio.create_task(self.receive_handler(self.websocket))
 
         try:
-            # 发送订阅消息
-            subscribe_msg = f'[{{"channel":"/meta/subscribe","clientId":"{self.client_id}","subscription":"/sign/{self.sign_id}","id":"1"}}]'
-            await self.websocket.send(subscribe_msg)
+            # 发送订阅消息（排队等限流令牌的时间也计入预算）
+            timeout = deadline.timeout(SUBSCRIBE)
+            try:
+                await asyncio.wait_for(self._send(self._subscribe_message()), timeout=timeout)
+            except asyncio.TimeoutError as e:
+                raise deadline.exceeded(SUBSCRIBE) from e
             logger.info(f"已订阅签到通道: {self.sign_id}")
 
             # 主循环 - 发送心跳
             while not self.done.is_set() and not self.is_shutting_down:
                 try:
                     self.counter += 1
-                    connect_msg = f'[{{"channel":"/meta/connect","clientId":"{self.client_id}","connectionType":"websocket","id":"{self.counter}"}}]'
+                    message_id = str(self.counter)
+                    connect_msg = self._heartbeat_message(message_id)
 
-                    await asyncio.wait_for(
-                        self.websocket.send(connect_msg),
-                        timeout=5.0
-                    )
+                    # 心跳超过heartbeat_timeout没有回复就记为丢失，发送本身也不能超过这个预算
+                    heartbeat = Deadline(self.link.heartbeat_timeout, f"sign:{self.sign_id}")
+                    timeout = heartbeat.timeout(HEARTBEAT)
+                    self.link.on_sent(message_id)
+                    try:
+                        await asyncio.wait_for(self._send(connect_msg), timeout=timeout)
+                    except asyncio.TimeoutError:
+                        heartbeat.exceeded(HEARTBEAT)
+                        raise
 
                     await asyncio.sleep(self.wait_time)
 
+                    reason = self.link.degraded()
+                    if (reason and self.proactive_reconnect and not self.done.is_set()
+                            and time.monotonic() - self._last_swap > self.min_swap_interval):
+                        await self._swap_websocket(reason)
+
                 except asyncio.TimeoutError:
                     if not self.is_shutting_down:
                         logger.warning("发送心跳超时")
@@ -145,6 +341,51 @@ class TeacherMateWebSocketClient:
             # 清理任务
             await self._cleanup_tasks()
 
+    async def _swap_websocket(self, reason: str) -> None:
+        """先建立并订阅新连接，再断开劣化的旧连接，切换期间不丢二维码（重复的码由引擎去重）"""
+        self._last_swap = time.monotonic()
+        logger.warning(f"链路劣化: {reason}，建立新连接后切换 (sign_id: {self.sign_id})")
+        deadline = Deadline(CONNECT_BUDGET, f"sign:{self.sign_id}")
+        try:
+            new_websocket = await self._open_websocket(deadline)
+        except (websockets.exceptions.InvalidHandshake, OSError, asyncio.TimeoutError) as e:
+            logger.warning(f"新连接建立失败，继续使用原连接: {e}")
+            return
+
+        old_websocket, old_task = self.websocket, self.receive_task
+        old_rtt = max(self.link.samples, default=None)  # 旧连接上观测到的最大RTT
+        self.websocket = new_websocket
+        self.link.new_connection()
+        self.link.swaps += 1
+        self._subscribed.clear()
+        self.receive_task = asyncio.create_task(self.receive_handler(new_websocket))
+        await self._send(self._subscribe_message())
+        try:
+            await asyncio.wait_for(self._subscribed.wait(),
+                                   timeout=min(self.close_timeout, deadline.timeout(SUBSCRIBE)))
+        except asyncio.TimeoutError:
+            logger.warning("新连接未确认订阅，仍然切换")
+
+        # 订阅确认之前推送的码还在旧连接上排队：再等旧链路的最大RTT让它们到达，之后的码新连接也会收到
+        if old_rtt and old_task and not old_task.done():
+            await asyncio.wait([old_task], timeout=min(old_rtt, self.close_timeout))
+        if old_task and not old_task.done():
+            old_task.cancel()
+        try:
+            await asyncio.wait_for(old_websocket.close(), timeout=self.close_timeout)
+        except Exception as e:
+            logger.debug(f"关闭旧连接: {e}")
+        logger.info(f"已切换到新连接 (sign_id: {self.sign_id})")
+        if self.reconnect_callback and not self.is_shutting_down:
+            self.reconnect_callback("websocket", self.link.swaps)
+
+    async def _send(self, message: str) -> None:
+        """发送websocket帧（订阅和心跳都算订阅类上游请求）"""
+        await ratelimit.limiter.aacquire(ratelimit.SUBSCRIBE)
+        if recorder.active:
+            recorder.active.write(recorder.WS_OUT, message, self.sign_id)
+        await self.websocket.send(message)
+
     async def _cleanup_tasks(self) -> None:
         """清理任务"""
         if self.receive_task and not self.receive_task.done():
@@ -170,6 +411,16 @@ class TeacherMateWebSocketClient:
         await self._cleanup_tasks()
         logger.info(f"WebSocket客户端已关闭 (sign_id: {self.sign_id})")
 
+    def abort(self) -> None:
+        """强制中止：不做关闭握手，直接断开底层连接"""
+        self.is_shutting_down = True
+        self.done.set()
+        websocket = self.websocket
+        if websocket is not None and getattr(websocket, "transport", None) is not None:
+            websocket.transport.abort()
+        if self.receive_task and not self.receive_task.done():
+            self.receive_task.cancel()
+
     async def close_connection(self) -> None:
         """关闭连接"""
         if self.websocket:
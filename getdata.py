@@ -1,11 +1,20 @@
-import requests
 import json
+import os
+import recorder
+import ratelimit
+from httpclient import client
+from deadline import POLL
 
-def getData(openid):
-    url  = "https://v18.teachermate.cn/wechat-api/v1/class-attendance/student/active_signs"
+ACTIVE_SIGNS_URL = "https://v18.teachermate.cn/wechat-api/v1/class-attendance/student/active_signs"
+
+def getData(openid, deadline=None):
+    url  = os.getenv("ACTIVE_SIGNS_URL", ACTIVE_SIGNS_URL)
     headers = {
         'User-Agent': "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36 Edg/122.0.0.0",
         "Openid": openid}
-    response = requests.get(url, headers=headers)
+    response = client.get(url, headers=headers, rate_class=ratelimit.POLL,
+                          deadline=deadline, stage=POLL)
+    if recorder.active:
+        recorder.active.write(recorder.ACTIVE_SIGNS, response.text)
     data = json.loads(response.text)
     return data
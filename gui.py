@@ -1,5 +1,5 @@
 import wx
-import qrcode
+import qrimage
 import threading
 import logging
 import math
@@ -13,13 +13,17 @@ logger = logging.getLogger(__name__)
 class QRDisplayApp(wx.Frame):
     """二维码显示应用 - 修复缩放失真问题"""
 
-    def __init__(self, qr_url: Optional[str] = None):
+    def __init__(self, qr_url: Optional[str] = None, title: str = "二维码展示器"):
         # 使用更简单的父类初始化
-        wx.Frame.__init__(self, None, title="二维码展示器", size=(450, 550))
+        wx.Frame.__init__(self, None, title=title, size=(450, 550))
         self.current_url = qr_url
         self.is_closing = False
         self.exit_callback: Optional[Callable] = None
-        self.qr_generation_lock = threading.Lock()
+        # 渲染线程状态：_render_pending表示有尚未渲染的新码，_render_running表示渲染线程在运行；
+        # 两者只在_render_state_lock下读写，渲染线程退出前在锁内确认没有待渲染的码
+        self._render_state_lock = threading.Lock()
+        self._render_pending = False
+        self._render_running = False
         self.original_bitmap: Optional[wx.Bitmap] = None  # 存储原始二维码位图
         self.original_size = (300, 300)  # 原始二维码大小
 
@@ -153,25 +157,35 @@ class QRDisplayApp(wx.Frame):
         if not self.current_url or self.is_closing:
             return
 
-        # 如果已经有线程在运行，跳过新的生成
-        if self.qr_generation_lock.locked():
-            return
-
-        def generate_in_thread():
-            """在后台线程中生成二维码"""
-            if self.is_closing:
+        # 标记有新码；渲染线程已在运行时由它补上最新的码，否则启动一个
+        with self._render_state_lock:
+            self._render_pending = True
+            if self._render_running:
                 return
+            self._render_running = True
 
-            try:
-                with self.qr_generation_lock:
-                    bitmap = self.generate_qr_bitmap(self.current_url)
-                    if bitmap and bitmap.IsOk() and not self.is_closing:
-                        # 保存原始位图
-                        self.original_bitmap = bitmap
-                        # 在主线程中应用
-                        wx.CallAfter(self._apply_qr_bitmap, bitmap)
-            except Exception as e:
-                logger.error(f"二维码生成线程错误: {e}")
+        def generate_in_thread():
+            """在后台线程中生成二维码，只渲染最新的URL，中间被取代的码直接跳过"""
+            while True:
+                with self._render_state_lock:
+                    if not self._render_pending or self.is_closing:
+                        self._render_running = False
+                        return
+                    self._render_pending = False
+                    rendered_url = self.current_url
+
+                try:
+                    bitmap = self.generate_qr_bitmap(rendered_url)
+                except Exception as e:
+                    logger.error(f"二维码生成线程错误: {e}")
+                    continue
+                if rendered_url != self.current_url:
+                    continue  # 生成期间已有新码（_render_pending已置位），丢弃这张
+                if bitmap and bitmap.IsOk() and not self.is_closing:
+                    # 保存原始位图
+                    self.original_bitmap = bitmap
+                    # 在主线程中应用
+                    wx.CallAfter(self._apply_qr_bitmap, bitmap, rendered_url)
 
         thread = threading.Thread(target=generate_in_thread, daemon=True)
         thread.start()
@@ -182,27 +196,9 @@ class QRDisplayApp(wx.Frame):
             if not data:
                 return None
 
-            # 使用更高的版本和更大的box_size生成更清晰的二维码
-            qr = qrcode.QRCode(
-                version=5,  # 更高的版本支持更多数据
-                error_correction=qrcode.constants.ERROR_CORRECT_M,  # 中等纠错级别
-                box_size=12,  # 更大的box_size提高分辨率
-                border=4,  # 更大的边框
-            )
-            qr.add_data(data)
-            qr.make(fit=True)
-
-            # 生成高质量图像
-            img = qr.make_image(
-                fill_color="black",
-                back_color="white",
-                image_factory=None  # 使用默认图像工厂
-            )
-
-            # 转换为wx.Bitmap
-            buffer = BytesIO()
-            img.save(buffer, format='PNG', optimize=True)
-            buffer.seek(0)
+            # PNG经过进程内共享的渲染缓存：多个窗口（多账号）和网页显示同一个码时只渲染一次
+            png = qrimage.cache.get(data, qrimage.DEFAULT_SIZE, "png").body
+            buffer = BytesIO(png)
 
             # 使用推荐的 wx.Image 构造函数
             image = wx.Image(buffer, type=wx.BITMAP_TYPE_PNG)
@@ -218,10 +214,12 @@ class QRDisplayApp(wx.Frame):
             logger.error(f"生成二维码失败: {e}")
             return None
 
-    def _apply_qr_bitmap(self, bitmap: wx.Bitmap) -> None:
+    def _apply_qr_bitmap(self, bitmap: wx.Bitmap, url: Optional[str] = None) -> None:
         """在主线程中应用二维码位图"""
         if not bitmap or not bitmap.IsOk() or self.is_closing:
             return
+        if url is not None and url != self.current_url:
+            return  # 已被新码取代
 
         try:
             # 直接设置位图，后续通过_resize_qr_bitmap调整大小
@@ -0,0 +1,101 @@
+import threading
+import time
+from typing import Optional, List, Dict, Any
+
+
+class EventRecord:
+    """精简的事件记录 - 使用__slots__避免每条记录一个__dict__"""
+    __slots__ = ("seq", "timestamp", "kind", "sign_id", "detail")
+
+    def __init__(self, seq: int, timestamp: float, kind: str, sign_id: Optional[int], detail: str):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.kind = kind
+        self.sign_id = sign_id
+        self.detail = detail
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "seq": self.seq,
+            "timestamp": self.timestamp,
+            "kind": self.kind,
+            "sign_id": self.sign_id,
+            "detail": self.detail,
+        }
+
+
+# 事件类名 -> 记录类型
+EVENT_KINDS = {
+    "QREvent": "qr",
+    "ResolvedEvent": "resolved",
+    "CrowdedEvent": "crowded",
+    "SignClosedEvent": "closed",
+    "ReconnectEvent": "reconnect",
+    "SignsFoundEvent": "signs",
+    "StatusEvent": "status",
+    "ErrorEvent": "error",
+    "EngineStoppedEvent": "stopped",
+}
+
+DETAIL_LIMIT = 120  # 单条记录详情最大长度
+
+
+class EventHistory:
+    """固定容量的事件环形缓冲区 - 内存占用与运行时长无关"""
+
+    def __init__(self, capacity: int = 1024):
+        self.capacity = capacity
+        self._ring: List[Optional[EventRecord]] = [None] * capacity
+        self._next_seq = 0
+        self._lock = threading.Lock()
+
+    def handle(self, event: Any) -> None:
+        """引擎输出端入口"""
+        kind = EVENT_KINDS.get(type(event).__name__)
+        if kind is None:
+            return
+        self.record(kind, getattr(event, "sign_id", None), _detail(event),
+                    getattr(event, "timestamp", None))
+
+    def record(self, kind: str, sign_id: Optional[int] = None, detail: str = "",
+               timestamp: Optional[float] = None) -> None:
+        with self._lock:
+            seq = self._next_seq
+            self._ring[seq % self.capacity] = EventRecord(
+                seq, timestamp or time.time(), kind, sign_id, detail[:DETAIL_LIMIT])
+            self._next_seq = seq + 1
+
+    def __len__(self) -> int:
+        return min(self._next_seq, self.capacity)
+
+    def page(self, before: Optional[int] = None, limit: int = 50,
+             kind: Optional[str] = None) -> Dict[str, Any]:
+        """从新到旧分页；before为上一页返回的next_before"""
+        limit = max(1, min(limit, self.capacity))
+        with self._lock:
+            newest = self._next_seq - 1
+            oldest = max(0, self._next_seq - self.capacity)
+            seq = newest if before is None else min(before - 1, newest)
+            records = []
+            while seq >= oldest and len(records) < limit:
+                record = self._ring[seq % self.capacity]
+                if kind is None or record.kind == kind:
+                    records.append(record.to_dict())
+                seq -= 1
+        return {
+            "records": records,
+            "next_before": seq + 1 if seq >= oldest else None,
+            "total_recorded": self._next_seq,
+            "capacity": self.capacity,
+        }
+
+
+def _detail(event: Any) -> str:
+    for attr in ("url", "message", "reason", "transport"):
+        value = getattr(event, attr, None)
+        if value:
+            return str(value)
+    signs = getattr(event, "signs", None)
+    if signs:
+        return ",".join(str(item.get("signId")) for item in signs)
+    return ""
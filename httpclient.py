@@ -0,0 +1,254 @@
+import asyncio
+import socket
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, Tuple, Union, Deque, List
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NewConnectionError
+from urllib3.util.connection import allowed_gai_family
+from urllib3.util.ssl_ import create_urllib3_context
+from ratelimit import limiter
+from deadline import Deadline
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = (5.0, 10.0)  # (连接超时, 读取超时)
+DNS_TTL = 300.0
+PER_HOST_LIMIT = 8
+# long-polling的/meta/connect会挂起到poll_timeout+10秒，单独限额，不占用普通请求的并发名额
+LONG_POLL_LIMIT = 32
+LATENCY_WINDOW = 256
+
+Timeout = Union[float, Tuple[float, float]]
+
+
+class _DNSCache:
+    """getaddrinfo结果缓存，避免每个新连接都做一次DNS解析"""
+
+    def __init__(self, ttl: float = DNS_TTL):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._cache: Dict[Tuple[str, int, int], Tuple[float, List[Any]]] = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host: str, port: int, family: int) -> List[Any]:
+        key = (host, port, family)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry and entry[0] > now:
+                self.hits += 1
+                return entry[1]
+        infos = socket.getaddrinfo(host, port, family, socket.SOCK_STREAM)
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = (now + self.ttl, infos)
+        return infos
+
+
+class HostStats:
+    """单个主机的请求统计"""
+    __slots__ = ("requests", "errors", "new_connections", "latencies")
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.new_connections = 0
+        self.latencies: Deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def to_dict(self) -> Dict[str, Any]:
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2) if ordered else None
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "new_connections": self.new_connections,
+            "reuse_ratio": round(1 - self.new_connections / self.requests, 3) if self.requests else None,
+            "latency_ms": {"p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99)},
+        }
+
+
+class _CachedDNSConnection:
+    """urllib3连接的混入类：新建TCP连接时走所属HttpClient的DNS缓存，并统计新建连接数
+
+    只作用于HttpClient自己的连接池，不影响进程中其他使用urllib3的代码。
+    """
+    http_client: "HttpClient"
+
+    def _new_conn(self):
+        dns_host = self._dns_host
+        host = dns_host.strip("[]")
+        self.http_client._on_new_connection(host)
+        try:
+            infos = self.http_client.dns.resolve(host, self.port, allowed_gai_family())
+        except socket.gaierror:
+            return super()._new_conn()
+
+        # 依次尝试解析到的地址，建立连接和错误包装仍由urllib3完成
+        error = None
+        try:
+            for _, _, _, _, sockaddr in infos:
+                self._dns_host = sockaddr[0]
+                try:
+                    return super()._new_conn()
+                except (NewConnectionError, ConnectTimeoutError) as e:
+                    error = e
+        finally:
+            self._dns_host = dns_host
+        if error is not None:
+            raise error
+        return super()._new_conn()
+
+
+class _SharedContextAdapter(HTTPAdapter):
+    """所有连接共用一个SSLContext，避免每个连接重新加载证书；连接经由http_client的DNS缓存建立
+
+    共享的只是上下文，不做TLS会话恢复：新连接仍是完整握手，握手次数靠keep-alive复用连接来减少。
+    """
+
+    def __init__(self, ssl_context, http_client: "HttpClient", **kwargs):
+        self._ssl_context = ssl_context
+        self._http_client = http_client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["ssl_context"] = self._ssl_context
+        super().init_poolmanager(*args, **kwargs)
+        attrs = {"http_client": self._http_client}
+        http_connection = type("CachedDNSHTTPConnection", (_CachedDNSConnection, HTTPConnection), attrs)
+        https_connection = type("CachedDNSHTTPSConnection", (_CachedDNSConnection, HTTPSConnection), attrs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": type("CachedDNSHTTPConnectionPool", (HTTPConnectionPool,),
+                         {"ConnectionCls": http_connection}),
+            "https": type("CachedDNSHTTPSConnectionPool", (HTTPSConnectionPool,),
+                          {"ConnectionCls": https_connection}),
+        }
+
+
+class HttpClient:
+    """共享的HTTP传输层 - keep-alive连接池、DNS缓存、每主机并发上限和统一超时
+
+    同步接口供线程中调用，异步接口(aget/apost)在专用线程池中执行，不阻塞事件循环。
+    long-polling请求另有每主机的并发上限，挂起的长连接不会挤占普通请求。
+    """
+
+    def __init__(self, per_host_limit: int = PER_HOST_LIMIT, timeout: Timeout = DEFAULT_TIMEOUT,
+                 long_poll_limit: int = LONG_POLL_LIMIT):
+        self.per_host_limit = per_host_limit
+        self.long_poll_limit = long_poll_limit
+        self.timeout = timeout
+        self.dns = _DNSCache()
+        self.hosts: Dict[str, HostStats] = {}
+        self._host_slots: Dict[Tuple[str, bool], threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=per_host_limit * 2, thread_name_prefix="http")
+
+        ssl_context = create_urllib3_context()
+        ssl_context.load_default_certs()
+        self.session = requests.Session()
+        adapter = _SharedContextAdapter(ssl_context, self, pool_connections=8,
+                                        pool_maxsize=per_host_limit + long_poll_limit)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def _host(self, host: str, long_poll: bool = False) -> Tuple[HostStats, threading.BoundedSemaphore]:
+        with self._lock:
+            stats = self.hosts.get(host)
+            if stats is None:
+                stats = self.hosts[host] = HostStats()
+            slot = self._host_slots.get((host, long_poll))
+            if slot is None:
+                limit = self.long_poll_limit if long_poll else self.per_host_limit
+                slot = self._host_slots[(host, long_poll)] = threading.BoundedSemaphore(limit)
+            return stats, slot
+
+    def _on_new_connection(self, host: str) -> None:
+        current = getattr(self._local, "host", None)
+        if current == host:
+            self._host(host)[0].new_connections += 1
+
+    def request(self, method: str, url: str, timeout: Optional[Timeout] = None,
+                rate_class: Optional[str] = None, deadline: Optional[Deadline] = None,
+                stage: Optional[str] = None, long_poll: bool = False, **kwargs) -> requests.Response:
+        """发送请求（同步）；指定rate_class时先经过进程级限流；long_poll的请求使用单独的并发上限
+
+        指定deadline时，限流排队最多等到截止时间，排队之后用剩余预算作为超时（不超过timeout），
+        预算已耗尽时不再发送。
+        """
+        if deadline is not None:
+            stage = stage or rate_class or "http"
+        if rate_class:
+            queued = limiter.acquire(rate_class, timeout=deadline.remaining() if deadline else None)
+            if queued is None:
+                # 排队期间预算用完：拿到令牌时结果也已经过期
+                raise deadline.exceeded(stage)
+        timeout = timeout or self.timeout
+        if deadline is not None:
+            connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+            budget = deadline.timeout(stage, cap=read)
+            timeout = (min(connect, budget), budget)
+        host = urlsplit(url).hostname or ""
+        stats, slot = self._host(host, long_poll)
+        with slot:
+            self._local.host = host
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except requests.Timeout as e:
+                stats.errors += 1
+                if deadline is not None and deadline.expired():
+                    raise deadline.exceeded(stage) from e
+                raise
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                self._local.host = None
+                stats.requests += 1
+            stats.latencies.append(time.perf_counter() - start)
+            return response
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    async def arequest(self, method: str, url: str, **kwargs) -> requests.Response:
+        """发送请求（异步），在专用线程池中执行"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, lambda: self.request(method, url, **kwargs))
+
+    async def aget(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("GET", url, **kwargs)
+
+    async def apost(self, url: str, **kwargs) -> requests.Response:
+        return await self.arequest("POST", url, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        """每主机的请求数、连接复用率和延迟分位数"""
+        with self._lock:
+            hosts = {host: stats.to_dict() for host, stats in self.hosts.items()}
+        total = sum(h["requests"] for h in hosts.values())
+        new = sum(h["new_connections"] for h in hosts.values())
+        return {
+            "hosts": hosts,
+            "reuse_ratio": round(1 - new / total, 3) if total else None,
+            "dns": {"hits": self.dns.hits, "misses": self.dns.misses},
+        }
+
+
+# 进程内共享的HTTP客户端
+client = HttpClient()
@@ -0,0 +1,229 @@
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, Set, Any, Deque
+from events import Sink, EngineEvent, QREvent, SignClosedEvent, EngineStoppedEvent
+
+logger = logging.getLogger(__name__)
+
+ALL_SIGNS = None  # 订阅所有签到
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class Subscription:
+    """单个订阅者的有界队列 - 队列满时丢弃最旧的事件"""
+
+    def __init__(self, hub: "BroadcastHub", sign_id: Optional[int], maxsize: int,
+                 loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.hub = hub
+        self.sign_id = sign_id
+        self.queue: Deque[EngineEvent] = deque(maxlen=maxsize)
+        self.dropped = 0
+        self.delivered = 0
+        self.max_depth = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._loop = loop
+        self._async_ready: Optional[asyncio.Event] = asyncio.Event() if loop else None
+
+    def put(self, event: EngineEvent) -> None:
+        """投递事件（由hub在引擎线程中调用，从不阻塞）"""
+        with self._lock:
+            if len(self.queue) == self.queue.maxlen:
+                self.dropped += 1
+            self.queue.append(event)
+            self.delivered += 1
+            if len(self.queue) > self.max_depth:
+                self.max_depth = len(self.queue)
+        self._ready.set()
+        if self._async_ready is not None:
+            if self._loop is _running_loop():
+                self._async_ready.set()
+                return
+            try:
+                self._loop.call_soon_threadsafe(self._async_ready.set)
+            except RuntimeError:
+                # 订阅者的事件循环已关闭
+                self.close()
+
+    def _pop(self) -> Optional[EngineEvent]:
+        with self._lock:
+            if self.queue:
+                return self.queue.popleft()
+            self._ready.clear()
+            if self._async_ready is not None:
+                self._async_ready.clear()
+            return None
+
+    def get(self, timeout: Optional[float] = None) -> Optional[EngineEvent]:
+        """阻塞获取下一个事件，超时或已关闭返回None（用于普通线程）"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            event = self._pop()
+            if event is not None:
+                return event
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return None
+            self._ready.wait(remaining)
+        return None
+
+    async def aget(self, timeout: Optional[float] = None) -> Optional[EngineEvent]:
+        """异步获取下一个事件（订阅时需要传入loop）"""
+        if self._async_ready is None:
+            raise RuntimeError("该订阅不是异步订阅")
+        while not self.closed:
+            event = self._pop()
+            if event is not None:
+                return event
+            try:
+                await asyncio.wait_for(self._async_ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        return None
+
+    def close(self) -> None:
+        """取消订阅"""
+        if self.closed:
+            return
+        self.closed = True
+        self._ready.set()
+        self.hub.unsubscribe(self)
+
+    def depth(self) -> int:
+        return len(self.queue)
+
+
+class BroadcastHub(Sink):
+    """进程内广播中心 - 一个上游订阅按signId扇出给多个消费者"""
+
+    def __init__(self, maxsize: int = 16):
+        self.maxsize = maxsize
+        self.subscribers: Dict[Optional[int], Set[Subscription]] = {}
+        self.latest: Dict[int, QREvent] = {}
+        self.published = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, sign_id: Optional[int] = ALL_SIGNS, maxsize: Optional[int] = None,
+                  loop: Optional[asyncio.AbstractEventLoop] = None,
+                  replay_latest: bool = True) -> Subscription:
+        """订阅某个签到（sign_id为None时订阅全部），新订阅者会立即收到当前二维码"""
+        sub = Subscription(self, sign_id, maxsize or self.maxsize, loop)
+        with self._lock:
+            self.subscribers.setdefault(sign_id, set()).add(sub)
+            latest = list(self.latest.values()) if sign_id is ALL_SIGNS else \
+                [self.latest[sign_id]] if sign_id in self.latest else []
+        if replay_latest:
+            for event in latest:
+                sub.put(event)
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            subs = self.subscribers.get(sub.sign_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    del self.subscribers[sub.sign_id]
+
+    def close_all(self) -> int:
+        """关闭全部订阅（引擎被替换时调用），返回关闭的数量；阻塞在get中的消费者立即返回"""
+        with self._lock:
+            subs = [s for group in self.subscribers.values() for s in group]
+        for sub in subs:
+            sub.close()
+        return len(subs)
+
+    def handle(self, event: EngineEvent) -> None:
+        """引擎输出端入口 - 按signId扇出，没有signId的事件广播给所有订阅者"""
+        sign_id = getattr(event, "sign_id", None)
+        with self._lock:
+            if isinstance(event, QREvent):
+                self.latest[event.sign_id] = event
+            elif isinstance(event, SignClosedEvent):
+                # 签到结束后不再向新订阅者回放它的码
+                self.latest.pop(event.sign_id, None)
+            elif isinstance(event, EngineStoppedEvent):
+                self.latest.clear()
+            if sign_id is None:
+                targets = [s for subs in self.subscribers.values() for s in subs]
+            else:
+                targets = list(self.subscribers.get(sign_id, ())) + \
+                    list(self.subscribers.get(ALL_SIGNS, ()))
+        self.published += 1
+        for sub in targets:
+            sub.put(event)
+
+    def stats(self) -> Dict[str, Any]:
+        """订阅者数量、队列深度和丢弃数"""
+        with self._lock:
+            subs = [s for group in self.subscribers.values() for s in group]
+        depths = [s.depth() for s in subs]
+        return {
+            "subscribers": len(subs),
+            "published": self.published,
+            "max_depth": max(depths, default=0),
+            "peak_depth": max((s.max_depth for s in subs), default=0),
+            "total_depth": sum(depths),
+            "dropped": sum(s.dropped for s in subs),
+        }
+
+
+async def _benchmark(subscribers: int = 500, events: int = 200, slow_every: int = 10) -> None:
+    """合成负载：大量订阅者下的扇出延迟和队列深度"""
+    loop = asyncio.get_running_loop()
+    hub = BroadcastHub(maxsize=16)
+    latencies = []
+    received = [0] * subscribers
+
+    async def consumer(index: int, sub: Subscription) -> None:
+        slow = slow_every and index % slow_every == 0
+        while True:
+            event = await sub.aget(timeout=2.0)
+            if event is None:
+                return
+            latencies.append(time.perf_counter() - event.timestamp)
+            received[index] += 1
+            if slow:
+                await asyncio.sleep(0.05)  # 慢消费者
+
+    subs = [hub.subscribe(sign_id=1, loop=loop) for _ in range(subscribers)]
+    tasks = [asyncio.create_task(consumer(i, s)) for i, s in enumerate(subs)]
+
+    fanout = []
+    for i in range(events):
+        event = QREvent(1, f"https://example.invalid/qr/{i}", timestamp=time.perf_counter())
+        start = time.perf_counter()
+        hub.handle(event)
+        fanout.append(time.perf_counter() - start)
+        await asyncio.sleep(0.001)
+
+    stats = hub.stats()
+    await asyncio.gather(*tasks)
+    latencies.sort()
+    fanout.sort()
+
+    def pct(values, p):
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+    print(f"订阅者: {subscribers}, 事件: {events}, 慢消费者: 每{slow_every}个中1个")
+    print(f"单次扇出耗时 p50={pct(fanout, 0.5):.3f}ms p99={pct(fanout, 0.99):.3f}ms")
+    print(f"投递延迟 p50={pct(latencies, 0.5):.3f}ms p99={pct(latencies, 0.99):.3f}ms "
+          f"max={pct(latencies, 1.0):.3f}ms")
+    print(f"峰值队列深度: {stats['peak_depth']}, 丢弃事件: {stats['dropped']}, "
+          f"最少接收: {min(received)}, 最多接收: {max(received)}")
+    for sub in subs:
+        sub.close()
+
+
+if __name__ == '__main__':
+    asyncio.run(_benchmark())
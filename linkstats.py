@@ -0,0 +1,115 @@
+import time
+from collections import deque
+from typing import Optional, Dict, Any, Deque
+
+RTT_WINDOW = 128
+EWMA_ALPHA = 0.2
+HEARTBEAT_TIMEOUT = 5.0  # 心跳超过这个时间没有回复视为丢失（秒）
+RTT_THRESHOLD = 1.0  # RTT移动平均超过这个值视为链路劣化（秒）
+MAX_MISSED = 3  # 连续丢失多少个心跳后主动重连
+MIN_SAMPLES = 5  # 至少多少个RTT样本后才按RTT判断劣化
+
+
+class LinkStats:
+    """单条连接的心跳统计 - 按id匹配/meta/connect的回复，计算RTT和链路质量评分"""
+
+    def __init__(self, heartbeat_timeout: float = HEARTBEAT_TIMEOUT,
+                 rtt_threshold: float = RTT_THRESHOLD, max_missed: int = MAX_MISSED):
+        self.heartbeat_timeout = heartbeat_timeout
+        self.rtt_threshold = rtt_threshold
+        self.max_missed = max_missed
+        self.pending: Dict[str, float] = {}
+        self.samples: Deque[float] = deque(maxlen=RTT_WINDOW)
+        self.outcomes: Deque[bool] = deque(maxlen=RTT_WINDOW)  # 最近心跳是否收到回复
+        self.rtt_ewma: Optional[float] = None
+        self.sent = 0
+        self.replied = 0
+        self.lost = 0
+        self.consecutive_lost = 0
+        self.swaps = 0
+        self.last_reply_at: Optional[float] = None
+        self._connection_replies = 0
+
+    def on_sent(self, message_id: str, now: Optional[float] = None) -> None:
+        self.pending[message_id] = now or time.monotonic()
+        self.sent += 1
+
+    def on_reply(self, message_id: str, now: Optional[float] = None) -> Optional[float]:
+        """记录心跳回复，返回RTT（秒）；未知或已判定丢失的id返回None"""
+        sent_at = self.pending.pop(message_id, None)
+        if sent_at is None:
+            return None
+        now = now or time.monotonic()
+        rtt = now - sent_at
+        self.samples.append(rtt)
+        self.outcomes.append(True)
+        self.rtt_ewma = rtt if self.rtt_ewma is None else \
+            EWMA_ALPHA * rtt + (1 - EWMA_ALPHA) * self.rtt_ewma
+        self.replied += 1
+        self.consecutive_lost = 0
+        self.last_reply_at = now
+        self._connection_replies += 1
+        return rtt
+
+    def expire(self, now: Optional[float] = None) -> int:
+        """把超时未回复的心跳记为丢失，返回本次新增的丢失数"""
+        now = now or time.monotonic()
+        expired = [mid for mid, sent_at in self.pending.items() if now - sent_at > self.heartbeat_timeout]
+        for mid in expired:
+            del self.pending[mid]
+            self.outcomes.append(False)
+        self.lost += len(expired)
+        self.consecutive_lost += len(expired)
+        return len(expired)
+
+    def degraded(self, now: Optional[float] = None) -> Optional[str]:
+        """链路是否需要主动重连，需要时返回原因
+
+        当前连接还没收到过任何心跳回复时不做判断（服务端可能根本不回复心跳）。
+        """
+        self.expire(now)
+        if self._connection_replies == 0:
+            return None
+        if self.consecutive_lost >= self.max_missed:
+            return f"连续{self.consecutive_lost}个心跳无回复"
+        if len(self.samples) >= MIN_SAMPLES and self.rtt_ewma > self.rtt_threshold:
+            return f"RTT过高({self.rtt_ewma * 1000:.0f}ms)"
+        return None
+
+    def new_connection(self) -> None:
+        """切换到新连接后重新评估：清空未回复的心跳和RTT平均值，保留累计计数"""
+        self.pending.clear()
+        self.consecutive_lost = 0
+        self.rtt_ewma = None
+        self.samples.clear()
+        self._connection_replies = 0
+
+    def score(self) -> Optional[float]:
+        """链路质量评分 0~1：最近心跳的回复率 × RTT因子（RTT达到阈值两倍时为0）"""
+        if not self.outcomes:
+            return None
+        delivery = sum(self.outcomes) / len(self.outcomes)
+        rtt_factor = 1.0 if self.rtt_ewma is None else \
+            max(0.0, 1.0 - self.rtt_ewma / (2 * self.rtt_threshold))
+        return round(delivery * rtt_factor, 3)
+
+    def status(self) -> Dict[str, Any]:
+        ordered = sorted(self.samples)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2) if ordered else None
+
+        return {
+            "rtt_ms": {
+                "ewma": round(self.rtt_ewma * 1000, 2) if self.rtt_ewma is not None else None,
+                "p50": pct(0.5), "p90": pct(0.9), "p99": pct(0.99),
+            },
+            "score": self.score(),
+            "sent": self.sent,
+            "replied": self.replied,
+            "lost": self.lost,
+            "pending": len(self.pending),
+            "swaps": self.swaps,
+            "since_last_reply": round(time.monotonic() - self.last_reply_at, 3)
+            if self.last_reply_at is not None else None,
+        }
@@ -0,0 +1,188 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import time
+from typing import Optional
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s'
+# 热路径日志可通过extra附带的结构化字段
+EXTRA_FIELDS = ("sign_id", "stage", "latency_ms")
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """每条日志一行JSON，带上sign_id/stage/latency_ms等结构化字段"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        for key in EXTRA_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """把记录放进队列，时间、文本/JSON格式化和写出留给后台线程
+
+    标准QueueHandler会在调用线程里按格式化器完整格式化一遍；这里只在调用线程把
+    msg % args拼成消息（args可能是调用方之后还会修改的可变对象，必须按调用时的值记录），
+    有异常信息时预先生成traceback文本（traceback对象不能跨线程安全保留）。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level: int = logging.INFO, json_path: Optional[str] = None,
+                  force: bool = False) -> None:
+    """配置全局日志：调用线程只入队，格式化和写出在后台线程完成
+
+    json_path（或环境变量WEICLASS_LOG_JSON）指定时额外输出JSON lines。
+    多个入口重复调用时只生效一次，force=True时重新配置。
+    """
+    global _listener
+    if _listener is not None and not force:
+        return
+    stop_logging()
+
+    text_handler = logging.StreamHandler()
+    text_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+    handlers = [text_handler]
+
+    json_path = json_path or os.getenv("WEICLASS_LOG_JSON")
+    if json_path:
+        json_handler = logging.FileHandler(json_path, encoding="utf-8")
+        json_handler.setFormatter(JsonLinesFormatter())
+        handlers.append(json_handler)
+
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    root.setLevel(level)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """停止后台线程并写出队列中剩余的日志"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+atexit.register(stop_logging)
+
+
+async def _burst(messages: int) -> float:
+    """向本地Faye替身连续推送二维码，返回全部处理完的耗时（秒）"""
+    import asyncio
+    from fayestub import FayeStub
+    from getSocket import TeacherMateWebSocketClient
+    import ratelimit
+
+    ratelimit.limiter.enabled = False
+    stub = FayeStub(poll_timeout=5.0)
+    await stub.start()
+    received = []
+    client = TeacherMateWebSocketClient(4343, qr_callback=received.append,
+                                        ws_url=stub.ws_url, http_url=stub.http_url)
+    client.client_id = "bench-log"
+    task = asyncio.create_task(client.start())
+    await asyncio.sleep(0.3)
+
+    start = time.perf_counter()
+    for i in range(messages):
+        await stub.publish(4343, {"type": 1, "qrUrl": f"https://stub.invalid/qr?n={i}"})
+    while len(received) < messages and time.perf_counter() - start < 20:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    await client.graceful_shutdown()
+    await asyncio.gather(task, return_exceptions=True)
+    await stub.stop()
+    return elapsed
+
+
+class _SlowStream:
+    """模拟阻塞的输出（慢终端、网络盘）：每次写入耗时delay秒"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    def write(self, text: str) -> None:
+        time.sleep(self.delay)
+
+    def flush(self) -> None:
+        pass
+
+
+def _configure(mode: str, stream) -> None:
+    stop_logging()
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(logging.INFO)
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonLinesFormatter())
+    if mode == "sync":
+        root.addHandler(handler)
+        return
+    global _listener
+    log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    root.addHandler(_DeferredQueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+
+
+def _benchmark(messages: int = 2000, calls: int = 5000) -> None:
+    """比较同步写日志和队列日志：事件循环线程上单次日志调用的耗时，以及一次消息突发的总处理时间
+
+    分别使用快速输出（/dev/null）和每次写入阻塞0.2ms的慢输出。
+    """
+    import asyncio
+
+    logger = logging.getLogger("bench")
+    devnull = open(os.devnull, "w")
+    for sink_name, stream in (("快速输出", devnull), ("慢输出0.2ms", _SlowStream(0.0002))):
+        for mode in ("sync", "queue"):
+            _configure(mode, stream)
+            start = time.perf_counter()
+            for i in range(calls):
+                logger.info("获取到二维码URL: %.50s...", "https://stub.invalid/qr",
+                            extra={"sign_id": i, "stage": "qr"})
+            per_call = (time.perf_counter() - start) / calls * 1e6
+            burst = asyncio.run(_burst(messages))
+            stop_logging()
+            print(f"{sink_name} {mode:>5}: 每次调用 {per_call:.2f}us, "
+                  f"{messages}条消息突发 {burst * 1000:.1f}ms")
+    devnull.close()
+
+
+if __name__ == '__main__':
+    _benchmark()
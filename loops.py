@@ -0,0 +1,153 @@
+import asyncio
+import os
+import sys
+import time
+import logging
+from typing import Callable, Coroutine, Any, Optional, List, Dict
+
+logger = logging.getLogger(__name__)
+
+# 事件循环实现：asyncio、uvloop、auto（有uvloop就用）；由WEICLASS_LOOP选择
+DEFAULT_BACKEND = "asyncio"
+BACKENDS = ("asyncio", "uvloop")
+
+
+def _uvloop_factory() -> Optional[Callable[[], asyncio.AbstractEventLoop]]:
+    try:
+        import uvloop
+    except ImportError:
+        return None
+    return uvloop.new_event_loop
+
+
+def loop_factory(backend: Optional[str] = None) -> Callable[[], asyncio.AbstractEventLoop]:
+    """返回创建事件循环的函数；请求uvloop但未安装时退回标准asyncio"""
+    backend = backend or os.getenv("WEICLASS_LOOP", DEFAULT_BACKEND)
+    if backend in ("auto", "uvloop"):
+        factory = _uvloop_factory()
+        if factory is not None:
+            return factory
+        if backend == "uvloop":
+            logger.warning("未安装uvloop，使用标准asyncio事件循环")
+    return asyncio.new_event_loop
+
+
+def backend_name(loop: asyncio.AbstractEventLoop) -> str:
+    return "uvloop" if type(loop).__module__.startswith("uvloop") else "asyncio"
+
+
+def new_event_loop(backend: Optional[str] = None) -> asyncio.AbstractEventLoop:
+    """创建事件循环（供在线程中自行驱动循环的代码使用）"""
+    loop = loop_factory(backend)()
+    logger.debug(f"事件循环: {backend_name(loop)}")
+    return loop
+
+
+def run(coro: Coroutine[Any, Any, Any], backend: Optional[str] = None) -> Any:
+    """asyncio.run的替代，使用配置的事件循环实现"""
+    if sys.version_info >= (3, 11):
+        with asyncio.Runner(loop_factory=loop_factory(backend)) as runner:
+            return runner.run(coro)
+
+    # 3.11之前没有asyncio.Runner：自己创建循环，结束时按asyncio.run的顺序清理
+    loop = new_event_loop(backend)
+    try:
+        asyncio.set_event_loop(loop)
+        return loop.run_until_complete(coro)
+    finally:
+        try:
+            _cancel_all_tasks(loop)
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            if hasattr(loop, "shutdown_default_executor"):
+                loop.run_until_complete(loop.shutdown_default_executor())
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+def _cancel_all_tasks(loop: asyncio.AbstractEventLoop) -> None:
+    """取消循环中剩余的任务并等待它们结束（与asyncio.run退出时相同）"""
+    tasks = [task for task in asyncio.all_tasks(loop) if not task.done()]
+    if not tasks:
+        return
+    for task in tasks:
+        task.cancel()
+    loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+    for task in tasks:
+        if not task.cancelled() and task.exception() is not None:
+            loop.call_exception_handler({
+                "message": "loops.run()关闭时任务抛出了未处理的异常",
+                "exception": task.exception(),
+                "task": task,
+            })
+
+
+async def _measure(messages: int, heartbeat: float, duration: float) -> Dict[str, Any]:
+    """在当前循环上测量消息吞吐和心跳抖动（本地Faye替身）"""
+    from fayestub import FayeStub
+    from getSocket import TeacherMateWebSocketClient
+    import ratelimit
+
+    ratelimit.limiter.enabled = False
+    stub = FayeStub(poll_timeout=5.0)
+    await stub.start()
+
+    received: List[float] = []
+    client = TeacherMateWebSocketClient(4242, qr_callback=lambda url: received.append(time.perf_counter()),
+                                        ws_url=stub.ws_url, http_url=stub.http_url)
+    client.client_id = "bench-loop"
+    client.wait_time = heartbeat
+    client.proactive_reconnect = False
+
+    # 记录心跳实际发出时间
+    beats: List[float] = []
+    send = client._send
+
+    async def timed_send(message: str) -> None:
+        if "/meta/connect" in message:
+            beats.append(time.perf_counter())
+        await send(message)
+
+    client._send = timed_send
+    task = asyncio.create_task(client.start())
+    await asyncio.sleep(0.3)
+
+    # 吞吐：连续推送，统计全部到达的耗时
+    received.clear()
+    start = time.perf_counter()
+    for i in range(messages):
+        await stub.publish(4242, {"type": 1, "qrUrl": f"https://stub.invalid/qr?n={i}"})
+    while len(received) < messages and time.perf_counter() - start < 10:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+
+    # 心跳抖动：空闲一段时间后看心跳间隔偏离设定值多少
+    beats.clear()
+    await asyncio.sleep(duration)
+    gaps = sorted(abs((b - a) - heartbeat) for a, b in zip(beats, beats[1:]))
+
+    await client.graceful_shutdown()
+    await asyncio.gather(task, return_exceptions=True)
+    await stub.stop()
+    return {
+        "loop": backend_name(asyncio.get_running_loop()),
+        "delivered": len(received),
+        "msgs_per_s": round(len(received) / elapsed) if elapsed else None,
+        "jitter_ms_p50": round(gaps[len(gaps) // 2] * 1000, 3) if gaps else None,
+        "jitter_ms_p99": round(gaps[min(len(gaps) - 1, int(len(gaps) * 0.99))] * 1000, 3) if gaps else None,
+    }
+
+
+def _benchmark(messages: int = 2000, heartbeat: float = 0.02, duration: float = 2.0) -> None:
+    """对每种可用的事件循环跑同一组测量"""
+    logging.getLogger("getSocket").setLevel(logging.WARNING)
+    for backend in BACKENDS:
+        if backend == "uvloop" and _uvloop_factory() is None:
+            print("uvloop: 未安装，跳过")
+            continue
+        print(run(_measure(messages, heartbeat, duration), backend=backend))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    _benchmark()
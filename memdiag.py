@@ -0,0 +1,309 @@
+import asyncio
+import gc
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+import logging
+from collections import Counter, deque
+from typing import Optional, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+# 每条分配记录保留的调用栈深度：1层时分配变慢约4倍，10层时约40倍（见_benchmark）；
+# 需要按调用栈（key=traceback）分组时用WEICLASS_MEMDIAG_FRAMES调大
+FRAMES = int(os.getenv("WEICLASS_MEMDIAG_FRAMES", "1"))
+TOP = 20
+# 实例数不超过这个值的项目类才检查其容器属性（读取__dict__会让实例生成字典，不能对大量实例做）
+CONTAINER_SCAN_LIMIT = 64
+KEYS = ("lineno", "filename", "traceback")
+DUMP_DIR = os.getenv("WEICLASS_MEMDIAG_DIR", ".")
+# 除项目自己的类以外，额外统计这些容易越积越多的类型（事件循环另按AbstractEventLoop子类统计）
+WATCHED_TYPES = {
+    "_asyncio.Task", "_asyncio.Future", "asyncio.queues.Queue", "queue.Queue", "_queue.SimpleQueue",
+    "collections.deque", "threading.Thread", "wx._core.Bitmap", "wx._core.Image",
+}
+# 分配统计中排除tracemalloc本身和导入机制
+_TRACE_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+)
+
+
+def _short_path(path: str) -> str:
+    """项目内的文件用相对路径，第三方库从site-packages之后开始"""
+    if path.startswith(PROJECT_DIR + os.sep):
+        return os.path.relpath(path, PROJECT_DIR)
+    for marker in ("site-packages" + os.sep, "lib" + os.sep + "python"):
+        index = path.rfind(marker)
+        if index >= 0:
+            return path[index + len(marker):]
+    return path
+
+
+def _site(traceback: tracemalloc.Traceback) -> str:
+    frame = traceback[-1] if len(traceback) else None
+    return f"{_short_path(frame.filename)}:{frame.lineno}" if frame else "?"
+
+
+def _stat_entry(stat, key: str) -> Dict[str, Any]:
+    entry = {
+        "site": _site(stat.traceback),
+        "size_kb": round(stat.size / 1024, 1),
+        "count": stat.count,
+    }
+    if hasattr(stat, "size_diff"):
+        entry["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+        entry["count_diff"] = stat.count_diff
+    if key == "traceback":
+        entry["stack"] = [f"{_short_path(frame.filename)}:{frame.lineno}" for frame in stat.traceback]
+    return entry
+
+
+def _project_module(module: str) -> bool:
+    target = sys.modules.get(module)
+    path = getattr(target, "__file__", None)
+    return bool(path) and os.path.dirname(os.path.abspath(path)) == PROJECT_DIR
+
+
+def _label(cls: type) -> Optional[str]:
+    """需要统计的类型返回显示名，其余返回None"""
+    module = getattr(cls, "__module__", "") or ""
+    name = f"{module}.{cls.__qualname__}"
+    if name in WATCHED_TYPES:
+        return name
+    if issubclass(cls, asyncio.AbstractEventLoop):
+        return name
+    if module == "__main__" or _project_module(module):
+        return cls.__qualname__ if module != "__main__" else name
+    return None
+
+
+def object_counts(containers: int = TOP) -> Tuple[Dict[str, int], Dict[str, int], List[Dict[str, Any]]]:
+    """按类型统计存活的对象：(各类型数量, 队列类对象中积压的元素数, 项目对象上最大的容器属性)
+
+    只看垃圾回收器跟踪的对象；项目类的实例、任务、队列、事件循环都在其中。
+    """
+    labels: Dict[type, Optional[str]] = {}
+    counts: Counter = Counter()
+    backlog: Counter = Counter()
+    samples: Dict[str, List[Any]] = {}
+    for obj in gc.get_objects():
+        cls = type(obj)
+        if cls not in labels:
+            labels[cls] = _label(cls)
+        label = labels[cls]
+        if label is None:
+            continue
+        counts[label] += 1
+        qsize = getattr(cls, "qsize", None)
+        if qsize is not None:
+            try:
+                backlog[label] += obj.qsize()
+            except Exception:
+                pass
+        kept = samples.setdefault(label, [])
+        if len(kept) <= CONTAINER_SCAN_LIMIT:
+            kept.append(obj)
+
+    # 实例少的长生命周期对象（引擎、管道、hub、窗口管理器）上的列表、字典、集合：
+    # 客户端列表、任务集合、缓存之类的增长在这里能看到
+    largest: List[Tuple[int, str]] = []
+    for label, objects in samples.items():
+        if len(objects) > CONTAINER_SCAN_LIMIT:
+            continue
+        for obj in objects:
+            attributes = getattr(obj, "__dict__", None)
+            if not isinstance(attributes, dict):
+                continue
+            for attr, value in list(attributes.items()):
+                if isinstance(value, (list, dict, set, tuple, deque)) and len(value):
+                    largest.append((len(value), f"{label}.{attr}"))
+    largest.sort(reverse=True)
+    return dict(counts), dict(backlog), [{"container": name, "len": size} for size, name in largest[:containers]]
+
+
+class MemoryDiagnostics:
+    """内存诊断 - tracemalloc快照与基线比较，加上项目对象的存活数量
+
+    基线在开始跟踪时建立，之后每次报告都与基线比较，reset=True时以本次为新基线。
+    没有开启tracemalloc时仍然报告对象数量，只是没有分配位置。
+    """
+
+    def __init__(self, frames: int = FRAMES):
+        self.frames = frames
+        self.baseline: Optional[tracemalloc.Snapshot] = None
+        self.baseline_counts: Dict[str, int] = {}
+        self.baseline_at: Optional[float] = None
+        self.reports = 0
+        self._lock = threading.Lock()
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    def start(self) -> None:
+        """开始跟踪分配并建立基线（已在跟踪时只重建基线）"""
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            logger.info(f"内存诊断已开启（tracemalloc，栈深度{self.frames}）")
+        self.reset_baseline()
+
+    def stop(self) -> None:
+        with self._lock:
+            tracemalloc.stop()
+            self.baseline = None
+
+    def _snapshot(self) -> Optional[tracemalloc.Snapshot]:
+        if not tracemalloc.is_tracing():
+            return None
+        return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+    def reset_baseline(self) -> None:
+        with self._lock:
+            self.baseline = self._snapshot()
+            self.baseline_counts = object_counts()[0]
+            self.baseline_at = time.time()
+
+    def report(self, top: int = TOP, key: str = "lineno", reset: bool = False) -> Dict[str, Any]:
+        """当前内存情况与基线的差异"""
+        if key not in KEYS:
+            raise ValueError(f"key必须是{', '.join(KEYS)}之一")
+        with self._lock:
+            started = time.perf_counter()
+            gc.collect()
+            counts, backlog, containers = object_counts()
+            report: Dict[str, Any] = {
+                "pid": os.getpid(),
+                "time": time.time(),
+                "tracing": tracemalloc.is_tracing(),
+                "baseline_age_s": round(time.time() - self.baseline_at, 1) if self.baseline_at else None,
+                "gc": {"counts": gc.get_count(), "garbage": len(gc.garbage)},
+                "objects": {
+                    label: {"count": count, "diff": count - self.baseline_counts.get(label, 0)}
+                    for label, count in sorted(counts.items(), key=lambda item: -item[1])
+                },
+                "queue_backlog": backlog,
+                "containers": containers,
+            }
+            snapshot = self._snapshot()
+            if snapshot is not None:
+                current, peak = tracemalloc.get_traced_memory()
+                report["traced_kb"] = round(current / 1024, 1)
+                report["peak_kb"] = round(peak / 1024, 1)
+                report["tracemalloc_overhead_kb"] = round(tracemalloc.get_tracemalloc_memory() / 1024, 1)
+                report["top_sites"] = [_stat_entry(stat, key) for stat in snapshot.statistics(key)[:top]]
+                if self.baseline is not None:
+                    report["top_growth"] = [_stat_entry(stat, key)
+                                            for stat in snapshot.compare_to(self.baseline, key)[:top]]
+            if reset:
+                self.baseline = snapshot
+                self.baseline_counts = counts
+                self.baseline_at = time.time()
+            self.reports += 1
+            report["report_ms"] = round((time.perf_counter() - started) * 1000, 1)
+            return report
+
+    def dump(self, top: int = TOP, key: str = "lineno") -> str:
+        """把报告写入JSON文件并在日志中输出摘要，返回文件路径"""
+        report = self.report(top=top, key=key)
+        path = os.path.join(DUMP_DIR, f"memdiag-{report['pid']}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=1)
+        growing = [f"{label} {item['diff']:+d}" for label, item in report["objects"].items() if item["diff"]][:5]
+        logger.info(f"内存诊断已写入 {path}；对象数量变化: {', '.join(growing) or '无'}")
+        for entry in report.get("top_growth", [])[:5]:
+            logger.info(f"  {entry['site']}: {entry['size_diff_kb']:+.1f}KB ({entry['count_diff']:+d})")
+        return path
+
+
+# 进程内共享
+diagnostics = MemoryDiagnostics()
+
+
+def enable_from_env() -> bool:
+    """WEICLASS_MEMDIAG=1（或config.ini中[server] memdiag = 1）时启动时就开始跟踪"""
+    if os.getenv("WEICLASS_MEMDIAG") == "1":
+        diagnostics.start()
+        return True
+    return False
+
+
+def dump_signal() -> Optional[int]:
+    """触发转储的信号：有SIGUSR1用SIGUSR1，Windows上用SIGBREAK（Ctrl+Break）"""
+    return getattr(signal, "SIGUSR1", None) or getattr(signal, "SIGBREAK", None)
+
+
+def install_signal_handler() -> Optional[int]:
+    """注册转储信号，返回信号编号
+
+    第一次收到信号时若还没在跟踪，则开始跟踪并建立基线（只输出对象数量）；之后每次输出与基线的差异。
+    快照和统计在后台线程中进行，不阻塞信号所在的主线程。
+    """
+    signum = dump_signal()
+    if signum is None:
+        return None
+
+    def handler(signum, frame):
+        def run():
+            try:
+                if not diagnostics.tracing:
+                    diagnostics.start()
+                    logger.info("已开始跟踪内存分配，再次发送信号输出与现在相比的差异")
+                diagnostics.dump()
+            except Exception as e:
+                logger.error(f"内存诊断转储失败: {e}")
+
+        threading.Thread(target=run, name="MemDiagDump", daemon=True).start()
+
+    signal.signal(signum, handler)
+    return signum
+
+
+_leaked: List[Any] = []
+
+
+def _leak(n: int) -> None:
+    from engine import QREvent
+
+    for i in range(n):
+        _leaked.append(QREvent(4711, f"https://stub.invalid/qr?n={i}"))
+
+
+def _benchmark() -> None:
+    """跟踪开销（热路径用例在tracemalloc关闭/开启时的耗时）和一次模拟泄漏的定位结果"""
+    import bench
+
+    logging.disable(logging.CRITICAL)
+    import ratelimit
+    ratelimit.limiter.enabled = False
+
+    cases = [bench.CASES[name] for name in ("heartbeat.message", "status.get_status")]
+    for frames in (0, 1, 10):
+        if frames:
+            tracemalloc.start(frames)
+        results = bench.measure(cases, samples=9)
+        tracemalloc.stop()
+        label = f"栈深度{frames}" if frames else "关闭"
+        print(f"tracemalloc {label:>6}: " + ", ".join(
+            f"{name} {sorted(samples)[len(samples) // 2] * 1e6:.2f}us" for name, samples in results.items()))
+
+    diagnostics_ = MemoryDiagnostics()
+    diagnostics_.start()
+    _leak(5000)
+    report = diagnostics_.report(top=3)
+    diagnostics_.stop()
+    print(f"模拟泄漏5000个QREvent（栈深度{diagnostics_.frames}），报告耗时 {report['report_ms']}ms")
+    print(f"  对象: QREvent {report['objects'].get('QREvent')}")
+    for entry in report["top_growth"]:
+        print(f"  增长: {entry['site']} {entry['size_diff_kb']:+.1f}KB ({entry['count_diff']:+d})")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,525 @@
+import re
+import time
+import zlib
+import struct
+import logging
+from functools import lru_cache
+from typing import List, Tuple, Dict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 纠错等级M（与qrcode.constants.ERROR_CORRECT_M编号相同，写入格式信息）
+ECC_M = 0
+MAX_VERSION = 40
+# 与qrcode.QRCode.add_data的默认值相同：至少这么长的数字/字母数字串才单独分段
+OPTIMIZE = 20
+
+MODE_NUMBER = 1
+MODE_ALPHA_NUM = 2
+MODE_BYTE = 4
+ALPHA_NUM = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:"
+NUMBER_LENGTH = {3: 10, 2: 7, 1: 4}
+PAD_BYTES = (0xEC, 0x11)
+
+# 纠错等级M各版本的分块：(每块纠错码字数, ((块数, 每块数据码字数), ...))
+RS_BLOCKS_M = (
+    (10, ((1, 16),)), (16, ((1, 28),)), (26, ((1, 44),)), (18, ((2, 32),)),
+    (24, ((2, 43),)), (16, ((4, 27),)), (18, ((4, 31),)), (22, ((2, 38), (2, 39))),
+    (22, ((3, 36), (2, 37))), (26, ((4, 43), (1, 44))), (30, ((1, 50), (4, 51))), (22, ((6, 36), (2, 37))),
+    (22, ((8, 37), (1, 38))), (24, ((4, 40), (5, 41))), (24, ((5, 41), (5, 42))), (28, ((7, 45), (3, 46))),
+    (28, ((10, 46), (1, 47))), (26, ((9, 43), (4, 44))), (26, ((3, 44), (11, 45))), (26, ((3, 41), (13, 42))),
+    (26, ((17, 42),)), (28, ((17, 46),)), (28, ((4, 47), (14, 48))), (28, ((6, 45), (14, 46))),
+    (28, ((8, 47), (13, 48))), (28, ((19, 46), (4, 47))), (28, ((22, 45), (3, 46))), (28, ((3, 45), (23, 46))),
+    (28, ((21, 45), (7, 46))), (28, ((19, 47), (10, 48))), (28, ((2, 46), (29, 47))), (28, ((10, 46), (23, 47))),
+    (28, ((14, 46), (21, 47))), (28, ((14, 46), (23, 47))), (28, ((12, 47), (26, 48))), (28, ((6, 47), (34, 48))),
+    (28, ((29, 46), (14, 47))), (28, ((13, 46), (32, 47))), (28, ((40, 47), (7, 48))), (28, ((18, 47), (31, 48))),
+)
+
+# 类定位图形：1011101两侧接4个浅色模块
+FINDER_LIKE = np.array([1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0], dtype=bool)
+
+_NUM_RE = re.compile(rb"\d{%d,}" % OPTIMIZE)
+_ALPHA_NUM_RE = re.compile(b"[" + re.escape(ALPHA_NUM) + b"]{%d,}" % OPTIMIZE)
+_ALPHA_NUM_INDEX = np.full(256, -1, dtype=np.int64)
+_ALPHA_NUM_INDEX[np.frombuffer(ALPHA_NUM, dtype=np.uint8)] = np.arange(len(ALPHA_NUM))
+
+
+def _gf_tables() -> Tuple[np.ndarray, np.ndarray]:
+    """GF(256)的指数表和对数表（本原多项式0x11d）"""
+    exp = np.zeros(512, dtype=np.int64)
+    log = np.zeros(256, dtype=np.int64)
+    x = 1
+    for i in range(255):
+        exp[i] = x
+        log[x] = i
+        x <<= 1
+        if x & 0x100:
+            x ^= 0x11D
+    exp[255:510] = exp[:255]
+    return exp, log
+
+
+GF_EXP, GF_LOG = _gf_tables()
+
+
+def _split(data: bytes, pattern: "re.Pattern[bytes]") -> List[Tuple[bool, bytes]]:
+    parts = []
+    while data:
+        match = pattern.search(data)
+        if not match:
+            break
+        if match.start():
+            parts.append((False, data[:match.start()]))
+        parts.append((True, data[match.start():match.end()]))
+        data = data[match.end():]
+    if data:
+        parts.append((False, data))
+    return parts
+
+
+def segments(data: bytes) -> List[Tuple[int, bytes]]:
+    """按qrcode.util.optimal_data_chunks的规则分段：长数字串用数字模式，长字母数字串用字母数字模式，其余字节模式"""
+    if not data:
+        return []
+    if len(data) <= OPTIMIZE:
+        if data.isdigit():
+            return [(MODE_NUMBER, data)]
+        if all(_ALPHA_NUM_INDEX[byte] >= 0 for byte in data):
+            return [(MODE_ALPHA_NUM, data)]
+        return [(MODE_BYTE, data)]
+    result = []
+    for is_num, chunk in _split(data, _NUM_RE):
+        if is_num:
+            result.append((MODE_NUMBER, chunk))
+            continue
+        for is_alpha, sub_chunk in _split(chunk, _ALPHA_NUM_RE):
+            result.append((MODE_ALPHA_NUM if is_alpha else MODE_BYTE, sub_chunk))
+    return result
+
+
+def _length_bits(mode: int, version: int) -> int:
+    """字符计数指示符的位数"""
+    size = 0 if version < 10 else 1 if version < 27 else 2
+    return {MODE_NUMBER: (10, 12, 14), MODE_ALPHA_NUM: (9, 11, 13), MODE_BYTE: (8, 16, 16)}[mode][size]
+
+
+def _payload(mode: int, chunk: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """一个分段的数据部分：(值, 位数)数组"""
+    raw = np.frombuffer(chunk, dtype=np.uint8).astype(np.int64)
+    if mode == MODE_BYTE:
+        return raw, np.full(len(raw), 8, dtype=np.int64)
+    if mode == MODE_NUMBER:
+        digits = raw - ord("0")
+        full = len(digits) // 3 * 3
+        values = list(digits[:full].reshape(-1, 3) @ np.array([100, 10, 1]))
+        widths = [10] * len(values)
+        if len(digits) > full:
+            values.append(int("".join(map(str, digits[full:]))))
+            widths.append(NUMBER_LENGTH[len(digits) - full])
+        return np.array(values, dtype=np.int64), np.array(widths, dtype=np.int64)
+    index = _ALPHA_NUM_INDEX[raw]
+    full = len(index) // 2 * 2
+    values = list(index[:full].reshape(-1, 2) @ np.array([45, 1]))
+    widths = [11] * len(values)
+    if len(index) > full:
+        values.append(int(index[-1]))
+        widths.append(6)
+    return np.array(values, dtype=np.int64), np.array(widths, dtype=np.int64)
+
+
+def _to_bits(values: np.ndarray, widths: np.ndarray) -> np.ndarray:
+    """把(值, 位数)序列展开成比特数组，高位在前"""
+    ends = np.cumsum(widths)
+    shifts = np.repeat(ends, widths) - 1 - np.arange(ends[-1] if len(ends) else 0)
+    return ((np.repeat(values, widths) >> shifts) & 1).astype(np.uint8)
+
+
+def data_codewords(version: int) -> int:
+    ec, groups = RS_BLOCKS_M[version - 1]
+    return sum(count * data for count, data in groups)
+
+
+def choose_version(parts: List[Tuple[int, bytes]], min_version: int = 1) -> int:
+    """能容纳数据的最小版本（不小于min_version）"""
+    payload_bits = sum(int(_payload(mode, chunk)[1].sum()) for mode, chunk in parts)
+    for version in range(min_version, MAX_VERSION + 1):
+        needed = payload_bits + sum(4 + _length_bits(mode, version) for mode, _ in parts)
+        if needed <= data_codewords(version) * 8:
+            return version
+    raise ValueError("数据过长，超出二维码最大容量")
+
+
+def _data_bytes(parts: List[Tuple[int, bytes]], version: int) -> np.ndarray:
+    """数据码字：模式头、数据、终止符和填充字节"""
+    values, widths = [], []
+    for mode, chunk in parts:
+        values += [mode, len(chunk)]
+        widths += [4, _length_bits(mode, version)]
+        payload_values, payload_widths = _payload(mode, chunk)
+        values += list(payload_values)
+        widths += list(payload_widths)
+    bits = _to_bits(np.array(values, dtype=np.int64), np.array(widths, dtype=np.int64))
+
+    capacity = data_codewords(version)
+    terminator = min(capacity * 8 - len(bits), 4)
+    bits = np.concatenate([bits, np.zeros(terminator + (-(len(bits) + terminator)) % 8, dtype=np.uint8)])
+    codewords = np.packbits(bits)
+    return np.concatenate([codewords, np.resize(np.array(PAD_BYTES, dtype=np.uint8), capacity - len(codewords))])
+
+
+@lru_cache(maxsize=None)
+def _generator(ec: int) -> np.ndarray:
+    """纠错码生成多项式(x-α^0)...(x-α^(ec-1))除首项外系数的对数"""
+    poly = np.array([1], dtype=np.int64)
+    for i in range(ec):
+        shifted = np.append(poly, 0)
+        product = np.where(poly != 0, GF_EXP[(GF_LOG[poly] + i) % 255], 0)
+        shifted[1:] ^= product
+        poly = shifted
+    return GF_LOG[poly[1:]]
+
+
+def _ec_codewords(blocks: np.ndarray, ec: int) -> np.ndarray:
+    """所有块同时做Reed-Solomon编码（前面补零不改变余数，较短的块左侧补零）"""
+    generator = _generator(ec)
+    remainder = np.zeros((len(blocks), ec), dtype=np.int64)
+    for column in blocks.T:
+        factor = column ^ remainder[:, 0]
+        remainder[:, :-1] = remainder[:, 1:]
+        remainder[:, -1] = 0
+        product = GF_EXP[GF_LOG[factor][:, None] + generator[None, :]]
+        remainder ^= np.where(factor[:, None] != 0, product, 0)
+    return remainder
+
+
+def _interleave(blocks: List[np.ndarray]) -> np.ndarray:
+    width = max(len(block) for block in blocks)
+    table = np.full((len(blocks), width), -1, dtype=np.int64)
+    for i, block in enumerate(blocks):
+        table[i, :len(block)] = block
+    flat = table.T.ravel()
+    return flat[flat >= 0]
+
+
+def codewords(parts: List[Tuple[int, bytes]], version: int) -> np.ndarray:
+    """最终码字序列：分块、纠错、交织"""
+    data = _data_bytes(parts, version).astype(np.int64)
+    ec, groups = RS_BLOCKS_M[version - 1]
+    sizes = [size for count, size in groups for _ in range(count)]
+    offsets = np.cumsum([0] + sizes)
+    blocks = [data[offsets[i]:offsets[i + 1]] for i in range(len(sizes))]
+
+    padded = np.zeros((len(blocks), max(sizes)), dtype=np.int64)
+    for i, block in enumerate(blocks):
+        padded[i, padded.shape[1] - len(block):] = block
+    ec_blocks = _ec_codewords(padded, ec)
+    return np.concatenate([_interleave(blocks), _interleave(list(ec_blocks))]).astype(np.uint8)
+
+
+def _bch(data: int, generator: int, shift: int) -> int:
+    value = data << shift
+    while value.bit_length() > generator.bit_length() - 1:
+        value ^= generator << (value.bit_length() - generator.bit_length())
+    return (data << shift) | value
+
+
+def format_bits(mask: int) -> int:
+    return _bch((ECC_M << 3) | mask, 0b10100110111, 10) ^ 0b101010000010010
+
+
+def _alignment_positions(version: int) -> List[int]:
+    if version == 1:
+        return []
+    count = version // 7 + 2
+    last = version * 4 + 10
+    step = 26 if version == 32 else (version * 4 + count * 2 + 1) // (count * 2 - 2) * 2
+    return [6] + [last - i * step for i in reversed(range(count - 1))]
+
+
+def _format_positions(size: int) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int]]]:
+    """格式信息第i位的两个位置（与qrcode.main.QRCode.setup_type_info一致）"""
+    vertical = [(i, 8) if i < 6 else (i + 1, 8) if i < 8 else (size - 15 + i, 8) for i in range(15)]
+    horizontal = [(8, size - i - 1) if i < 8 else (8, 15 - i) if i < 9 else (8, 15 - i - 1) for i in range(15)]
+    return vertical, horizontal
+
+
+class Layout:
+    """某个版本固定不变的部分：功能图形、保留区域、数据模块的放置顺序和8种掩码"""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.size = size = version * 4 + 17
+        template = np.zeros((size, size), dtype=bool)
+        reserved = np.zeros((size, size), dtype=bool)
+
+        finder = np.ones((7, 7), dtype=bool)
+        finder[1:6, 1:6] = False
+        finder[2:5, 2:5] = True
+        for row, col in ((0, 0), (size - 7, 0), (0, size - 7)):
+            reserved[max(row - 1, 0):row + 8, max(col - 1, 0):col + 8] = True
+            template[row:row + 7, col:col + 7] = finder
+
+        alignment = np.ones((5, 5), dtype=bool)
+        alignment[1:4, 1:4] = False
+        alignment[2, 2] = True
+        positions = _alignment_positions(version)
+        for row in positions:
+            for col in positions:
+                if reserved[row, col]:
+                    continue
+                reserved[row - 2:row + 3, col - 2:col + 3] = True
+                template[row - 2:row + 3, col - 2:col + 3] = alignment
+
+        timing = np.arange(8, size - 8)
+        free = timing[~reserved[timing, 6]]
+        template[free, 6] = free % 2 == 0
+        reserved[free, 6] = True
+        free = timing[~reserved[6, timing]]
+        template[6, free] = free % 2 == 0
+        reserved[6, free] = True
+
+        # 格式信息、版本信息和固定暗模块：选掩码时保持浅色，最后再写入
+        self.format_positions = _format_positions(size)
+        for positions_ in self.format_positions:
+            rows, cols = zip(*positions_)
+            reserved[rows, cols] = True
+        reserved[size - 8, 8] = True
+        if version >= 7:
+            reserved[:6, size - 11:size - 8] = True
+            reserved[size - 11:size - 8, :6] = True
+
+        self.template = template
+        self.reserved = reserved
+        self.order = self._placement_order()
+        rows, cols = np.indices((size, size))
+        masks = np.stack([
+            (rows + cols) % 2 == 0,
+            rows % 2 == 0,
+            cols % 3 == 0,
+            (rows + cols) % 3 == 0,
+            (rows // 2 + cols // 3) % 2 == 0,
+            (rows * cols) % 2 + (rows * cols) % 3 == 0,
+            ((rows * cols) % 2 + (rows * cols) % 3) % 2 == 0,
+            ((rows * cols) % 3 + (rows + cols) % 2) % 2 == 0,
+        ])
+        self.masks = masks & ~reserved
+
+    def _placement_order(self) -> np.ndarray:
+        """数据模块的之字形放置顺序（扁平下标）"""
+        size = self.size
+        order = []
+        row, step = size - 1, -1
+        for col in range(size - 1, 0, -2):
+            if col <= 6:
+                col -= 1
+            while 0 <= row < size:
+                for c in (col, col - 1):
+                    if not self.reserved[row, c]:
+                        order.append(row * size + c)
+                row += step
+            row -= step
+            step = -step
+        return np.array(order, dtype=np.int64)
+
+
+@lru_cache(maxsize=MAX_VERSION)
+def layout(version: int) -> Layout:
+    return Layout(version)
+
+
+def _run_penalty(lines: np.ndarray) -> np.ndarray:
+    """连续5个及以上同色模块：长度为n的连续段计n-2分
+
+    每个长度为n的段包含n-4个长度为5的窗口，再为段的起点补2分。
+    """
+    same = lines[..., 1:] == lines[..., :-1]
+    windows = same[..., :-3] & same[..., 1:-2] & same[..., 2:-1] & same[..., 3:]
+    starts = np.concatenate([np.ones(lines.shape[:-1] + (1,), dtype=bool), ~same[..., :lines.shape[-1] - 5]], axis=-1)
+    return windows.sum(axis=(-2, -1)) + 2 * (windows & starts).sum(axis=(-2, -1))
+
+
+def _finder_penalty(lines: np.ndarray) -> np.ndarray:
+    """类定位图形（1:1:3:1:1）每处40分"""
+    width = lines.shape[-1] - 10
+    forward = np.ones(lines.shape[:-1] + (width,), dtype=bool)
+    backward = forward.copy()
+    for k, dark in enumerate(FINDER_LIKE):
+        window = lines[..., k:k + width]
+        forward &= window if dark else ~window
+        backward &= window if FINDER_LIKE[10 - k] else ~window
+    return 40 * (forward | backward).sum(axis=(-2, -1))
+
+
+def penalty(candidates: np.ndarray) -> np.ndarray:
+    """同时给多个候选矩阵（形状(k, n, n)）打分，规则与qrcode.util.lost_point相同"""
+    columns = candidates.swapaxes(-2, -1)
+    score = _run_penalty(candidates) + _run_penalty(columns)
+
+    corner = candidates[..., :-1, :-1]
+    blocks = (corner == candidates[..., :-1, 1:]) & (corner == candidates[..., 1:, :-1]) \
+        & (corner == candidates[..., 1:, 1:])
+    score += 3 * blocks.sum(axis=(-2, -1))
+
+    score += _finder_penalty(candidates) + _finder_penalty(columns)
+
+    size = candidates.shape[-1]
+    percent = candidates.sum(axis=(-2, -1)).astype(np.float64) / (size * size)
+    score += (np.abs(percent * 100 - 50) / 5).astype(np.int64) * 10
+    return score
+
+
+def encode(data, min_version: int = 1) -> np.ndarray:
+    """生成模块矩阵（布尔数组，不含边框），与qrcode.QRCode(version=min_version, fit=True)相同
+
+    8种掩码同时计算并打分，选分数最低的（相同时取编号小的）。
+    """
+    if not isinstance(data, bytes):
+        data = str(data).encode("utf-8")
+    parts = segments(data)
+    version = choose_version(parts, min_version)
+    layout_ = layout(version)
+    size = layout_.size
+
+    bits = np.unpackbits(codewords(parts, version))
+    placed = np.zeros(size * size, dtype=bool)
+    count = min(len(bits), len(layout_.order))
+    placed[layout_.order[:count]] = bits[:count].astype(bool)
+
+    candidates = (layout_.template | placed.reshape(size, size))[None] ^ layout_.masks
+    mask = int(np.argmin(penalty(candidates)))
+
+    matrix = candidates[mask]
+    info = format_bits(mask)
+    for positions in layout_.format_positions:
+        for i, (row, col) in enumerate(positions):
+            matrix[row, col] = (info >> i) & 1
+    matrix[size - 8, 8] = True
+    if version >= 7:
+        number = _bch(version, 0b1111100100101, 12)
+        for i in range(18):
+            matrix[i // 3, i % 3 + size - 11] = matrix[i % 3 + size - 11, i // 3] = (number >> i) & 1
+    return matrix
+
+
+def pixels(matrix: np.ndarray, box_size: int, border: int) -> np.ndarray:
+    """放大成像素（True为深色），四周加border个模块的浅色边框"""
+    framed = np.pad(matrix, border)
+    return np.repeat(np.repeat(framed, box_size, axis=0), box_size, axis=1)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+
+def to_png(matrix: np.ndarray, box_size: int, border: int) -> bytes:
+    """1位灰度PNG（与PIL的"1"模式输出相同的像素），不依赖PIL"""
+    image = pixels(matrix, box_size, border)
+    height, width = image.shape
+    rows = np.packbits(~image, axis=1)
+    scanlines = np.hstack([np.zeros((height, 1), dtype=np.uint8), rows]).tobytes()
+    return b"".join((
+        b"\x89PNG\r\n\x1a\n",
+        _png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 1, 0, 0, 0, 0)),
+        # 大块纯色的1位图像在级别6已压到最小，级别9只会多花几倍时间
+        _png_chunk(b"IDAT", zlib.compress(scanlines, 6)),
+        _png_chunk(b"IEND", b""),
+    ))
+
+
+def to_svg(matrix: np.ndarray, box_size: int, border: int) -> bytes:
+    """SVG路径，每行相邻的深色模块合并成一个矩形；尺寸与qrcode的SvgPathImage相同（box_size/10毫米每模块）"""
+    framed = np.pad(matrix, border)
+    size = framed.shape[0]
+    edges = np.diff(np.pad(framed.astype(np.int8), ((0, 0), (1, 1))), axis=1)
+    starts = np.argwhere(edges == 1)
+    ends = np.argwhere(edges == -1)[:, 1]
+    path = "".join(f"M{col},{row}h{end - col}v1h-{end - col}z" for (row, col), end in zip(starts.tolist(), ends.tolist()))
+    mm = size * box_size / 10
+    return (f"<?xml version='1.0' encoding='UTF-8'?>\n"
+            f'<svg width="{mm:g}mm" height="{mm:g}mm" version="1.1" viewBox="0 0 {size} {size}" '
+            f'xmlns="http://www.w3.org/2000/svg"><path d="{path}" fill="#000"/></svg>').encode("utf-8")
+
+
+def _reference(data: str, min_version: int) -> np.ndarray:
+    import qrcode
+
+    qr = qrcode.QRCode(version=min_version, error_correction=qrcode.constants.ERROR_CORRECT_M, border=0)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+
+def _samples() -> List[Tuple[str, int]]:
+    """对照用的输入：二维码URL、各种长度、数字/字母数字分段、非ASCII，覆盖版本1到40"""
+    import random
+
+    rng = random.Random(20260101)
+    samples = [(f"https://www.teachermate.com.cn/api/v1/sign/qr?sign=bench{i:04d}&t=1700000000", 5)
+               for i in range(40)]
+    samples += [("", 1), ("0", 1), ("12345678901234567890123", 1), ("HELLO WORLD", 1),
+                ("https://X.Y/" + "A" * 30 + "?n=" + "9" * 25, 1), ("签到二维码", 1)]
+    alphabet = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789:/?&=.-_%"
+    for length in list(range(1, 120, 7)) + [200, 400, 800, 1200, 1800, 2300]:
+        samples.append(("".join(rng.choice(alphabet) for _ in range(length)), rng.choice((1, 1, 5))))
+        samples.append(("".join(rng.choice("0123456789") for _ in range(length)), 1))
+    return samples
+
+
+def _benchmark(rounds: int = 3) -> None:
+    """与qrcode对照：逐个比较模块矩阵，并比较生成矩阵和PNG的耗时"""
+    import os
+    import subprocess
+    import sys
+
+    mismatched = 0
+    versions = set()
+    samples = _samples()
+    for data, min_version in samples:
+        ours = encode(data, min_version)
+        versions.add((ours.shape[0] - 17) // 4)
+        reference = _reference(data, min_version)
+        if ours.shape != reference.shape or not np.array_equal(ours, reference):
+            mismatched += 1
+            print(f"不一致: {data[:40]!r} min_version={min_version}")
+    print(f"{len(samples)}个输入（版本{min(versions)}-{max(versions)}）与qrcode对照, 不一致 {mismatched}")
+
+    import qrimage
+    from PIL import Image
+    from io import BytesIO
+
+    url = samples[0][0]
+    reference_png = Image.open(BytesIO(qrimage.render(url, 0, "png", encoder="qrcode"))).convert("1")
+    ours_png = Image.open(BytesIO(qrimage.render(url, 0, "png", encoder="numpy"))).convert("1")
+    print(f"PNG像素一致: {np.array_equal(np.array(reference_png), np.array(ours_png))}")
+
+    urls = [data for data, _ in samples[:40]]
+    for label, func in (("矩阵", lambda url, encoder: encode(url, 5) if encoder == "numpy" else _reference(url, 5)),
+                        ("PNG", lambda url, encoder: qrimage.render(url, 0, "png", encoder=encoder))):
+        timings: Dict[str, float] = {}
+        for encoder in ("qrcode", "numpy"):
+            best = float("inf")
+            for _ in range(rounds):
+                start = time.perf_counter()
+                for url in urls:
+                    func(url, encoder)
+                best = min(best, time.perf_counter() - start)
+            timings[encoder] = best / len(urls) * 1000
+        print(f"{label}: qrcode {timings['qrcode']:.2f}ms, numpy {timings['numpy']:.2f}ms, "
+              f"x{timings['qrcode'] / timings['numpy']:.1f}")
+
+    # 启动开销：新进程里导入并生成一个码
+    here = os.path.dirname(os.path.abspath(__file__))
+    for encoder in ("qrcode", "numpy"):
+        code = f"import qrimage; qrimage.render({url!r}, 0, 'png', encoder={encoder!r})"
+        best = float("inf")
+        for _ in range(rounds):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", code], cwd=here, check=True)
+            best = min(best, time.perf_counter() - start)
+        print(f"新进程导入并生成第一个码 {encoder}: {best * 1000:.0f}ms")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,212 @@
+import hashlib
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from io import BytesIO
+from typing import Optional, Dict, Any, Deque, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+DEFAULT_SIZE = 0  # 0表示按GUI的模块尺寸（box_size=12）渲染
+MIN_SIZE = 64
+MAX_SIZE = 2048
+SIZE_STEP = 32  # 请求的像素尺寸按这个粒度取整，避免任意尺寸撑爆缓存
+VERSION = 5  # 最小版本，URL较短时也保持相同的模块尺寸
+BOX_SIZE = 12
+BORDER = 4
+MAX_ENTRIES = 16  # 每次轮换通常只有一两种尺寸/格式，保留少量即可
+RENDER_WINDOW = 128
+# 编码器：qrcode（qrcode+PIL）或numpy（qrencode.py，不需要PIL）；由WEICLASS_QR_ENCODER选择
+DEFAULT_ENCODER = "qrcode"
+ENCODERS = ("qrcode", "numpy")
+
+
+def normalize_size(size: Optional[int]) -> int:
+    """把请求的像素尺寸规整到缓存粒度，0表示默认尺寸"""
+    if not size:
+        return DEFAULT_SIZE
+    size = max(MIN_SIZE, min(MAX_SIZE, size))
+    return (size + SIZE_STEP // 2) // SIZE_STEP * SIZE_STEP
+
+
+def etag_for(url: str, size: int, fmt: str) -> str:
+    """强ETag（不含引号）- 图片内容完全由(url, size, fmt)决定"""
+    return hashlib.sha1(f"{fmt}|{size}|{url}".encode("utf-8")).hexdigest()[:20]
+
+
+def encoder_name(encoder: Optional[str] = None) -> str:
+    """实际使用的编码器；请求numpy但未安装时退回qrcode"""
+    encoder = encoder or os.getenv("WEICLASS_QR_ENCODER", DEFAULT_ENCODER)
+    if encoder == "numpy":
+        try:
+            import numpy  # noqa: F401
+            return "numpy"
+        except ImportError:
+            logger.warning("未安装numpy，使用qrcode生成二维码")
+    return "qrcode"
+
+
+def _render_qrcode(url: str, size: int, fmt: str) -> bytes:
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(
+        version=VERSION,
+        error_correction=qrcode.constants.ERROR_CORRECT_M,
+        box_size=BOX_SIZE,
+        border=BORDER,
+    )
+    qr.add_data(url)
+    qr.make(fit=True)
+    if size:
+        qr.box_size = max(1, size // (qr.modules_count + 2 * BORDER))
+
+    buffer = BytesIO()
+    if fmt == "svg":
+        qr.make_image(image_factory=qrcode.image.svg.SvgPathImage).save(buffer)
+    else:
+        qr.make_image(fill_color="black", back_color="white").save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def _render_numpy(url: str, size: int, fmt: str) -> bytes:
+    import qrencode
+
+    matrix = qrencode.encode(url, VERSION)
+    box_size = max(1, size // (matrix.shape[0] + 2 * BORDER)) if size else BOX_SIZE
+    if fmt == "svg":
+        return qrencode.to_svg(matrix, box_size, BORDER)
+    return qrencode.to_png(matrix, box_size, BORDER)
+
+
+def render(url: str, size: int, fmt: str, encoder: Optional[str] = None) -> bytes:
+    """渲染二维码图片，参数与gui.QRDisplayApp.generate_qr_bitmap一致；两种编码器的模块矩阵相同"""
+    if encoder_name(encoder) == "numpy":
+        return _render_numpy(url, size, fmt)
+    return _render_qrcode(url, size, fmt)
+
+
+class RenderedImage:
+    __slots__ = ("body", "etag", "mimetype", "rendered_at")
+
+    def __init__(self, body: bytes, etag: str, mimetype: str):
+        self.body = body
+        self.etag = etag
+        self.mimetype = mimetype
+        self.rendered_at = time.time()
+
+
+class RenderCache:
+    """二维码图片缓存 - 按(url, size, fmt)缓存渲染结果，同一个码只渲染一次
+
+    多个请求同时要同一张未缓存的图时只有一个线程渲染，其余等待它的结果。
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, int, str], RenderedImage]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int, str], threading.Event] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # 等待其他线程渲染结果的请求数
+        self.evictions = 0
+        self.errors = 0
+        self.render_times: Deque[float] = deque(maxlen=RENDER_WINDOW)
+
+    def get(self, url: str, size: int, fmt: str) -> RenderedImage:
+        """取缓存的图片，没有时渲染；渲染失败抛出异常"""
+        key = (url, size, fmt)
+        while True:
+            with self._lock:
+                image = self._entries.get(key)
+                if image is not None:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return image
+                event = self._inflight.get(key)
+                if event is None:
+                    self._inflight[key] = threading.Event()
+                    self.misses += 1
+                    break
+                self.coalesced += 1
+            # 其他线程正在渲染同一张图；渲染失败时重新检查并自己渲染
+            event.wait()
+
+        try:
+            started = time.perf_counter()
+            body = render(url, size, fmt)
+            elapsed = time.perf_counter() - started
+            image = RenderedImage(body, etag_for(url, size, fmt), FORMATS[fmt])
+            with self._lock:
+                self.render_times.append(elapsed)
+                self._entries[key] = image
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            logger.debug(f"渲染二维码图片 {fmt} size={size} 耗时{elapsed * 1000:.1f}ms")
+            return image
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key).set()
+
+    def stats(self) -> Dict[str, Any]:
+        """命中率和渲染耗时"""
+        with self._lock:
+            ordered = sorted(self.render_times)
+            requests = self.hits + self.misses + self.coalesced
+
+            def pct(p):
+                return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2) if ordered else None
+
+            return {
+                "encoder": encoder_name(),
+                "entries": len(self._entries),
+                "bytes": sum(len(image.body) for image in self._entries.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "hit_rate": round((self.hits + self.coalesced) / requests, 4) if requests else None,
+                "render_ms": {"p50": pct(0.5), "p99": pct(0.99),
+                              "max": round(ordered[-1] * 1000, 2) if ordered else None},
+            }
+
+
+# 进程内共享的图片缓存
+cache = RenderCache()
+
+
+def _benchmark(viewers: int = 50, rotations: int = 5) -> None:
+    """多个观看者在每次轮换后同时取图：每次都渲染 vs 经过缓存"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    urls = [f"https://www.teachermate.com.cn/api/v1/sign/qr?sign=bench{i:04d}&t=1700000000" for i in range(rotations)]
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        for fmt in FORMATS:
+            start = time.perf_counter()
+            for url in urls:
+                list(pool.map(lambda _: render(url, DEFAULT_SIZE, fmt), range(viewers)))
+            uncached = time.perf_counter() - start
+
+            cache_ = RenderCache()
+            start = time.perf_counter()
+            for url in urls:
+                list(pool.map(lambda _: cache_.get(url, DEFAULT_SIZE, fmt), range(viewers)))
+            cached = time.perf_counter() - start
+            stats = cache_.stats()
+            print(f"{fmt}: 每次渲染 {uncached * 1000:.1f}ms, 缓存 {cached * 1000:.1f}ms, "
+                  f"渲染次数 {stats['misses']}, 命中率 {stats['hit_rate']}, "
+                  f"单次渲染p50 {stats['render_ms']['p50']}ms")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from typing import Optional, Dict, Any, Deque, List
+
+logger = logging.getLogger(__name__)
+
+# 上游请求类别，数字越小优先级越高
+SUBSCRIBE = "subscribe"  # 订阅、心跳、long-polling连接
+QR = "qr"                # 二维码跳转解析
+HANDSHAKE = "handshake"  # creatClientId握手
+POLL = "poll"            # active_signs轮询
+
+PRIORITY = {SUBSCRIBE: 0, QR: 0, HANDSHAKE: 1, POLL: 2}
+
+# (每秒令牌数, 桶容量)
+DEFAULT_RATES = {
+    SUBSCRIBE: (20.0, 20),
+    QR: (10.0, 10),
+    HANDSHAKE: (5.0, 5),
+    POLL: (2.0, 2),
+}
+GLOBAL_RATE = (20.0, 20)  # 所有类别共享的总预算
+WAIT_WINDOW = 256
+MAX_SLEEP = 0.05  # 被更高优先级挡住时的重试间隔
+
+
+class TokenBucket:
+    """令牌桶（调用方负责加锁）"""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """距离下一个令牌还要多久（已有令牌时为0）"""
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class ClassStats:
+    """单个类别的排队统计"""
+    __slots__ = ("acquired", "waiting", "timeouts", "total_wait", "max_wait", "waits")
+
+    def __init__(self):
+        self.acquired = 0
+        self.waiting = 0
+        self.timeouts = 0  # 排队超过调用方给的timeout而放弃的次数
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.waits: Deque[float] = deque(maxlen=WAIT_WINDOW)
+
+    def record(self, wait: float) -> None:
+        self.acquired += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.waits.append(wait)
+
+    def to_dict(self) -> Dict[str, Any]:
+        ordered = sorted(self.waits)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000, 2) if ordered else None
+
+        return {
+            "acquired": self.acquired,
+            "waiting": self.waiting,
+            "timeouts": self.timeouts,
+            "mean_wait_ms": round(self.total_wait / self.acquired * 1000, 2) if self.acquired else None,
+            "max_wait_ms": round(self.max_wait * 1000, 2),
+            "wait_ms": {"p50": pct(0.5), "p99": pct(0.99)},
+        }
+
+
+class RateLimiter:
+    """进程级上游限流 - 每个类别一个令牌桶，另有一个共享的总桶
+
+    总桶不足时按优先级放行：有更高优先级的请求在等总桶令牌时，低优先级请求让行。
+    线程中用acquire，事件循环中用aacquire（不阻塞循环）。
+    """
+
+    def __init__(self, rates: Optional[Dict[str, tuple]] = None, global_rate: tuple = GLOBAL_RATE):
+        rates = rates or DEFAULT_RATES
+        self.buckets = {name: TokenBucket(*rate) for name, rate in rates.items()}
+        self.total = TokenBucket(*global_rate)
+        self.stats = {name: ClassStats() for name in rates}
+        self.enabled = True
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+
+    def _try_acquire(self, name: str) -> float:
+        """尝试取令牌，成功返回0，否则返回建议等待时间（调用方持有锁）"""
+        now = time.monotonic()
+        bucket = self.buckets[name]
+        bucket.refill(now)
+        self.total.refill(now)
+        wait = bucket.delay()
+        if wait > 0:
+            return wait
+        priority = PRIORITY.get(name, len(PRIORITY))
+        for other, stats in self.stats.items():
+            if not stats.waiting or PRIORITY.get(other, len(PRIORITY)) >= priority:
+                continue
+            self.buckets[other].refill(now)
+            if self.buckets[other].delay() == 0:
+                # 更高优先级的请求正在等总桶，让它先走
+                return max(self.total.delay(), MAX_SLEEP)
+        wait = self.total.delay()
+        if wait > 0:
+            return wait
+        bucket.tokens -= 1
+        self.total.tokens -= 1
+        return 0.0
+
+    def acquire(self, name: str, timeout: Optional[float] = None) -> Optional[float]:
+        """阻塞直到拿到令牌，返回排队时间（秒）；timeout秒内拿不到时放弃并返回None"""
+        if not self.enabled or name not in self.buckets:
+            return 0.0
+        start = time.monotonic()
+        stats = self.stats[name]
+        with self._cond:
+            stats.waiting += 1
+            try:
+                while True:
+                    wait = self._try_acquire(name)
+                    if wait == 0:
+                        break
+                    if timeout is not None:
+                        left = timeout - (time.monotonic() - start)
+                        if left <= 0 or wait > left:
+                            # 等到下一个令牌也超出预算，不再排队
+                            stats.timeouts += 1
+                            self._cond.notify_all()
+                            return None
+                        wait = min(wait, left)
+                    self._cond.wait(min(wait, MAX_SLEEP))
+            finally:
+                stats.waiting -= 1
+            queued = time.monotonic() - start
+            stats.record(queued)
+            self._cond.notify_all()
+        return queued
+
+    async def aacquire(self, name: str, timeout: Optional[float] = None) -> Optional[float]:
+        """异步版本，在事件循环中等待令牌；timeout秒内拿不到时放弃并返回None"""
+        if not self.enabled or name not in self.buckets:
+            return 0.0
+        start = time.monotonic()
+        stats = self.stats[name]
+        with self._lock:
+            stats.waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    wait = self._try_acquire(name)
+                    if wait and timeout is not None:
+                        left = timeout - (time.monotonic() - start)
+                        if left <= 0 or wait > left:
+                            stats.timeouts += 1
+                            return None
+                        wait = min(wait, left)
+                if wait == 0:
+                    break
+                await asyncio.sleep(min(wait, MAX_SLEEP))
+        finally:
+            with self._cond:
+                stats.waiting -= 1
+                self._cond.notify_all()
+        queued = time.monotonic() - start
+        with self._lock:
+            stats.record(queued)
+        return queued
+
+    def status(self) -> Dict[str, Any]:
+        """各类别的排队延迟和当前令牌数"""
+        with self._lock:
+            now = time.monotonic()
+            result: Dict[str, Any] = {}
+            for name, stats in self.stats.items():
+                bucket = self.buckets[name]
+                bucket.refill(now)
+                result[name] = dict(stats.to_dict(), rate=bucket.rate,
+                                    tokens=round(bucket.tokens, 2))
+            self.total.refill(now)
+            return {"enabled": self.enabled, "global_tokens": round(self.total.tokens, 2),
+                    "global_rate": self.total.rate, "classes": result}
+
+
+# 进程内共享的限流器
+limiter = RateLimiter()
+
+
+def _benchmark(seconds: float = 3.0) -> None:
+    """多个线程同时按不同类别请求，比较排队延迟（高优先级应明显更低）"""
+    limiter_ = RateLimiter(global_rate=(10.0, 5))
+    stop = time.monotonic() + seconds
+
+    def worker(name: str) -> None:
+        while time.monotonic() < stop:
+            limiter_.acquire(name)
+
+    threads: List[threading.Thread] = [
+        threading.Thread(target=worker, args=(name,))
+        for name in (SUBSCRIBE, QR, HANDSHAKE, POLL, POLL, HANDSHAKE)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name, stats in limiter_.status()["classes"].items():
+        print(f"{name:10s} acquired={stats['acquired']:4d} mean_wait={stats['mean_wait_ms']}ms "
+              f"p99={stats['wait_ms']['p99']}ms")
+
+
+if __name__ == '__main__':
+    _benchmark()
@@ -0,0 +1,74 @@
+import json
+import threading
+import time
+import logging
+from typing import Optional, Any, Iterator, List
+
+logger = logging.getLogger(__name__)
+
+# 记录类型
+ACTIVE_SIGNS = "active_signs"  # active_signs接口的原始响应
+HANDSHAKE = "handshake"        # creatClientId的结果
+WS_IN = "ws_in"                # 收到的websocket帧
+WS_OUT = "ws_out"              # 发出的websocket帧
+LP_IN = "lp_in"                # long-polling响应
+LP_OUT = "lp_out"              # long-polling请求
+
+
+class Recorder:
+    """上游流量录制器 - 每帧一行紧凑JSON：[时间戳, 类型, signId, 内容]，只追加写入"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = 0
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def write(self, kind: str, payload: Any, sign_id: Optional[int] = None) -> None:
+        line = json.dumps([round(time.time(), 3), kind, sign_id, payload],
+                          ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            if self._file.closed:
+                return
+            self._file.write(line + "\n")
+            self.frames += 1
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+# 当前生效的录制器；为None时所有录制点只做一次判断，不产生额外开销
+active: Optional[Recorder] = None
+
+
+def enable(path: str) -> Recorder:
+    """开启录制（追加到path）"""
+    global active
+    if active is None or active.path != path:
+        if active is not None:
+            active.close()
+        active = Recorder(path)
+        logger.info(f"上游流量录制已开启: {path}")
+    return active
+
+
+def disable() -> None:
+    global active
+    if active is not None:
+        active.close()
+        active = None
+
+
+def read_frames(path: str) -> Iterator[List[Any]]:
+    """逐行读取录制文件，跳过损坏的行（例如进程被杀时写了一半）"""
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                logger.warning("跳过损坏的录制行")
@@ -0,0 +1,189 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import logging
+from typing import Dict, List, Tuple, Any, Optional
+from fayestub import FayeStub
+from recorder import read_frames, ACTIVE_SIGNS, HANDSHAKE, WS_IN, WS_OUT, LP_IN, LP_OUT
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_SIGNS_PATH = "/active_signs"
+
+
+class ReplayServer:
+    """回放录制的会话 - active_signs按录制时间线返回，二维码帧在订阅后按原始间隔推送
+
+    speed=1为原速，>1为加速，0为尽快回放（不等待）。
+    """
+
+    def __init__(self, path: str, speed: float = 1.0, host: str = "127.0.0.1",
+                 ws_port: int = 0, http_port: int = 0):
+        self.speed = speed
+        self.stub = FayeStub(host, ws_port, http_port, poll_timeout=5.0)
+        self.stub.get_routes[ACTIVE_SIGNS_PATH] = self._active_signs
+        self.stub.on_subscribe = self._on_subscribe
+        self.signs_responses: List[Tuple[float, str]] = []
+        self.sign_frames: Dict[int, List[Tuple[float, Dict[str, Any]]]] = {}
+        self.replay_tasks: List[asyncio.Task] = []
+        self.started = 0.0
+        self._signs_index = 0
+        self._load(path)
+
+    def _load(self, path: str) -> None:
+        frames = list(read_frames(path))
+        if not frames:
+            raise ValueError(f"录制文件为空: {path}")
+        t0 = frames[0][0]
+        subscribed_at: Dict[int, float] = {}
+        data: Dict[int, List[Tuple[float, Dict[str, Any]]]] = {}
+
+        for timestamp, kind, sign_id, payload in frames:
+            if kind == ACTIVE_SIGNS:
+                self.signs_responses.append((timestamp - t0, payload))
+            elif kind == HANDSHAKE and sign_id is not None:
+                subscribed_at.setdefault(sign_id, timestamp)
+            elif kind in (WS_OUT, LP_OUT) and sign_id is not None:
+                if "/meta/subscribe" in json.dumps(payload):
+                    subscribed_at[sign_id] = max(subscribed_at.get(sign_id, timestamp), timestamp)
+            elif kind in (WS_IN, LP_IN):
+                for channel, message_data in _data_messages(payload):
+                    target = int(channel.rsplit("/", 1)[1])
+                    data.setdefault(target, []).append((timestamp, message_data))
+
+        # 二维码帧相对订阅时间的偏移
+        for sign_id, items in data.items():
+            base = subscribed_at.get(sign_id, items[0][0])
+            self.sign_frames[sign_id] = [(max(0.0, t - base), d) for t, d in items]
+
+        logger.info(f"已加载录制: {len(self.signs_responses)} 次active_signs, "
+                     f"{sum(len(v) for v in self.sign_frames.values())} 个二维码帧")
+
+    def _active_signs(self) -> str:
+        """按时间线返回active_signs响应（在HTTP服务线程中调用）"""
+        if not self.signs_responses:
+            return "[]"
+        if self.speed <= 0:
+            # 尽快回放：每次请求返回下一条记录
+            index = min(self._signs_index, len(self.signs_responses) - 1)
+            self._signs_index += 1
+            return self.signs_responses[index][1]
+        elapsed = (time.monotonic() - self.started) * self.speed
+        current = self.signs_responses[0][1]
+        for offset, body in self.signs_responses:
+            if offset > elapsed:
+                break
+            current = body
+        return current
+
+    def _on_subscribe(self, channel: str) -> None:
+        try:
+            sign_id = int(channel.rsplit("/", 1)[1])
+        except ValueError:
+            return
+        if sign_id in self.sign_frames:
+            self.replay_tasks.append(asyncio.create_task(self._replay_sign(sign_id)))
+
+    async def _replay_sign(self, sign_id: int) -> None:
+        start = time.monotonic()
+        for offset, data in self.sign_frames[sign_id]:
+            if self.speed > 0:
+                delay = start + offset / self.speed - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            await self.stub.publish(sign_id, data)
+
+    async def start(self) -> None:
+        await self.stub.start()
+        self.started = time.monotonic()
+
+    async def stop(self) -> None:
+        for task in self.replay_tasks:
+            task.cancel()
+        await asyncio.gather(*self.replay_tasks, return_exceptions=True)
+        await self.stub.stop()
+
+    def environ(self) -> Dict[str, str]:
+        """把客户端指向回放服务器所需的环境变量"""
+        return {
+            "ACTIVE_SIGNS_URL": f"http://{self.stub.host}:{self.stub.http_port}{ACTIVE_SIGNS_PATH}",
+            "FAYE_URL": self.stub.http_url,
+            "FAYE_WS_URL": self.stub.ws_url,
+        }
+
+
+def _data_messages(payload: Any):
+    """从录制的帧中取出 (channel, data)"""
+    try:
+        messages = json.loads(payload) if isinstance(payload, str) else payload
+    except json.JSONDecodeError:
+        return
+    if not isinstance(messages, list):
+        return
+    for message in messages:
+        channel = message.get("channel", "") if isinstance(message, dict) else ""
+        if channel.startswith("/sign/") and isinstance(message.get("data"), dict):
+            yield channel, message["data"]
+
+
+async def run_pipeline(server: ReplayServer, timeout: Optional[float]) -> Dict[str, Any]:
+    """用回放数据驱动完整的引擎流程，返回时间统计"""
+    from engine import SignEngine, Sink, QREvent
+    import ratelimit
+
+    os.environ.update(server.environ())
+    # 本地回放服务器不需要限流，否则尽快回放会被轮询限速拖慢
+    ratelimit.limiter.enabled = False
+    arrivals: List[float] = []
+    start = time.monotonic()
+
+    class TimingSink(Sink):
+        def handle(self, event):
+            if isinstance(event, QREvent):
+                arrivals.append(time.monotonic() - start)
+
+    engine = SignEngine("replay", poll_interval=0.05 if server.speed <= 0 else 1.0,
+                        sign_timeout=timeout)
+    engine.add_sink(TimingSink())
+    await engine.run()
+    gaps = [b - a for a, b in zip(arrivals, arrivals[1:])]
+    return {
+        "qr_events": len(arrivals),
+        "first_qr_s": round(arrivals[0], 3) if arrivals else None,
+        "mean_gap_s": round(sum(gaps) / len(gaps), 3) if gaps else None,
+        "total_s": round(time.monotonic() - start, 3),
+    }
+
+
+async def _main(args: argparse.Namespace) -> None:
+    server = ReplayServer(args.path, speed=args.speed, host=args.host,
+                          ws_port=args.ws_port, http_port=args.http_port)
+    await server.start()
+    try:
+        if args.run:
+            print(json.dumps(await run_pipeline(server, args.timeout), ensure_ascii=False))
+            return
+        for key, value in server.environ().items():
+            print(f"{key}={value}")
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="回放录制的上游流量")
+    parser.add_argument("path", help="WEICLASS_RECORD录制的文件")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度，1为原速，0为尽快")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ws-port", type=int, default=0)
+    parser.add_argument("--http-port", type=int, default=0)
+    parser.add_argument("--run", action="store_true", help="在本进程中用回放数据跑完整流程并输出耗时")
+    parser.add_argument("--timeout", type=float, default=60.0, help="--run时签到最长等待时间")
+    logging.basicConfig(level=logging.INFO,
+                        format='%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s')
+    try:
+        asyncio.run(_main(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
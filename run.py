@@ -2,37 +2,44 @@ import asyncio
 import threading
 import wx
 import time
-import os
 import signal
 import sys
 import logging
-from typing import Optional, List, Dict, Any
-from getdata import getData
+from typing import Optional, List, Dict, Tuple
 from gui import QRDisplayApp
-from getSocket import TeacherMateWebSocketClient
-from ad import creatClientId
+from engine import SignEngine, Sink, EngineEvent, QREvent, ErrorEvent, DEFAULT_ACCOUNT
+from deadline import Deadline, DeadlineExceeded, DELIVERY
+from shutdown import ShutdownCoordinator
 import settings
+import loops
+import logsetup
+import memdiag
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s'
-)
+logsetup.setup_logging()
 logger = logging.getLogger(__name__)
 
+WX_PUMP_INTERVAL = 0.005  # 单线程模式下分发wx事件的间隔（秒）
 
-class QRManager:
-    """二维码管理器 - 修复对象销毁问题"""
 
-    def __init__(self):
+class QRManager(Sink):
+    """二维码管理器 - 作为引擎的GUI输出端；多账号时每个账号一个窗口"""
+
+    def __init__(self, engine: Optional[SignEngine] = None, accounts: Optional[List[str]] = None):
         self.app: Optional[wx.App] = None
-        self.frame: Optional[QRDisplayApp] = None
+        self.accounts = list(accounts) if accounts else [DEFAULT_ACCOUNT]
+        self.frames: Dict[str, QRDisplayApp] = {}
+        self.frame: Optional[QRDisplayApp] = None  # 第一个账号的窗口，错误对话框依附于它
         self.wx_thread: Optional[threading.Thread] = None
-        self.asyncio_tasks: List[asyncio.Task] = []
-        self.websocket_clients: List[TeacherMateWebSocketClient] = []  # 存储WebSocket客户端
+        self.engine = engine
         self.is_shutting_down = False
         self.wx_ready = threading.Event()
-        self.shutdown_event = asyncio.Event()
         self._shutdown_called = False  # 防止重复关闭
+        # 各窗口等待GUI线程应用的最新二维码及其剩余有效期
+        self._pending: Dict[str, Tuple[str, Optional[Deadline]]] = {}
+        self._pending_lock = threading.Lock()
+        # 单线程模式：wx和asyncio在同一个线程中，由pump_wx分发wx事件
+        self.inline = False
+        self._wx_exited = False
 
     def start_wx_app(self) -> None:
         """在单独线程中启动wxPython应用"""
@@ -45,10 +52,7 @@ class QRManager:
 
                 # 确保在这个线程中创建wx.App
                 self.app = wx.App(False)
-
-                self.frame = QRDisplayApp()
-                # 传递同步关闭方法，而不是异步方法
-                self.frame.set_exit_callback(self.request_shutdown)
+                self._create_frames()
 
                 # 标记wx应用已就绪
                 self.wx_ready.set()
@@ -77,6 +81,41 @@ class QRManager:
             logger.error("wxPython应用启动超时")
             raise RuntimeError("wxPython应用启动超时")
 
+    def start_wx_inline(self) -> None:
+        """单线程模式：在当前线程（事件循环线程）创建wx应用，事件由pump_wx分发"""
+        if hasattr(wx, 'DisableAsserts'):
+            wx.DisableAsserts()
+        self.inline = True
+        self.app = wx.App(False)
+        self._create_frames()
+        self.wx_ready.set()
+        logger.info("wxPython应用启动完成（单线程模式）")
+
+    def _create_frames(self) -> None:
+        """每个账号创建一个窗口（单账号时与原来一样只有一个），关闭任意一个窗口退出应用"""
+        multi = len(self.accounts) > 1
+        for index, account in enumerate(self.accounts):
+            frame = QRDisplayApp(title=f"二维码展示器 - {account}" if multi else "二维码展示器")
+            if index:
+                # 层叠摆放，避免窗口完全重叠
+                frame.Move(frame.GetPosition() + wx.Point(30 * index, 30 * index))
+            # 传递同步关闭方法，而不是异步方法
+            frame.set_exit_callback(self.request_shutdown)
+            self.frames[account] = frame
+        self.frame = self.frames[self.accounts[0]]
+
+    async def pump_wx(self, interval: float = WX_PUMP_INTERVAL) -> None:
+        """在asyncio循环中分发wx事件，替代app.MainLoop()"""
+        event_loop = wx.GUIEventLoop()
+        with wx.EventLoopActivator(event_loop):
+            while not self._wx_exited:
+                while event_loop.Pending():
+                    event_loop.Dispatch()
+                self.app.ProcessPendingEvents()
+                event_loop.ProcessIdle()
+                await asyncio.sleep(interval)
+        logger.info("wx事件分发结束")
+
     def request_shutdown(self):
         """同步方法：请求关闭应用（从GUI线程调用）"""
         if self._shutdown_called:
@@ -85,32 +124,52 @@ class QRManager:
         self._shutdown_called = True
         logger.info("收到GUI关闭请求")
 
-        # 设置关闭事件，让主循环知道需要关闭
-        self.shutdown_event.set()
-
-    def register_asyncio_task(self, task: asyncio.Task) -> None:
-        """注册asyncio任务用于统一管理"""
-        if not self.is_shutting_down:
-            self.asyncio_tasks.append(task)
-
-    def register_websocket_client(self, client: TeacherMateWebSocketClient) -> None:
-        """注册WebSocket客户端用于统一管理"""
-        if not self.is_shutting_down:
-            self.websocket_clients.append(client)
-
-    def update_qr_code(self, qr_url: str) -> None:
-        """线程安全地更新二维码显示"""
+        # 通知引擎停止，引擎结束后主流程会关闭GUI
+        if self.engine:
+            self.engine.request_shutdown()
+
+    def handle(self, event: EngineEvent) -> None:
+        """引擎事件输出端 - 把事件转换成GUI操作"""
+        if isinstance(event, QREvent):
+            # 同一门课的多个账号共用一个连接，二维码发给所有有这个签到的账号窗口
+            accounts = self.engine.accounts_for(event.sign_id) if self.engine else []
+            accounts = [account for account in accounts if account in self.frames] or self.accounts[:1]
+            for account in accounts:
+                self.update_qr_code(event.url, event.deadline, account)
+        elif isinstance(event, ErrorEvent):
+            self.show_error_message(event.title, event.message)
+
+    def update_qr_code(self, qr_url: str, deadline: Optional[Deadline] = None,
+                       account: Optional[str] = None) -> None:
+        """线程安全地更新某个账号窗口的二维码；GUI线程来不及在有效期内应用的码直接丢弃"""
         if self.is_shutting_down or not self.wx_ready.is_set():
             return
+        account = account or self.accounts[0]
+
+        # 合并尚未应用的更新：GUI线程只应用最新的码，被取代的码不再渲染
+        with self._pending_lock:
+            already_scheduled = account in self._pending
+            self._pending[account] = (qr_url, deadline)
+        if already_scheduled:
+            return
 
         def update_in_main_thread():
+            with self._pending_lock:
+                url, deadline = self._pending.pop(account, (None, None))
+            frame = self.frames.get(account)
+            if deadline is not None:
+                try:
+                    deadline.check(DELIVERY)
+                except DeadlineExceeded as e:
+                    logger.info(f"二维码到达GUI时已过期，跳过: {e}")
+                    return
             # 检查frame是否仍然有效
-            if (self.frame and
-                    hasattr(self.frame, 'set_qr_url') and
+            if (url and frame and
+                    hasattr(frame, 'set_qr_url') and
                     not self.is_shutting_down and
-                    not self.frame.is_closing):
+                    not frame.is_closing):
                 try:
-                    self.frame.set_qr_url(qr_url)
+                    frame.set_qr_url(url)
                 except Exception as e:
                     logger.error(f"更新二维码失败: {e}")
 
@@ -151,11 +210,48 @@ class QRManager:
                 else:
                     logger.error(f"显示错误对话框失败: {e}")
 
-        if wx.IsMainThread():
+        def show_modeless():
+            # 单线程模式下模态对话框会阻塞事件循环，改用非模态对话框
+            if not self.frame or self.frame.is_closing:
+                logger.warning(f"无法显示错误对话框，GUI已关闭: {title} - {message}")
+                return
+            dlg = wx.GenericMessageDialog(self.frame, message, title, wx.OK | wx.ICON_ERROR)
+            dlg.Bind(wx.EVT_BUTTON, lambda event: dlg.Destroy())
+            dlg.Show()
+
+        if self.inline:
+            show_modeless()
+        elif wx.IsMainThread():
             show_dialog()
         else:
             wx.CallAfter(show_dialog)
 
+    async def _close_wx_app(self) -> None:
+        """关闭wx应用并等待wx线程退出"""
+        def close_wx_app():
+            try:
+                for frame in self.frames.values():
+                    if not frame.is_closing:
+                        frame.Close(True)
+                if self.app:
+                    self.app.ExitMainLoop()
+            except Exception as e:
+                logger.error(f"关闭wx应用时出错: {e}")
+
+        if self.inline:
+            close_wx_app()
+            # 再分发几轮，让窗口销毁事件处理完，然后结束pump_wx
+            await asyncio.sleep(WX_PUMP_INTERVAL * 4)
+            self._wx_exited = True
+            return
+        if wx.IsMainThread():
+            close_wx_app()
+            return
+        wx.CallAfter(close_wx_app)
+        if self.wx_thread and self.wx_thread.is_alive():
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.wx_thread.join, 3.0)
+
     async def shutdown(self) -> None:
         """异步方法：优雅关闭所有组件"""
         if self.is_shutting_down:
@@ -164,213 +260,74 @@ class QRManager:
         self.is_shutting_down = True
         logger.info("开始关闭应用...")
 
-        # 首先关闭所有WebSocket连接
-        if self.websocket_clients:
-            logger.info(f"正在关闭 {len(self.websocket_clients)} 个WebSocket连接...")
-            shutdown_tasks = []
-            for client in self.websocket_clients:
-                if not client.is_shutting_down:
-                    shutdown_tasks.append(client.graceful_shutdown())
-
-            if shutdown_tasks:
-                try:
-                    await asyncio.wait_for(
-                        asyncio.gather(*shutdown_tasks, return_exceptions=True),
-                        timeout=5.0
-                    )
-                    logger.info("所有WebSocket连接已关闭")
-                except asyncio.TimeoutError:
-                    logger.warning("部分WebSocket连接关闭超时")
-                except Exception as e:
-                    logger.error(f"关闭WebSocket连接时出错: {e}")
-
-        # 然后取消所有异步任务
-        for task in self.asyncio_tasks:
-            if not task.done():
-                task.cancel()
-
-        # 等待任务结束（带超时）
-        if self.asyncio_tasks:
-            try:
-                await asyncio.wait_for(
-                    asyncio.gather(*self.asyncio_tasks, return_exceptions=True),
-                    timeout=5.0
-                )
-            except asyncio.TimeoutError:
-                logger.warning("部分任务关闭超时，强制结束")
-            except Exception as e:
-                logger.error(f"关闭任务时出错: {e}")
-
-        # 最后关闭wx应用
+        # 引擎和wx并行关闭，共用一个截止时间
+        coordinator = ShutdownCoordinator(deadline=3.0)
+        if self.engine:
+            # 引擎内部截止时间略短，留出时间给外层汇总
+            coordinator.add("engine", lambda: self.engine.shutdown(deadline=coordinator.deadline - 0.2))
         if self.app and self.wx_ready.is_set():
-            def close_wx_app():
-                try:
-                    if self.frame and not self.frame.is_closing:
-                        self.frame.Close(True)
-                    if self.app:
-                        self.app.ExitMainLoop()
-                except Exception as e:
-                    logger.error(f"关闭wx应用时出错: {e}")
-
-            try:
-                if wx.IsMainThread():
-                    close_wx_app()
-                else:
-                    wx.CallAfter(close_wx_app)
-            except Exception as e:
-                logger.error(f"调用wx关闭时出错: {e}")
+            coordinator.add("wx", self._close_wx_app)
+        await coordinator.run()
 
         logger.info("应用关闭完成")
 
-    async def wait_for_shutdown(self) -> None:
-        """等待关闭信号"""
-        await self.shutdown_event.wait()
-
-
-async def run_websocket_client(sign_id: int, client_id: str, qr_manager: QRManager) -> None:
-    """运行单个WebSocket客户端"""
-    try:
-        # 等待关闭信号或wx应用就绪
-        while not qr_manager.wx_ready.is_set() and not qr_manager.is_shutting_down:
-            await asyncio.sleep(0.1)
-
-        if qr_manager.is_shutting_down:
-            return
-
-        logger.info(f"启动WebSocket客户端 for sign_id: {sign_id}")
-
-        client = TeacherMateWebSocketClient(
-            sign_id=sign_id,
-            qr_callback=qr_manager.update_qr_code
-        )
-        client.client_id = client_id
-
-        # 注册WebSocket客户端到管理器
-        qr_manager.register_websocket_client(client)
-
-        await client.start()
-
-    except asyncio.CancelledError:
-        logger.info(f"WebSocket客户端任务被取消: {sign_id}")
-    except Exception as e:
-        logger.error(f"WebSocket客户端运行失败 {sign_id}: {e}")
-
-
-async def wait_for_data(openid: str, qr_manager: QRManager) -> Optional[List[Dict[str, Any]]]:
-    """等待获取有效数据"""
-    max_retries = 60  # 最多重试60次
-    retry_count = 0
-
-    while retry_count < max_retries and not qr_manager.is_shutting_down:
-        try:
-            data = getData(openid)
-            logger.debug(f"获取到数据: {data}")
-
-            # 处理返回字典的情况（错误信息）
-            if isinstance(data, dict):
-                error_message = data.get("message", "未知错误")
-                logger.error(f"获取数据时发生错误: {error_message}")
-
-                # 显示错误消息给用户
-                qr_manager.show_error_message("获取数据失败", error_message)
-
-                # 返回特殊标记表示错误
-                return {"error": True, "message": error_message}
-
-            # 处理返回列表的情况（正常数据）
-            if data and isinstance(data, list) and len(data) > 0:
-                result = []
-                for item in data:
-                    if all(key in item for key in ["courseId", "signId", "isQR", "isGPS"]):
-                        result.append({
-                            "courseId": item["courseId"],
-                            "signId": item["signId"],
-                            "isQR": item["isQR"],
-                            "isGPS": item["isGPS"]
-                        })
-                if result:
-                    return result
-
-        except Exception as e:
-            logger.error(f"获取数据失败: {e}")
-
-        retry_count += 1
-        await asyncio.sleep(1)
-
-    logger.warning("获取数据超时或应用正在关闭")
-    return None
-
 
-async def main_async() -> None:
+async def main_async(serve_web: bool = False, watch: bool = False, single_thread: bool = False) -> None:
     """主异步函数"""
     logger.info("应用启动中...")
 
+    # config.ini的[accounts]中可以配置多个账号，全部在这一个进程中运行
+    accounts = settings.get_accounts()
+
     # 创建全局管理器
-    qr_manager = QRManager()
+    qr_manager = QRManager(accounts=list(accounts))
+    pump: Optional[asyncio.Task] = None
 
     try:
-        # 启动wx应用
-        qr_manager.start_wx_app()
+        # 启动wx应用：默认wx在单独线程；single_thread时与asyncio共用当前线程，不再跨线程投递更新
+        if single_thread:
+            qr_manager.start_wx_inline()
+            pump = asyncio.create_task(qr_manager.pump_wx())
+        else:
+            qr_manager.start_wx_app()
 
-        # 获取环境变量
-        openid = os.getenv("OPENID")
+        openid = next(iter(accounts.values()), None)
         if not openid:
-            error_msg = "未找到OPENID环境变量，请检查环境配置"
+            error_msg = "未找到openid，请检查config.ini"
             logger.error(error_msg)
             qr_manager.show_error_message("配置错误", error_msg)
             await asyncio.sleep(2)  # 给用户时间阅读错误消息
             await qr_manager.shutdown()
             return
 
-        # 等待数据
-        data = await wait_for_data(openid, qr_manager)
-
-        # 检查是否返回了错误信息
-        if isinstance(data, dict) and data.get("error"):
-            # 错误信息已经在 wait_for_data 中显示给用户
-            logger.info("由于错误信息，准备关闭应用")
-            await asyncio.sleep(2)  # 给用户时间阅读错误消息
-            await qr_manager.shutdown()
-            return
-
-        if not data or qr_manager.is_shutting_down:
-            logger.info("未找到有效数据或应用正在关闭")
-            await qr_manager.shutdown()
-            return
-
-        # 为每个签到创建WebSocket客户端任务
-        tasks = []
-        for item in data:
-            if item.get("isQR"):  # 只处理二维码签到
-                try:
-                    client_id = creatClientId(item["signId"], courseId=item["courseId"])
-                    task = asyncio.create_task(
-                        run_websocket_client(
-                            sign_id=item["signId"],
-                            client_id=client_id,
-                            qr_manager=qr_manager
-                        )
-                    )
-                    qr_manager.register_asyncio_task(task)
-                    tasks.append(task)
-                    logger.info(f"创建签到任务: sign_id={item['signId']}")
-                except Exception as e:
-                    logger.error(f"创建签到任务失败 {item}: {e}")
-
-        if not tasks:
-            logger.info("没有需要处理的二维码签到任务")
+        # 监视模式一直运行：新出现的签到自动订阅，结束的签到自动关闭
+        # 多个账号共用一个引擎：同一个事件循环、连接池，同一个签到只建立一个Faye连接
+        engine = SignEngine(openid, max_polls=None if watch else 60, watch=watch, accounts=accounts)
+        qr_manager.engine = engine
+        engine.add_sink(qr_manager)
+
+        # openid过期后修改config.ini即可生效，无需重启（新增的账号没有窗口，需要重启）
+        def on_config_change(new_config, changed_keys):
+            if any(key == "user.openid" or key.startswith("accounts.") for key in changed_keys):
+                engine.set_accounts(settings.get_accounts())
+
+        settings.watcher.on_change(on_config_change)
+        settings.watcher.start()
+
+        if serve_web:
+            # 网页与GUI共用同一个引擎和上游连接
+            import web
+            web.attach_engine(engine)
+            threading.Thread(target=web.serve, name="FlaskThread", daemon=True).start()
+
+        async def shutdown_all():
+            if engine.last_error and not qr_manager._shutdown_called:
+                await asyncio.sleep(2)  # 给用户时间阅读错误消息
             await qr_manager.shutdown()
-            return
 
-        # 等待所有任务完成或关闭信号
-        done, pending = await asyncio.wait(
-            [asyncio.create_task(qr_manager.wait_for_shutdown())] + tasks,
-            return_when=asyncio.FIRST_COMPLETED
-        )
-
-        # 如果是因为关闭信号触发的，执行关闭流程
-        if qr_manager.shutdown_event.is_set():
-            await qr_manager.shutdown()
+        # 引擎结束时直接走管理器的关闭流程：引擎和wx并行关闭，共用一个截止时间，
+        # 而不是先等引擎自己关闭完再给wx另一个截止时间
+        await engine.run(shutdown=shutdown_all)
 
     except KeyboardInterrupt:
         logger.info("用户中断操作")
@@ -381,6 +338,69 @@ async def main_async() -> None:
         qr_manager.show_error_message("运行错误", error_msg)
         await asyncio.sleep(2)  # 给用户时间阅读错误消息
         await qr_manager.shutdown()
+    finally:
+        if pump is not None:
+            qr_manager._wx_exited = True
+            await asyncio.gather(pump, return_exceptions=True)
+
+
+async def _measure_repaint(single_thread: bool, rotations: int = 50, interval: float = 0.2) -> None:
+    """测量从websocket帧发出到二维码重绘完成的延迟（本地Faye替身）"""
+    from fayestub import FayeStub
+    from getSocket import TeacherMateWebSocketClient
+
+    stub = FayeStub(poll_timeout=5.0)
+    await stub.start()
+    manager = QRManager()
+    pump = None
+    if single_thread:
+        manager.start_wx_inline()
+        pump = asyncio.create_task(manager.pump_wx())
+    else:
+        manager.start_wx_app()
+
+    latencies = []
+    apply = manager.frame._apply_qr_bitmap
+
+    def timed_apply(bitmap, url=None):
+        apply(bitmap, url)
+        if url == manager.frame.current_url:
+            manager.frame.qr_bitmap.Update()  # 立即重绘，计入延迟
+            latencies.append(time.perf_counter() - float(url.rsplit("=", 1)[1]))
+
+    manager.frame._apply_qr_bitmap = timed_apply
+    client = TeacherMateWebSocketClient(4444, qr_callback=manager.update_qr_code,
+                                        ws_url=stub.ws_url, http_url=stub.http_url)
+    client.client_id = "bench-gui"
+    task = asyncio.create_task(client.start())
+    await asyncio.sleep(0.5)
+    for _ in range(rotations):
+        await stub.publish(4444, {"type": 1, "qrUrl": f"https://stub.invalid/qr?t={time.perf_counter()}"})
+        await asyncio.sleep(interval)
+
+    await client.graceful_shutdown()
+    await asyncio.gather(task, return_exceptions=True)
+    await manager.shutdown()
+    if pump is not None:
+        manager._wx_exited = True
+        await asyncio.gather(pump, return_exceptions=True)
+    await stub.stop()
+
+    latencies.sort()
+    mode = "single-thread" if single_thread else "threaded"
+    if latencies:
+        print(f"{mode:>13}: 重绘 {len(latencies)}/{rotations}, "
+              f"p50={latencies[len(latencies) // 2] * 1000:.2f}ms "
+              f"p99={latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000:.2f}ms")
+    else:
+        print(f"{mode:>13}: 未收到任何重绘")
+
+
+def _benchmark() -> None:
+    """两种模式各在独立进程中测量（每个进程只能创建一次wx.App）"""
+    import subprocess
+    for mode in ("threaded", "single-thread"):
+        subprocess.run([sys.executable, __file__, "--bench-mode", mode], check=False)
 
 
 def signal_handler(signum, frame):
@@ -395,10 +415,16 @@ def main() -> None:
     signal.signal(signal.SIGINT, signal_handler)
     if hasattr(signal, 'SIGTERM'):
         signal.signal(signal.SIGTERM, signal_handler)
+    # kill -USR1 <pid>（Windows上Ctrl+Break）把内存诊断写入memdiag-<pid>-<时间>.json
+    memdiag.enable_from_env()
+    dump_signal = memdiag.install_signal_handler()
+    if dump_signal is not None:
+        logger.info(f"发送信号 {dump_signal} 可转储内存诊断")
 
     try:
         # 运行异步主函数
-        asyncio.run(main_async())
+        loops.run(main_async(serve_web="--web" in sys.argv[1:], watch="--watch" in sys.argv[1:],
+                             single_thread="--single-thread" in sys.argv[1:]))
     except KeyboardInterrupt:
         logger.info("应用被用户中断")
     except Exception as e:
@@ -408,4 +434,10 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if "--bench" in sys.argv[1:]:
+        _benchmark()
+    elif "--bench-mode" in sys.argv[1:]:
+        logging.getLogger().setLevel(logging.WARNING)
+        loops.run(_measure_repaint(sys.argv[sys.argv.index("--bench-mode") + 1] == "single-thread"))
+    else:
+        main()
\ No newline at end of file
@@ -1,5 +1,159 @@
 import os
+import time
+import threading
+import logging
 import configparser
+import recorder
+from typing import Optional, Callable, List, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = 'config.ini'
+
+
+def primary_openid(parser: configparser.ConfigParser) -> str:
+    """[user]中的openid；只配置了[accounts]时取第一个账号的openid；都没有时抛出configparser.Error"""
+    if parser.has_option("user", "openid") or not parser.has_section("accounts"):
+        return parser.get("user", "openid")
+    for _, openid in parser.items("accounts"):
+        if openid:
+            return openid
+    raise configparser.NoOptionError("openid", "accounts")
+
+
 config = configparser.ConfigParser()
-config.read('config.ini')
-os.environ["OPENID"] =config.get("user","openid")
\ No newline at end of file
+config.read(CONFIG_PATH)
+os.environ["OPENID"] = primary_openid(config)
+# 可选的上游地址覆盖（例如指向回放服务器）
+for _key, _env in (("active_signs_url", "ACTIVE_SIGNS_URL"), ("faye_url", "FAYE_URL"),
+                   ("faye_ws_url", "FAYE_WS_URL"), ("record", "WEICLASS_RECORD"),
+                   ("loop", "WEICLASS_LOOP"), ("qr_encoder", "WEICLASS_QR_ENCODER"),
+                   ("memdiag", "WEICLASS_MEMDIAG")):
+    if config.has_option("server", _key) and _env not in os.environ:
+        os.environ[_env] = config.get("server", _key)
+if os.getenv("WEICLASS_RECORD"):
+    recorder.enable(os.environ["WEICLASS_RECORD"])
+
+
+class ConfigWatcher:
+    """配置热加载 - 轮询config.ini的mtime，变化时原子地替换配置并通知订阅者"""
+
+    def __init__(self, path: str = CONFIG_PATH, interval: float = 1.0):
+        self.path = path
+        self.interval = interval
+        self.config = config
+        self.version = 1
+        self.loaded_at = time.time()
+        self.last_error: Optional[str] = None
+        self.changed_keys: List[str] = []
+        self._mtime = self._stat()
+        self._callbacks: List[Callable[[configparser.ConfigParser, List[str]], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _stat(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def on_change(self, callback: Callable[[configparser.ConfigParser, List[str]], None]) -> None:
+        """注册配置变化回调，回调在监视线程中执行"""
+        self._callbacks.append(callback)
+
+    def get(self, section: str, option: str, fallback: Optional[str] = None) -> Optional[str]:
+        return self.config.get(section, option, fallback=fallback)
+
+    def start(self) -> None:
+        """启动后台监视线程"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name="ConfigWatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def check(self) -> bool:
+        """检查文件是否变化，变化则重新加载；返回是否应用了新配置"""
+        mtime = self._stat()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        return self.reload()
+
+    def reload(self) -> bool:
+        """重新读取配置，解析失败时保留旧配置"""
+        new_config = configparser.ConfigParser()
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                new_config.read_file(f)
+            openid = primary_openid(new_config)
+        except (OSError, configparser.Error) as e:
+            self.last_error = str(e)
+            logger.error(f"配置重新加载失败，继续使用旧配置: {e}")
+            return False
+
+        with self._lock:
+            changed = _diff(self.config, new_config)
+            if not changed:
+                return False
+            self.config = new_config
+            self.version += 1
+            self.loaded_at = time.time()
+            self.changed_keys = changed
+            self.last_error = None
+            os.environ["OPENID"] = openid
+
+        logger.info(f"配置已重新加载 (版本 {self.version})，变化项: {', '.join(changed)}")
+        for callback in list(self._callbacks):
+            try:
+                callback(new_config, changed)
+            except Exception as e:
+                logger.error(f"配置变化回调执行失败: {e}")
+        return True
+
+    def status(self) -> Dict[str, Any]:
+        """用于/health的配置状态，不包含openid本身"""
+        return {
+            "version": self.version,
+            "loaded_at": self.loaded_at,
+            "changed_keys": self.changed_keys,
+            "last_error": self.last_error,
+        }
+
+
+def _diff(old: configparser.ConfigParser, new: configparser.ConfigParser) -> List[str]:
+    """返回变化的 section.option 列表"""
+    def flatten(parser):
+        return {f"{s}.{k}": v for s in parser.sections() for k, v in parser.items(s)}
+    a, b = flatten(old), flatten(new)
+    return sorted(k for k in a.keys() | b.keys() if a.get(k) != b.get(k))
+
+
+watcher = ConfigWatcher()
+
+
+def get_openid() -> Optional[str]:
+    """当前生效的openid（只配置了[accounts]时为第一个账号的openid）"""
+    try:
+        return primary_openid(watcher.config)
+    except configparser.Error:
+        return None
+
+
+def get_accounts() -> Dict[str, str]:
+    """要监视的账号（名称 -> openid）：[accounts]中每行一个 名称 = openid；
+    没有配置[accounts]时只有[user]中的openid一个账号"""
+    current = watcher.config
+    if current.has_section("accounts"):
+        accounts = {name: openid for name, openid in current.items("accounts") if openid}
+        if accounts:
+            return accounts
+    return {"default": get_openid()}
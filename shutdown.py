@@ -0,0 +1,69 @@
+import asyncio
+import time
+import logging
+from typing import Optional, Callable, Awaitable, Dict, Any, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ShutdownCoordinator:
+    """关闭协调器 - 所有组件并行关闭，共用一个总截止时间，超时的组件被强制中止"""
+
+    def __init__(self, deadline: float = 3.0):
+        self.deadline = deadline
+        self.components: List[Tuple[str, Callable[[], Awaitable[Any]], Optional[Callable[[], None]]]] = []
+        self.report: Dict[str, Dict[str, Any]] = {}
+
+    def add(self, name: str, close: Callable[[], Awaitable[Any]],
+            abort: Optional[Callable[[], None]] = None) -> None:
+        """注册组件：close为优雅关闭协程工厂，abort为超时后的强制中止（同步）"""
+        self.components.append((name, close, abort))
+
+    async def run(self) -> Dict[str, Dict[str, Any]]:
+        """并行关闭所有组件，返回每个组件的耗时和结果"""
+        if not self.components:
+            return self.report
+
+        start = time.monotonic()
+        finished: Dict[str, float] = {}
+
+        async def timed(name: str, close: Callable[[], Awaitable[Any]]) -> None:
+            try:
+                await close()
+            finally:
+                finished[name] = time.monotonic() - start
+
+        tasks = {asyncio.create_task(timed(name, close)): (name, abort)
+                 for name, close, abort in self.components}
+        done, pending = await asyncio.wait(tasks, timeout=self.deadline)
+
+        for task in done:
+            name, _ = tasks[task]
+            error = task.exception() if not task.cancelled() else None
+            self.report[name] = {
+                "seconds": round(finished.get(name, time.monotonic() - start), 4),
+                "status": "error" if error else "ok",
+            }
+            if error:
+                logger.error(f"组件关闭出错 {name}: {error}")
+
+        for task in pending:
+            name, abort = tasks[task]
+            if abort:
+                try:
+                    abort()
+                except Exception as e:
+                    logger.debug(f"强制中止组件失败 {name}: {e}")
+            task.cancel()
+            self.report[name] = {"seconds": round(time.monotonic() - start, 4), "status": "aborted"}
+
+        if pending:
+            # 给被取消的任务一次调度机会完成清理，但不再等待
+            await asyncio.wait(pending, timeout=0.1)
+            logger.warning(f"{len(pending)} 个组件超过关闭截止时间 {self.deadline}s，已强制中止")
+
+        total = time.monotonic() - start
+        summary = ", ".join(f"{name}={info['seconds']:.3f}s({info['status']})"
+                            for name, info in self.report.items())
+        logger.info(f"关闭完成，总耗时 {total:.3f}s: {summary}")
+        return self.report
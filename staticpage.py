@@ -0,0 +1,153 @@
+import gzip
+import hashlib
+import time
+import logging
+from typing import Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 预压缩的编码，按优先顺序；brotli为可选依赖
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ("br", "gzip", "identity") if brotli is not None else ("gzip", "identity")
+# 每次都向服务器验证（码没变时304），但允许浏览器保存页面
+CACHE_CONTROL = "no-cache"
+
+
+class StaticPage:
+    """启动时渲染一次的页面 - 常驻内存，预先生成各压缩版本
+
+    每个编码版本有自己的强ETag，重新加载时用If-None-Match验证，页面不变就返回304。
+    """
+
+    def __init__(self, html: str, mimetype: str = "text/html"):
+        self.mimetype = mimetype
+        body = html.encode("utf-8")
+        self.variants: Dict[str, bytes] = {"identity": body}
+        self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(body, quality=11)
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etags = {encoding: digest if encoding == "identity" else f"{digest}-{encoding}"
+                      for encoding in self.variants}
+        self.rendered_at = time.time()
+
+    def select(self, accept_encoding) -> Tuple[str, bytes]:
+        """按Accept-Encoding（werkzeug的MIMEAccept/Accept对象）选择编码版本"""
+        encoding = accept_encoding.best_match(ENCODINGS, default="identity") or "identity"
+        return encoding, self.variants[encoding]
+
+    def headers(self, encoding: str) -> Dict[str, str]:
+        headers = {
+            "ETag": f'"{self.etags[encoding]}"',
+            "Cache-Control": CACHE_CONTROL,
+            "Vary": "Accept-Encoding",
+        }
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return headers
+
+    def stats(self) -> Dict[str, int]:
+        return {encoding: len(body) for encoding, body in self.variants.items()}
+
+
+# 页面中建立状态连接的脚本结束位置（第一个</script>），加载测量用
+STATUS_MARKER = b"</script>"
+
+
+def _first_status_offset(html: bytes, early: bool) -> int:
+    """浏览器能发出第一个状态请求前必须收到的字节数
+
+    early为True时状态连接在<head>的内联脚本中建立；否则要等DOMContentLoaded，即整个文档。
+    """
+    if early:
+        return html.index(STATUS_MARKER) + len(STATUS_MARKER)
+    return len(html)
+
+
+def _load(host: str, port: int, path: str, encoding: Optional[str],
+          etag: Optional[str]) -> Tuple[float, int, Dict[str, str], bytes]:
+    """发一次页面请求，返回(服务器处理加首字节耗时, 传输字节数, 响应头, 解压后的正文)"""
+    import http.client
+
+    conn = http.client.HTTPConnection(host, port)
+    headers = {"Accept-Encoding": encoding or "identity"}
+    if etag:
+        headers["If-None-Match"] = etag
+    start = time.perf_counter()
+    conn.request("GET", path, headers=headers)
+    response = conn.getresponse()
+    first_byte = time.perf_counter() - start
+    raw = response.read()
+    conn.close()
+    response_headers = {key.lower(): value for key, value in response.getheaders()}
+    body = raw
+    if response_headers.get("content-encoding") == "gzip":
+        body = gzip.decompress(raw)
+    elif response_headers.get("content-encoding") == "br":
+        body = brotli.decompress(raw)
+    return first_byte, len(raw), response_headers, body
+
+
+def _benchmark(rtt: float = 0.15, bandwidth: float = 50_000, loads: int = 20) -> None:
+    """无界面页面加载测量：从打开页面到发出第一个状态请求的时间
+
+    页面来自本地真实运行的web.app，服务器耗时为实测；网络部分按微信内置浏览器在移动网络下的
+    情况建模：每次请求一个往返rtt秒，带宽bandwidth字节/秒。旧方式每次渲染模板、不压缩、不缓存，
+    状态连接等整个文档解析完（DOMContentLoaded）才建立；新方式预渲染、预压缩、ETag验证，
+    状态连接在<head>的内联脚本中建立。
+    """
+    import statistics
+    import threading
+    from flask import render_template
+    from werkzeug.serving import make_server
+    import web
+
+    logging.getLogger().setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+
+    @web.app.route("/_bench/rerender")
+    def _rerender():
+        # 原来的处理方式：每次请求渲染模板，after_request加上no-store
+        return render_template("index.html")
+
+    page = web.index_page
+    html = page.variants["identity"]
+    server = make_server("127.0.0.1", 0, web.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    def run(label: str, path: str, encoding: Optional[str], revalidate: bool, early: bool) -> None:
+        server_times, totals, sizes = [], [], []
+        etag = None
+        for _ in range(loads):
+            first_byte, size, headers, body = _load(host, port, path, encoding, etag if revalidate else None)
+            etag = headers.get("etag")
+            if revalidate and size == 0 and etag:
+                # 304：浏览器用缓存的页面，只等一个往返
+                needed = 0
+                body = html
+            else:
+                needed = _first_status_offset(body, early)
+                # 压缩时需要的传输量按比例折算
+                needed = int(needed * size / len(body)) if body else 0
+            server_times.append(first_byte)
+            sizes.append(size)
+            totals.append(first_byte + rtt + needed / bandwidth)
+        print(f"{label:24s} 传输 {statistics.median(sizes):6.0f}B  服务器 {statistics.median(server_times) * 1000:6.2f}ms  "
+              f"首个状态请求 {statistics.median(totals) * 1000:7.1f}ms")
+
+    print(f"模型：往返 {rtt * 1000:.0f}ms，带宽 {bandwidth / 1000:.0f}KB/s，取{loads}次中位数；"
+          f"预压缩: {page.stats()}")
+    run("旧: 每次渲染 首次", "/_bench/rerender", None, False, early=False)
+    run("旧: 每次渲染 重新加载", "/_bench/rerender", None, True, early=False)
+    run("新: 预渲染gzip 首次", "/", "gzip", False, early=True)
+    run("新: 预渲染gzip 重新加载", "/", "gzip", True, early=True)
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    _benchmark()
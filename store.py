@@ -0,0 +1,67 @@
+import json
+import os
+import threading
+import time
+import logging
+from typing import Optional, Dict, Any
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.05  # 读取端检查快照变化的间隔（秒）
+
+
+class SnapshotStore:
+    """跨进程共享的状态快照 - 引擎进程原子地写入JSON文件，HTTP worker按mtime缓存读取
+
+    写入先写临时文件再os.replace，读取端永远不会读到写了一半的内容。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.version = 0
+        self._cache: Optional[Dict[str, Any]] = None
+        self._cache_key: Optional[tuple] = None
+        self._lock = threading.Lock()
+
+    def write(self, snapshot: Dict[str, Any]) -> int:
+        """写入新快照（引擎进程调用），返回版本号"""
+        with self._lock:
+            self.version += 1
+            data = dict(snapshot, version=self.version, written_at=time.time(),
+                        token=f"{os.getpid()}-{self.version}")
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp_path, self.path)
+            return self.version
+
+    def read(self) -> Optional[Dict[str, Any]]:
+        """读取最新快照；文件未变化时直接返回缓存，不重复解析"""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        with self._lock:
+            if key == self._cache_key:
+                return self._cache
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取状态快照失败: {e}")
+            return self._cache
+        with self._lock:
+            self._cache, self._cache_key = data, key
+        return data
+
+    def wait_for_change(self, token: Optional[str], timeout: float) -> Optional[Dict[str, Any]]:
+        """阻塞等待快照变化（token不同，引擎进程重启也能识别），超时返回当前快照"""
+        deadline = time.monotonic() + timeout
+        while True:
+            data = self.read()
+            if data is not None and data.get("token") != token:
+                return data
+            if time.monotonic() >= deadline:
+                return data
+            time.sleep(POLL_INTERVAL)
@@ -1,38 +1,64 @@
-from flask import Flask, render_template, jsonify
-import ad
-from getdata import getData
+from flask import Flask, render_template, jsonify, Response, request
 import asyncio
-from getSocket import TeacherMateWebSocketClient
+import json
+import os
+import sys
 import time
 import threading
-import os
 import logging
-import requests
-from typing import Optional, List, Dict, Any
-import queue
+from email.utils import formatdate
+from typing import Optional, Dict, Any, Set
+from httpclient import client as http_client
+from engine import SignEngine
+from events import (Sink, EngineEvent, QREvent, ResolvedEvent, ErrorEvent, StatusEvent,
+                    SignClosedEvent, EngineStoppedEvent)
+from store import SnapshotStore
+from deadline import Deadline, DeadlineExceeded, REDIRECT, DELIVERY, stats as deadline_stats
 import settings
+import qrimage
+import staticpage
+import memdiag
+import ratelimit
+import loops
+import logsetup
 # 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - [%(threadName)s] - %(message)s'
-)
+logsetup.setup_logging()
 logger = logging.getLogger(__name__)
+# WEICLASS_MEMDIAG=1时尽早开始跟踪内存分配，/debug/memory才可用
+memdiag.enable_from_env()
+
+# 触发网页状态推送的事件类型
+PUSH_EVENTS = (ResolvedEvent, ErrorEvent, StatusEvent, EngineStoppedEvent)
+# 触发立即刷新共享快照的事件：新二维码也要马上让worker的/qr_code.<fmt>看到
+SNAPSHOT_EVENTS = PUSH_EVENTS + (QREvent,)
 
+# 部署模式：standalone 单进程；engine 只运行引擎并写共享快照；worker 无状态HTTP进程，只读快照
+MODE = os.getenv("WEICLASS_MODE", "standalone")
+SNAPSHOT_PATH = os.getenv("WEICLASS_SNAPSHOT", "weiclass_state.json")
+SNAPSHOT_INTERVAL = 1.0  # 引擎进程定期刷新快照的间隔
+SNAPSHOT_MAX_AGE = 5.0  # 快照超过这个时间没更新视为引擎进程无响应
+# 持续监视模式：引擎一直运行，新出现的签到自动订阅（--watch 或 WEICLASS_WATCH=1）
+WATCH = os.getenv("WEICLASS_WATCH") == "1"
 
-class Pipeline:
-    """改进的管道类 - 更健壮和性能优越"""
 
-    def __init__(self, openid: str):
+class Pipeline(Sink):
+    """网页输出端 - 订阅引擎事件并解析二维码的重定向地址"""
+
+    def __init__(self, openid: str, engine: Optional[SignEngine] = None):
         self.openid = openid
         self.success = 0
         self.result: Optional[str] = None
+        # 当前结果对应的签到和原始二维码URL，用于判断是否已过期
+        self.result_sign_id: Optional[int] = None
+        self.result_source: Optional[str] = None
         self.message: Optional[str] = None
         self.is_running = False
-        self.websocket_clients: List[TeacherMateWebSocketClient] = []
-        self.asyncio_tasks: List[asyncio.Task] = []
+        self.owns_engine = engine is None
+        # 不再用固定的总超时：签到关闭、空闲超时或从active_signs消失时各自释放
+        self.engine = engine or SignEngine(openid, watch=WATCH)
+        self.engine.add_sink(self)
         self.loop: Optional[asyncio.AbstractEventLoop] = None
-        self.shutdown_event = threading.Event()
-        self.result_queue = queue.Queue()  # 线程安全的结果队列
+        self._pending: Set[asyncio.Task] = set()
 
     def start(self):
         """启动管道"""
@@ -41,309 +67,475 @@ class Pipeline:
             return
 
         self.is_running = True
+        if not self.owns_engine:
+            # 共享引擎由宿主进程驱动，这里只作为输出端
+            logger.info("管道已挂载到共享引擎")
+            return
+
         thread = threading.Thread(target=self._run_async, daemon=True, name="PipelineThread")
         thread.start()
         logger.info("管道启动完成")
 
     def _run_async(self):
-        """在新线程中运行异步主函数"""
+        """在新线程中运行引擎"""
         try:
             # 创建新的事件循环
-            self.loop = asyncio.new_event_loop()
+            self.loop = loops.new_event_loop()
             asyncio.set_event_loop(self.loop)
-            self.loop.run_until_complete(self._main_async())
+            self.loop.run_until_complete(self.engine.run())
         except Exception as e:
             logger.error(f"异步运行失败: {e}")
+            self.message = f"处理失败: {str(e)}"
         finally:
             self.is_running = False
             if self.loop and not self.loop.is_closed():
                 self.loop.close()
 
-    async def _main_async(self):
-        """异步主函数"""
-        try:
-            data = await self.wait_data()
+    def handle(self, event: EngineEvent) -> None:
+        """引擎事件输出端 - 在引擎事件循环线程中执行"""
+        if isinstance(event, QREvent):
+            task = asyncio.ensure_future(self._process_callback_result(event.url, event.sign_id, event.deadline))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+        elif isinstance(event, ErrorEvent):
+            self.message = event.message
+            logger.warning(f"数据获取失败: {self.message}")
+        elif isinstance(event, StatusEvent):
+            if not self.success:
+                self.message = event.message
+        elif isinstance(event, SignClosedEvent):
+            if event.sign_id == self.result_sign_id:
+                # 监视模式下进程继续运行，已结束签到的码不再返回
+                self.success = 0
+                self.result = None
+                self.message = "签到已结束，等待新的签到"
+        elif isinstance(event, EngineStoppedEvent):
+            self.is_running = False
 
-            if isinstance(data, list) and data:
-                await self.process_signatures(data)
-            else:
-                self.message = data if isinstance(data, str) else "未找到有效数据"
-                logger.warning(f"数据获取失败: {self.message}")
+    async def _process_callback_result(self, url: str, sign_id: int, deadline: Optional[Deadline] = None):
+        """解析二维码重定向地址 - 在事件循环线程中执行
 
-        except Exception as e:
-            logger.error(f"主函数运行失败: {e}")
-            self.message = f"处理失败: {str(e)}"
-        finally:
-            await self.shutdown()
-
-    async def wait_data(self) -> Any:
-        """等待获取有效数据"""
-        retry_count = 0
-
-        while  not self.shutdown_event.is_set():
-            try:
-                data = getData(self.openid)
-                logger.debug(f"获取到数据: {data}")
-
-                if data and isinstance(data, list) and len(data) > 0:
-                    result = []
-                    for item in data:
-                        if all(key in item for key in ["courseId", "signId", "isQR", "isGPS"]):
-                            result.append({
-                                "courseId": item["courseId"],
-                                "signId": item["signId"],
-                                "isQR": item["isQR"],
-                                "isGPS": item["isGPS"]
-                            })
-                    if result:
-                        return result
-                elif isinstance(data, dict) and "message" in data:
-                    return data["message"]
-
-            except Exception as e:
-                logger.error(f"获取数据失败: {e}")
-
-            retry_count += 1
-            await asyncio.sleep(1)
-
-        return "获取数据超时或应用正在关闭"
-
-    async def process_signatures(self, data: List[Dict[str, Any]]):
-        """处理所有签到任务"""
-        tasks = []
-        for item in data:
-            if item.get("isQR"):  # 只处理二维码签到
-                try:
-                    task = asyncio.create_task(
-                        self.run_websocket_client(
-                            sign_id=item["signId"],
-                            course_id=item["courseId"]
-                        )
-                    )
-                    self.asyncio_tasks.append(task)
-                    tasks.append(task)
-                    logger.info(f"创建签到任务: sign_id={item['signId']}")
-                except Exception as e:
-                    logger.error(f"创建签到任务失败 {item}: {e}")
-
-        if not tasks:
-            logger.info("没有需要处理的二维码签到任务")
+        deadline为这个码的剩余有效期：解析请求以它为超时，超出后放弃，不再推送过期的结果。
+        """
+        freshness = self.engine.freshness
+        if freshness.is_stale(sign_id, url):
+            logger.info("二维码在解析前已被新码取代，跳过")
             return
-
-        # 等待第一个任务完成或所有任务完成
-        try:
-            done, pending = await asyncio.wait(
-                tasks,
-                return_when=asyncio.FIRST_COMPLETED,
-                timeout=300  # 5分钟超时
-            )
-
-            # 如果有任务完成，检查结果
-            for task in done:
-                if not task.cancelled() and task.exception() is None:
-                    logger.info("至少有一个任务成功完成")
-                    # 取消其他任务
-                    for pending_task in pending:
-                        pending_task.cancel()
-                    break
-
-        except asyncio.TimeoutError:
-            logger.warning("处理签到任务超时")
-            self.message = "处理超时，请重试"
-
-    async def run_websocket_client(self, sign_id: int, course_id: int):
-        """运行单个WebSocket客户端"""
-        try:
-            client_id = ad.creatClientId(sign_id, courseId=course_id)
-            client = TeacherMateWebSocketClient(
-                sign_id=sign_id,
-                qr_callback=self.callback
-            )
-            client.client_id = client_id
-            client.webT = True  # 获取到二维码后自动关闭
-
-            self.websocket_clients.append(client)
-            await client.start()
-
-        except asyncio.CancelledError:
-            logger.info(f"WebSocket客户端任务被取消: {sign_id}")
-        except Exception as e:
-            logger.error(f"WebSocket客户端运行失败 {sign_id}: {e}")
-
-    def callback(self, url: str):
-        """二维码URL回调函数 - 线程安全版本"""
-        try:
-            logger.info(f"获取到二维码URL: {url[:50]}...")
-
-            # 使用队列确保线程安全
-            self.result_queue.put(url)
-
-            # 在主线程中处理结果
-            if self.loop and not self.loop.is_closed():
-                asyncio.run_coroutine_threadsafe(
-                    self._process_callback_result(url),
-                    self.loop
-                )
-
-        except Exception as e:
-            logger.error(f"回调函数处理失败: {e}")
-
-    async def _process_callback_result(self, url: str):
-        """处理回调结果 - 在事件循环线程中执行"""
+        deadline = deadline or Deadline(freshness.budget(sign_id), f"qr:{sign_id}")
         try:
             # 获取重定向URL
             headers = {
                 "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/132.0.0.0 Safari/537.36 NetType/WIFI MicroMessenger/7.0.20.1781(0x6700143B) WindowsWechat(0x63090a13) UnifiedPCWindowsWechat(0xf2541411) XWEB/16965 Flue"
             }
 
-            # 使用异步HTTP请求（如果需要，可以使用aiohttp替代）
-            def sync_request():
-                resp = requests.get(url, headers=headers, timeout=10)
-                return resp.url
+            # 共享连接池的异步接口，不阻塞事件循环
+            started = time.perf_counter()
+            resp = await http_client.aget(url, headers=headers, rate_class=ratelimit.QR,
+                                          deadline=deadline, stage=REDIRECT)
+            final_url = resp.url
 
-            # 在线程池中执行同步请求
-            loop = asyncio.get_event_loop()
-            final_url = await loop.run_in_executor(None, sync_request)
+            if not freshness.is_current(sign_id, url):
+                # 解析期间又来了新码，丢弃旧结果
+                logger.info("二维码解析完成时已被新码取代，丢弃")
+                return
+            deadline.check(DELIVERY)
 
             self.result = str(final_url)
+            self.result_sign_id = sign_id
+            self.result_source = url
             self.success = 1
             self.message = "成功获取二维码"
-            logger.info(f"最终重定向URL: {self.result}")
+            logger.info("最终重定向URL: %s", self.result,
+                        extra={"sign_id": sign_id, "stage": "resolve",
+                               "latency_ms": round((time.perf_counter() - started) * 1000, 2)})
+            self.engine.publish(ResolvedEvent(sign_id, self.result))
 
+        except DeadlineExceeded as e:
+            logger.info(f"二维码已超出有效期，放弃解析结果: {e}")
         except Exception as e:
             logger.error(f"处理回调结果失败: {e}")
             self.message = f"处理二维码失败: {str(e)}"
 
-    async def shutdown(self):
-        """优雅关闭所有组件"""
+    def shutdown(self):
+        """请求关闭管道 - 可以从任意线程调用"""
         logger.info("开始关闭管道...")
-        self.shutdown_event.set()
-
-        # 关闭所有WebSocket连接
-        if self.websocket_clients:
-            logger.info(f"正在关闭 {len(self.websocket_clients)} 个WebSocket连接...")
-            shutdown_tasks = []
-            for client in self.websocket_clients:
-                if not client.is_shutting_down:
-                    shutdown_tasks.append(client.graceful_shutdown())
-
-            if shutdown_tasks:
-                try:
-                    await asyncio.wait_for(
-                        asyncio.gather(*shutdown_tasks, return_exceptions=True),
-                        timeout=5.0
-                    )
-                    logger.info("所有WebSocket连接已关闭")
-                except asyncio.TimeoutError:
-                    logger.warning("部分WebSocket连接关闭超时")
-                except Exception as e:
-                    logger.error(f"关闭WebSocket连接时出错: {e}")
-
-        # 取消所有异步任务
-        for task in self.asyncio_tasks:
-            if not task.done():
-                task.cancel()
-
-        # 等待任务结束（带超时）
-        if self.asyncio_tasks:
-            try:
-                await asyncio.wait_for(
-                    asyncio.gather(*self.asyncio_tasks, return_exceptions=True),
-                    timeout=5.0
-                )
-            except asyncio.TimeoutError:
-                logger.warning("部分任务关闭超时，强制结束")
-            except Exception as e:
-                logger.error(f"关闭任务时出错: {e}")
-
-        logger.info("管道关闭完成")
+        self.engine.request_shutdown()
 
     def get_status(self) -> Dict[str, Any]:
-        """获取当前状态"""
-        if not self.result_queue.empty():
-            try:
-                url = self.result_queue.get_nowait()
-                # 处理队列中的URL
-                if self.loop and not self.loop.is_closed():
-                    asyncio.run_coroutine_threadsafe(
-                        self._process_callback_result(url),
-                        self.loop
-                    )
-            except queue.Empty:
-                pass
-
-        return {
-            "success": self.success,
-            "message": self.message,
-            "qr_url": self.result if self.success == 1 else None
+        """获取当前状态，已过期或被取代的二维码不再返回"""
+        freshness = self.engine.freshness
+        success, message = self.success, self.message
+        if success == 1 and freshness.is_stale(self.result_sign_id, self.result_source):
+            success, message = 0, "二维码已过期，等待新码"
+
+        status = {
+            "success": success,
+            "message": message,
+            "qr_url": self.result if success == 1 else None
         }
+        if self.result_sign_id is not None:
+            status.update(freshness.status(self.result_sign_id))
+        return status
+
+    def current_qr(self) -> Optional[Dict[str, Any]]:
+        """最新的未过期原始二维码（与GUI显示的内容相同），不需要等重定向解析完成"""
+        latest = self.engine.freshness.latest()
+        if latest is None:
+            return None
+        sign_id, url = latest
+        return dict(self.engine.freshness.status(sign_id), sign_id=sign_id, url=url)
 
 
 # 全局变量
-openid = os.getenv("OPENID")
 app = Flask(__name__)
 pipeline: Optional[Pipeline] = None
+snapshot_store: Optional[SnapshotStore] = SnapshotStore(SNAPSHOT_PATH) if MODE != "standalone" else None
+# 首页是不变的外壳（状态都来自/events和/qr_code），启动时渲染一次并预压缩
+with app.app_context():
+    index_page = staticpage.StaticPage(render_template('index.html'))
 
 
 def create_pipeline():
-    """创建并启动管道"""
+    """创建并启动管道；替换已结束的旧管道时关闭旧引擎上的全部订阅"""
     global pipeline
+    openid = settings.get_openid()
     if not openid:
         logger.error("未找到OPENID环境变量")
         return
 
+    previous = pipeline
     pipeline = Pipeline(openid)
+    if snapshot_store is not None:
+        pipeline.engine.add_sink(SnapshotSink())
     pipeline.start()
     logger.info("管道创建并启动成功")
+    if previous is not None:
+        # 仍挂在旧广播中心上的/events连接不会再收到新码：关闭它们，浏览器的EventSource会自动重连到新管道
+        closed = previous.engine.hub.close_all()
+        if closed:
+            logger.info(f"已关闭旧管道的 {closed} 个推送连接")
+
+
+def attach_engine(engine: SignEngine):
+    """把网页挂载到已有的引擎上（例如与GUI共用一个进程）"""
+    global pipeline
+    pipeline = Pipeline(engine.openid, engine=engine)
+    pipeline.start()
+    logger.info("管道已挂载到共享引擎")
+
+
+def on_config_change(new_config, changed_keys):
+    """配置热加载回调 - openid变化时直接应用到运行中的轮询，无需重启进程
+
+    网页只服务主账号（[user] openid，只配置了[accounts]时为其中第一个账号），
+    其他账号的变化不影响网页。
+    """
+    if not any(key == "user.openid" or key.startswith("accounts.") for key in changed_keys):
+        return
+    openid = settings.get_openid()
+    if pipeline is not None and openid == pipeline.engine.openid:
+        return
+    if pipeline is not None and pipeline.is_running:
+        pipeline.engine.set_openid(openid)
+    elif pipeline is None or pipeline.owns_engine:
+        # 上一轮已结束（例如openid过期），用新openid重新启动管道
+        logger.info("openid已变化，重新启动管道")
+        create_pipeline()
+
+
+def serve():
+    """启动Flask服务"""
+    app.run(
+        host='0.0.0.0',
+        port=5000,
+        debug=False,  # 生产环境设置为False
+        threaded=True
+    )
+
 
 @app.after_request
 def add_header(response):
     """
-    添加头部信息禁止缓存
+    动态端点（状态、推送、健康信息等）禁止缓存；自己设置了缓存策略的视图除外（首页外壳、二维码图片）
     """
-    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-    response.headers['Pragma'] = 'no-cache'
-    response.headers['Expires'] = '0'
+    if 'Cache-Control' not in response.headers:
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
     response.headers['X-Content-Type-Options'] = 'nosniff'
     return response
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    """预渲染的首页：按Accept-Encoding返回预压缩版本，重新加载时ETag未变返回304"""
+    encoding, body = index_page.select(request.accept_encodings)
+    headers = index_page.headers(encoding)
+    if request.if_none_match.contains(index_page.etags[encoding]):
+        return Response(status=304, headers=headers)
+    return Response(body, mimetype=index_page.mimetype, headers=headers)
+
+
+def current_status() -> Dict[str, Any]:
+    """当前二维码状态：worker模式读共享快照，其他模式直接读管道"""
+    if MODE == "worker":
+        snapshot = snapshot_store.read()
+        if snapshot is None:
+            return {"success": 0, "message": "引擎进程未启动"}
+        if time.time() - snapshot["written_at"] > SNAPSHOT_MAX_AGE:
+            return {"success": 0, "message": "引擎进程无响应"}
+        return snapshot["status"]
+
+    if pipeline is None:
+        return {"success": 0, "message": "管道未初始化"}
+    return pipeline.get_status()
+
+
+def build_health() -> Dict[str, Any]:
+    """健康信息（引擎进程内）"""
+    return {
+        "status": "healthy",
+        "pipeline_running": pipeline.is_running,
+        "success": pipeline.success,
+        "hub": pipeline.engine.hub.stats(),
+        "links": pipeline.engine.link_stats(),
+        "resources": pipeline.engine.resources(),
+        "config": settings.watcher.status(),
+        "last_shutdown": pipeline.engine.shutdown_report,
+        "http": http_client.stats(),
+        "ratelimit": ratelimit.limiter.status(),
+        "deadlines": deadline_stats.status(),
+        "qr_images": qrimage.cache.stats(),
+        "index_page": index_page.stats(),
+        "snapshot": {"requests": snapshot_writer.requests, "writes": snapshot_writer.writes}
+    }
+
+
+def write_snapshot() -> None:
+    """引擎进程把状态、健康信息和最近事件写入共享快照"""
+    if snapshot_store is None or pipeline is None:
+        return
+    try:
+        snapshot_store.write({
+            "status": pipeline.get_status(),
+            "qr": pipeline.current_qr(),
+            "health": build_health(),
+            "history": pipeline.engine.history.page(limit=100),
+        })
+    except Exception as e:
+        logger.error(f"写入状态快照失败: {e}")
+
+
+class SnapshotWriter:
+    """快照写入线程 - 构建快照（健康信息会列举/proc/self/fd）和写文件都不在引擎的事件循环线程中做
+
+    引擎线程只设置标记；写入线程醒来后按当时的最新状态写一次，期间的多次请求合并为一次。
+    没有请求时每SNAPSHOT_INTERVAL秒刷新一次，使过期判断和健康信息在worker中保持最新。
+    """
+
+    def __init__(self, interval: float = SNAPSHOT_INTERVAL):
+        self.interval = interval
+        self.requests = 0
+        self.writes = 0
+        self._dirty = threading.Event()
+
+    def request(self) -> None:
+        """请求尽快写入（可以从任意线程调用，不阻塞）"""
+        self.requests += 1
+        self._dirty.set()
+
+    def run(self) -> None:
+        while True:
+            self._dirty.wait(self.interval)
+            # 先清除再写：写入期间到达的请求会再触发一次写入
+            self._dirty.clear()
+            write_snapshot()
+            self.writes += 1
+
+
+snapshot_writer = SnapshotWriter()
+
+
+class SnapshotSink(Sink):
+    """引擎进程中的输出端 - 状态变化或新二维码时请求立即刷新共享快照"""
+
+    def handle(self, event: EngineEvent) -> None:
+        if isinstance(event, SNAPSHOT_EVENTS):
+            snapshot_writer.request()
+
+
+def snapshot_loop():
+    """在当前线程中运行快照写入（引擎进程的主线程）"""
+    snapshot_writer.run()
 
 
 @app.route('/qr_code')
 def qr_code():
+    return jsonify(current_status())
+
+
+def current_qr() -> Optional[Dict[str, Any]]:
+    """当前原始二维码：worker模式读共享快照，其他模式直接读管道"""
+    if MODE == "worker":
+        snapshot = snapshot_store.read()
+        if snapshot is None or time.time() - snapshot["written_at"] > SNAPSHOT_MAX_AGE:
+            return None
+        return snapshot.get("qr")
     if pipeline is None:
-        return jsonify({
-            "success": 0,
-            "message": "管道未初始化"
-        })
+        return None
+    return pipeline.current_qr()
+
+
+@app.route('/qr_code.<fmt>')
+def qr_image(fmt: str):
+    """当前二维码图片（png/svg，?size=<像素>），每次轮换只渲染一次，其余请求走缓存"""
+    if fmt not in qrimage.FORMATS:
+        return jsonify({"success": 0, "message": f"不支持的格式: {fmt}"}), 404
+    qr = current_qr()
+    if qr is None:
+        return jsonify({"success": 0, "message": "暂无有效二维码"}), 404
+
+    size = qrimage.normalize_size(request.args.get("size", type=int))
+    etag = qrimage.etag_for(qr["url"], size, fmt)
+    # 缓存到预计的轮换时间，之后必须重新验证；码没变时返回304
+    expiry = qr.get("expected_expiry") or time.time()
+    headers = {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"private, max-age={max(0, int(expiry - time.time()))}, must-revalidate",
+        "Expires": formatdate(expiry, usegmt=True),
+    }
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers=headers)
+
+    try:
+        image = qrimage.cache.get(qr["url"], size, fmt)
+    except Exception as e:
+        logger.error(f"渲染二维码图片失败: {e}")
+        return jsonify({"success": 0, "message": "渲染二维码图片失败"}), 500
+    return Response(image.body, mimetype=image.mimetype, headers=headers)
+
+
+@app.route('/events')
+def events():
+    """Server-Sent Events推送 - 每个标签页一个有界订阅，共用同一个上游连接"""
+    if MODE == "worker":
+        return Response(_snapshot_stream(), mimetype='text/event-stream')
+    if pipeline is None:
+        return jsonify({"success": 0, "message": "管道未初始化"}), 503
+
+    # 管道被替换时旧广播中心关闭订阅，流随之结束，浏览器重连后订阅新管道
+    current = pipeline
+    sub = current.engine.hub.subscribe(replay_latest=False)
+
+    def stream():
+        try:
+            yield f"data: {json.dumps(current.get_status())}\n\n"
+            while not sub.closed:
+                event = sub.get(timeout=15)
+                if event is None:
+                    if not sub.closed:
+                        yield ": keepalive\n\n"
+                elif isinstance(event, PUSH_EVENTS):
+                    yield f"data: {json.dumps(current.get_status())}\n\n"
+        finally:
+            sub.close()
+
+    return Response(stream(), mimetype='text/event-stream')
+
+
+def _snapshot_stream():
+    """worker模式的推送：等待共享快照变化"""
+    token = None
+    while True:
+        snapshot = snapshot_store.wait_for_change(token, timeout=15)
+        if snapshot is None or snapshot.get("token") == token:
+            yield ": keepalive\n\n"
+            continue
+        token = snapshot.get("token")
+        yield f"data: {json.dumps(current_status())}\n\n"
+
+
+@app.route('/history')
+def history():
+    """分页查看最近事件：?before=<seq>&limit=<n>&kind=<qr|crowded|closed|reconnect|...>"""
+    if MODE == "worker":
+        # worker只有快照中的最近100条
+        snapshot = snapshot_store.read()
+        return jsonify(snapshot["history"] if snapshot else {"records": []})
+    if pipeline is None:
+        return jsonify({"success": 0, "message": "管道未初始化"}), 503
 
-    status = pipeline.get_status()
-    return jsonify(status)
+    return jsonify(pipeline.engine.history.page(
+        before=request.args.get("before", type=int),
+        limit=request.args.get("limit", default=50, type=int),
+        kind=request.args.get("kind")
+    ))
+
+
+@app.route('/debug/memory')
+def debug_memory():
+    """内存诊断（WEICLASS_MEMDIAG=1时可用）：与基线相比增长最多的分配位置和项目对象数量
+
+    ?top=<n>&key=<lineno|filename|traceback>&reset=1（以本次为新基线）；每个进程（worker）各自报告。
+    """
+    if not memdiag.diagnostics.tracing:
+        return jsonify({"success": 0, "message": "未开启内存诊断（WEICLASS_MEMDIAG=1）"}), 404
+    key = request.args.get("key", default="lineno")
+    if key not in memdiag.KEYS:
+        return jsonify({"success": 0, "message": f"key必须是{', '.join(memdiag.KEYS)}之一"}), 400
+    return jsonify(memdiag.diagnostics.report(
+        top=request.args.get("top", default=memdiag.TOP, type=int),
+        key=key,
+        reset=request.args.get("reset") == "1"
+    ))
 
 
 @app.route('/health')
 def health():
     """健康检查端点"""
+    if MODE == "worker":
+        snapshot = snapshot_store.read()
+        if snapshot is None:
+            return jsonify({"status": "error", "message": "引擎进程未启动"}), 500
+        age = time.time() - snapshot["written_at"]
+        if age > SNAPSHOT_MAX_AGE:
+            return jsonify({"status": "error", "message": "引擎进程无响应", "snapshot_age": age}), 500
+        # 图片缓存在每个worker进程内，报告本进程的统计
+        return jsonify(dict(snapshot["health"], snapshot_age=round(age, 3), worker_pid=os.getpid(),
+                            qr_images=qrimage.cache.stats()))
+
     if pipeline is None:
         return jsonify({"status": "error", "message": "管道未初始化"}), 500
 
-    return jsonify({
-        "status": "healthy",
-        "pipeline_running": pipeline.is_running,
-        "success": pipeline.success
-    })
+    return jsonify(build_health())
+
+
+def set_mode(mode: str) -> None:
+    """切换部署模式（命令行参数优先于WEICLASS_MODE）"""
+    global MODE, snapshot_store
+    MODE = mode
+    snapshot_store = SnapshotStore(SNAPSHOT_PATH) if mode != "standalone" else None
 
 
 if __name__ == '__main__':
+    if "--watch" in sys.argv[1:]:
+        WATCH = True
+    if "--engine" in sys.argv[1:]:
+        set_mode("engine")
+    elif "--worker" in sys.argv[1:]:
+        set_mode("worker")
+
+    if MODE == "worker":
+        # 多进程部署时用 WEICLASS_MODE=worker gunicorn -w 4 web:app
+        serve()
+        sys.exit(0)
+
     # 创建并启动管道
     create_pipeline()
-
-    app.run(
-        host='0.0.0.0',
-        port=5000,
-        debug=False,  # 生产环境设置为False
-        threaded=True
-    )
\ No newline at end of file
+    settings.watcher.on_change(on_config_change)
+    settings.watcher.start()
+
+    if MODE == "engine":
+        # 引擎进程只负责上游连接和写快照，不提供HTTP
+        snapshot_loop()
+    else:
+        serve()
\ No newline at end of file